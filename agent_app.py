@@ -1,52 +1,79 @@
 # --- SEÇÃO 1: IMPORTS E CONFIGURAÇÕES INICIAIS ---
-import os
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_ollama.chat_models import ChatOllama
-from langchain_community.vectorstores import FAISS
-from langchain_ollama import OllamaEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
-from sentence_transformers.cross_encoder import CrossEncoder
-from langchain_experimental.tools import PythonAstREPLTool
+from recuperacao import recuperar_multiplas
+from expansao import ExpansorAdaptativo
+from cache_semantico import CacheSemantico
+from contexto import MontadorDeContexto, chunks_de_origem, formatar_contexto
+from indice_metadados import separar_filtro
+from roteador import RoteadorRapido
+from calculadora import calcular, calcular_varias, avaliar_expressao, formatar_numero
+from telemetria import obter_rastreador
+from recursos import recursos
 
 # --- SEÇÃO 2: CARREGAMENTO DOS COMPONENTES ---
 print("Inicializando o sistema...")
 FAISS_INDEX_PATH = "faiss_index"
-embeddings = OllamaEmbeddings(model="nomic-embed-text")
-vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+# Os embeddings (usados pelo roteador e pelo cache semântico) e o LLM são carregados já.
+# O índice vetorial (mapeado em memória, somente leitura), o BM25 e o Cross-Encoder
+# vêm do registro compartilhado (recursos.py) só quando a primeira pergunta chega à
+# ferramenta RAG; perguntas de conta ou gerais nunca os carregam.
+embeddings = recursos.obter("embeddings")
 
-llm = ChatOllama(model="llama3:instruct")
+# llama3:instruct com o cache do LLM em disco: roteamento, expansão e tradução de
+# contas repetidos não voltam ao Ollama
+llm = recursos.obter("llm_chat")
+print("Componentes carregados.")
 
-cross_encoder = CrossEncoder('BAAI/bge-reranker-base')
-print("Componentes de RAG e Re-ranker carregados.")
+# Cache semântico das respostas da ferramenta RAG; a cada busca, confere se o manifesto
+# da ingestão mudou e descarta as respostas de chunks que saíram do índice
+cache_respostas = CacheSemantico(embeddings, escopo="agent_app", limiar_similaridade=0.93,
+                                 pasta_indice=FAISS_INDEX_PATH)
+
+# Une chunks vizinhos, descarta frases repetidas e limita o contexto a ~1500 tokens
+montador_contexto = MontadorDeContexto(orcamento_tokens=1500)
 
 
 # --- SEÇÃO 3: DEFINIÇÃO DAS FERRAMENTAS REFINADAS ---
 
-def run_rag_pipeline(pergunta: str) -> str:
-    print(f"\n--- Roteado para: Ferramenta RAG ---")
-    
-    prompt_expansao_template = ChatPromptTemplate.from_messages([
-        ("system", "Gere 3 versões alternativas para a pergunta do usuário para melhorar a busca. Responda apenas com as 3 perguntas, uma por linha."),
-        ("human", "{pergunta_original}")
-    ])
-    chain_expansao = prompt_expansao_template | llm
+prompt_expansao_template = ChatPromptTemplate.from_messages([
+    ("system", "Gere 3 versões alternativas para a pergunta do usuário para melhorar a busca. Responda apenas com as 3 perguntas, uma por linha."),
+    ("human", "{pergunta_original}")
+])
+chain_expansao = prompt_expansao_template | llm
+
+
+def expandir_pergunta(pergunta: str) -> list[str]:
     res = chain_expansao.invoke({"pergunta_original": pergunta})
-    perguntas_para_busca = [pergunta] + res.content.strip().split('\n')
-    
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 20})
-    retrieved_docs_list = retriever.batch(perguntas_para_busca)
-    
-    documentos_unicos = {doc.page_content: doc for result_list in retrieved_docs_list for doc in result_list}
-    candidatos = list(documentos_unicos.values())
-    
-    pares_para_reranking = [[pergunta, doc.page_content] for doc in candidatos]
-    scores = cross_encoder.predict(pares_para_reranking)
-    
-    docs_com_scores = sorted(zip(candidatos, scores), key=lambda x: x[1], reverse=True)
+    return [pergunta] + res.content.strip().split('\n')
+
+# A expansão só espera o LLM quando a busca com a pergunta original não é conclusiva
+expansor = ExpansorAdaptativo(expandir_pergunta, modo="adaptativo", limiar_confianca=0.8)
+
+
+def run_rag_pipeline(pergunta: str, ao_receber_token=None, filtro: dict | None = None) -> str:
+    print(f"\n--- Roteado para: Ferramenta RAG{f' (filtro {filtro})' if filtro else ''} ---")
+
+    # Perguntas com filtro não usam o cache: a mesma pergunta tem outra resposta em outro recorte
+    em_cache = None if filtro else cache_respostas.buscar(pergunta)
+    if em_cache is not None:
+        print(f"--- Resposta do cache semântico ({len(em_cache[1])} chunks de origem) ---")
+        if ao_receber_token:
+            ao_receber_token(em_cache[0])
+        return em_cache[0]
     
-    # MUDANÇA: Aumentando para 6 documentos para mais contexto
-    documentos_finais = [doc for doc, score in docs_com_scores[:6]]
+    # Uma única busca para todas as perguntas, com dedup por id do chunk e fusão RRF
+    def recuperar(perguntas):
+        return recuperar_multiplas(recursos.obter("vectorstore"), embeddings, perguntas, k=20,
+                                   indice_lexico=recursos.obter("indice_lexico"), max_candidatos=30,
+                                   indice_metadados=recursos.obter("indice_metadados") if filtro else None,
+                                   filtro=filtro)
+
+    # Até 8 documentos re-rankeados; o montador decide quanto deles cabe no orçamento
+    def reranquear(candidatos):
+        return recursos.obter("reranker").reranquear(pergunta, candidatos, top_n=8, fator_corte=0.3)
+
+    _, docs_com_scores = expansor.recuperar(pergunta, recuperar, reranquear)
+    documentos_finais = montador_contexto.montar(docs_com_scores)
     
     # MUDANÇA: Prompt RAG final ainda mais direto
     prompt_rag = ChatPromptTemplate.from_template(
@@ -62,47 +89,71 @@ def run_rag_pipeline(pergunta: str) -> str:
     )
     chain_rag = prompt_rag | llm
     
-    resposta_final = chain_rag.invoke({"input": pergunta, "context": documentos_finais})
-    return resposta_final.content
+    # A resposta é gerada em fluxo: cada token vai para `ao_receber_token` assim que chega
+    partes = []
+    # Só o texto dos trechos vai ao prompt, sem a representação dos objetos Document
+    with rastreador.etapa("geração", trechos=len(documentos_finais)) as etapa:
+        for parte in chain_rag.stream({"input": pergunta, "context": formatar_contexto(documentos_finais)}):
+            partes.append(parte.content)
+            if ao_receber_token:
+                ao_receber_token(parte.content)
+        etapa["tokens"] = len(partes)
+    resposta_final = "".join(partes)
+    if not filtro:
+        cache_respostas.guardar(pergunta, resposta_final, chunks_de_origem(documentos_finais))
+    return resposta_final
 
 # Nossa ferramenta de calculadora
-calculator = PythonAstREPLTool()
+# Prompt para traduzir a linguagem natural para uma expressão, usado só quando as
+# regras da calculadora não reconhecem a pergunta
+prompt_calculo_template = ChatPromptTemplate.from_template(
+    """Sua tarefa é traduzir a pergunta do usuário em uma única expressão aritmética em Python.
+    Responda apenas com a expressão. Não adicione explicações ou a palavra 'python'.
 
-# MUDANÇA: Função 'run_calculator' agora traduz para Python
-def run_calculator(pergunta: str) -> str:
-    print(f"\n--- Roteado para: Ferramenta Calculadora ---")
-    
-    # Prompt para traduzir a linguagem natural para código Python
-    prompt_calculo_template = ChatPromptTemplate.from_template(
-        """Sua tarefa é traduzir a pergunta do usuário em uma única linha de código Python para ser executada.
-        Responda apenas com o código. Não adicione explicações ou a palavra 'python'.
+    Exemplos:
+    Pergunta: quanto é 5 mais 3?
+    Resposta: 5 + 3
 
-        Exemplos:
-        Pergunta: quanto é 5 mais 3?
-        Resposta: 5 + 3
+    Pergunta: 15% de 5000
+    Resposta: 0.15 * 5000
 
-        Pergunta: 15% de 5000
-        Resposta: 0.15 * 5000
+    Pergunta: qual a raiz quadrada de 81?
+    Resposta: 81**0.5
 
-        Pergunta: qual a raiz quadrada de 81?
-        Resposta: 81**0.5
+    Pergunta: {input}
+    Resposta:
+    """
+)
+chain_calculo = prompt_calculo_template | llm
 
-        Pergunta: {input}
-        Resposta:
-        """
-    )
-    
-    # Chain para criar o código
-    chain_calculo = prompt_calculo_template | llm
-    
-    # Traduz a pergunta para código
-    codigo_python = chain_calculo.invoke({"input": pergunta}).content.strip()
-    
-    print(f"Código Python gerado: {codigo_python}")
-    
-    # Executa o código Python gerado
-    resultado = calculator.invoke(codigo_python)
-    return f"O resultado é: {resultado}"
+
+def run_calculator(pergunta: str) -> str:
+    print(f"\n--- Roteado para: Ferramenta Calculadora ---")
+
+    with rastreador.etapa("ferramenta: calculadora", caminho="regras") as etapa:
+        # Várias contas ("2+3; 15% de 80"): todas pelas regras, avaliadas em um só lote
+        calculos = calcular_varias(pergunta)
+        if calculos is not None:
+            etapa["contas"] = len(calculos)
+            return "Os resultados são:\n" + "\n".join(
+                f"{expressao} = {formatar_numero(resultado)}" for expressao, resultado in calculos)
+
+        # Caminho rápido: a pergunta vira expressão por regras, sem chamar o LLM
+        calculo = calcular(pergunta)
+        if calculo is not None:
+            expressao, resultado = calculo
+        else:
+            etapa["caminho"] = "llm"
+            expressao = chain_calculo.invoke({"input": pergunta}).content.strip().strip("`")
+            print(f"Expressão gerada pelo LLM: {expressao}")
+            # A expressão do LLM passa pelo mesmo avaliador restrito, nunca por um interpretador
+            try:
+                resultado = avaliar_expressao(expressao)
+            except ValueError as erro:
+                return f"Não consegui calcular: {erro}"
+
+    print(f"Expressão: {expressao}")
+    return f"O resultado é: {formatar_numero(resultado)}"
 
 
 # --- SEÇÃO 4: O ROTEADOR INTELIGENTE (sem alterações) ---
@@ -118,23 +169,54 @@ Categoria:
 """
 router_prompt = ChatPromptTemplate.from_template(router_prompt_template)
 router_chain = router_prompt | llm
+# Contas explícitas e perguntas parecidas com os exemplos rotulados são roteadas sem
+# chamar o LLM; o router_chain fica como fallback para os casos de baixa confiança
+roteador = RoteadorRapido(embeddings, lambda pergunta: router_chain.invoke({"input": pergunta}).content)
+
+# Rastros por pergunta e métricas por etapa (configurados pelas variáveis RAG_*, ver telemetria.py)
+rastreador = obter_rastreador()
 
 # --- SEÇÃO 5: LOOP DE INTERAÇÃO PRINCIPAL ---
+def imprimir_em_fluxo():
+    """Callback que imprime o cabeçalho no primeiro token e depois cada token recebido."""
+    primeiro = True
+
+    def ao_receber(token: str):
+        nonlocal primeiro
+        if primeiro:
+            print("\n\033[92mResposta Final:\033[0m")
+            primeiro = False
+        print(token, end="", flush=True)
+    return ao_receber
+
+
 if __name__ == "__main__":
     while True:
         pergunta_usuario = input("\nSua pergunta: ")
         if pergunta_usuario.lower() in ['sair', 'exit', 'quit']:
+            print(roteador.resumo())
             break
 
-        rota = router_chain.invoke({"input": pergunta_usuario}).content.strip().lower()
-        resposta_final = ""
-        if "pesquisa_documentos" in rota:
-            resposta_final = run_rag_pipeline(pergunta_usuario)
-        elif "calculadora" in rota:
-            resposta_final = run_calculator(pergunta_usuario)
-        else:
-            print(f"\n--- Roteado para: Resposta Geral ---")
-            resposta_final = llm.invoke(pergunta_usuario).content
-
-        print("\n\033[92mResposta Final:\033[0m")
-        print(resposta_final)
\ No newline at end of file
+        # Filtros antes da pergunta (`ano:2024 secao:Conselho Quem preside?`) só fazem
+        # sentido na busca nos documentos: a pergunta vai direto para a ferramenta RAG
+        filtro, pergunta_usuario = separar_filtro(pergunta_usuario)
+        with rastreador.rastro("agent_app") as rastro:
+            rota = "pesquisa_documentos" if filtro else roteador.classificar(pergunta_usuario)
+            rastro["rota"] = rota
+            exibir = imprimir_em_fluxo()
+            if "pesquisa_documentos" in rota:
+                if filtro and recursos.obter("indice_metadados") is None:
+                    print("Filtros indisponíveis: rode rag_app.py para criar faiss_index/metadados.sqlite.")
+                    continue
+                run_rag_pipeline(pergunta_usuario, ao_receber_token=exibir, filtro=filtro)
+            elif "calculadora" in rota:
+                exibir(run_calculator(pergunta_usuario))
+            else:
+                print(f"\n--- Roteado para: Resposta Geral ---")
+                with rastreador.etapa("geração") as etapa:
+                    partes = 0
+                    for parte in llm.stream(pergunta_usuario):
+                        exibir(parte.content)
+                        partes += 1
+                    etapa["tokens"] = partes
+        print()
\ No newline at end of file
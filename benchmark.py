@@ -0,0 +1,313 @@
+# --- BENCHMARK E AVALIAÇÃO DO PIPELINE RAG ---
+# Mede cada etapa do pipeline sem precisar do Ollama nem do modelo de re-ranking:
+# embeddings, cross-encoder e LLM são trocados por versões determinísticas (mesma
+# entrada, mesma saída), então duas execuções são comparáveis entre si.
+#
+# Etapas: carga (PDFs de docs/ e o índice salvo em faiss_index/), divisão em
+# chunks, embeddings (+ montagem dos índices vetorial e BM25), recuperação,
+# re-ranking, montagem do contexto e geração. Para cada uma: percentis de latência,
+# vazão e, com --memoria, o pico de memória alocada (tracemalloc).
+#
+# Qualidade: benchmark_perguntas.json traz perguntas rotuladas com as páginas que
+# as respondem; recall@k e MRR são calculados após a recuperação e após o re-ranking,
+# para mostrar que uma otimização não piorou os resultados.
+#
+#   python benchmark.py --repeticoes 5 --saida resultado.json
+import os
+import json
+import time
+import hashlib
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import lru_cache
+import numpy as np
+from pypdf import PdfReader
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from indice_vetorial import IndiceVetorial, carregar_indice
+from indice_lexico import IndiceLexico, tokenizar
+from recuperacao import recuperar_multiplas
+from reranker import ReRanker, CacheLRU
+from contexto import MontadorDeContexto, formatar_contexto
+from expansao import expandir_localmente
+
+PERGUNTAS_PADRAO = "benchmark_perguntas.json"
+
+
+@lru_cache(maxsize=100_000)
+def _hash_termo(termo: str) -> int:
+    return int.from_bytes(hashlib.blake2b(termo.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class EmbeddingsDeterministicas(Embeddings):
+    """Feature hashing dos termos (mesma tokenização do BM25): vetores estáveis entre execuções."""
+
+    def __init__(self, dimensao: int = 768):
+        self.dimensao = dimensao
+
+    def _vetor(self, texto: str) -> list[float]:
+        vetor = np.zeros(self.dimensao, dtype="float32")
+        for termo in tokenizar(texto):
+            h = _hash_termo(termo)
+            vetor[h % self.dimensao] += 1.0 if (h >> 32) & 1 else -1.0
+        norma = np.linalg.norm(vetor)
+        return (vetor / norma if norma else vetor).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._vetor(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._vetor(text)
+
+
+class CrossEncoderDeterministico:
+    """Score de um par = fração dos termos da pergunta presentes no chunk (desempate pela densidade)."""
+
+    def predict(self, pares, batch_size: int | None = None) -> np.ndarray:
+        scores = []
+        for pergunta, texto in pares:
+            termos = set(tokenizar(pergunta))
+            tokens = tokenizar(texto)
+            comuns = termos.intersection(tokens)
+            densidade = sum(t in termos for t in tokens) / (len(tokens) or 1)
+            scores.append(len(comuns) / (len(termos) or 1) + 0.1 * densidade)
+        return np.array(scores, dtype="float32")
+
+
+class LLMDeterministico:
+    """Responde com as primeiras frases do contexto, em fluxo, palavra por palavra."""
+
+    def __init__(self, max_palavras: int = 80, atraso_por_token: float = 0.0):
+        self.max_palavras = max_palavras
+        self.atraso_por_token = atraso_por_token
+
+    def stream(self, prompt: str):
+        contexto = prompt.split("Contexto:", 1)[-1]
+        for palavra in contexto.split()[:self.max_palavras]:
+            if self.atraso_por_token:
+                time.sleep(self.atraso_por_token)
+            yield palavra + " "
+
+
+class Medidor:
+    """Amostras de latência, itens processados e pico de memória por etapa."""
+
+    def __init__(self, memoria: bool = False):
+        self.memoria = memoria
+        self.amostras = defaultdict(list)
+        self.itens = defaultdict(int)
+        self.picos = defaultdict(int)
+
+    @contextmanager
+    def etapa(self, nome: str, itens: int = 1):
+        if self.memoria:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.amostras[nome].append(time.perf_counter() - inicio)
+            self.itens[nome] += itens
+            if self.memoria:
+                self.picos[nome] = max(self.picos[nome], tracemalloc.get_traced_memory()[1] - base)
+
+    def relatorio(self) -> dict:
+        etapas = {}
+        for nome, amostras in self.amostras.items():
+            ms = np.array(amostras) * 1000
+            total = float(np.sum(amostras))
+            etapas[nome] = {
+                "execucoes": len(amostras),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "media_ms": float(ms.mean()),
+                "total_s": total,
+                "itens_por_s": self.itens[nome] / total if total else 0.0,
+            }
+            if self.memoria:
+                etapas[nome]["pico_mb"] = self.picos[nome] / 2**20
+        return etapas
+
+
+def relevancias(documentos, rotulo: dict) -> list[bool]:
+    paginas = set(rotulo["paginas"])
+    return [os.path.basename(str(doc.metadata.get("source", ""))) == rotulo["source"]
+            and doc.metadata.get("page") in paginas for doc in documentos]
+
+
+def recall_em_k(relevantes: list[bool], k: int) -> float:
+    return float(any(relevantes[:k]))
+
+
+def rank_reciproco(relevantes: list[bool]) -> float:
+    return next((1.0 / (i + 1) for i, r in enumerate(relevantes) if r), 0.0)
+
+
+def carregar_corpus(pasta_docs: str, medidor: Medidor) -> list[Document]:
+    paginas = []
+    for arquivo in sorted(os.listdir(pasta_docs)):
+        if not arquivo.endswith(".pdf"):
+            continue
+        caminho = os.path.join(pasta_docs, arquivo)
+        reader = PdfReader(caminho)
+        for i, pagina in enumerate(reader.pages):
+            with medidor.etapa("carga: página do PDF"):
+                paginas.append(Document(page_content=pagina.extract_text(), metadata={"source": caminho, "page": i}))
+    return paginas
+
+
+def executar(args) -> dict:
+    medidor = Medidor(memoria=args.memoria)
+    if args.memoria:
+        tracemalloc.start()
+    embeddings = EmbeddingsDeterministicas()
+    with open(args.perguntas, encoding="utf-8") as f:
+        rotulos = json.load(f)
+
+    # 1. Carga: PDFs e o índice já salvo (mmap quando é o formato compacto)
+    paginas = carregar_corpus(args.docs, medidor)
+    if os.path.isdir(args.indice):
+        for _ in range(args.repeticoes):
+            with medidor.etapa("carga: índice salvo"):
+                carregar_indice(args.indice, embeddings)
+
+    # 2. Divisão em chunks (mesma configuração do rag_app.py)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=70, add_start_index=True)
+    chunks = []
+    for pagina in paginas:
+        with medidor.etapa("divisão em chunks"):
+            chunks.extend(text_splitter.split_documents([pagina]))
+
+    # 3. Embeddings e montagem dos índices, em uma pasta temporária
+    opcoes = {"tipo": args.tipo, "quantizacao": args.quantizacao}
+    vectorstore = None
+    for inicio in range(0, len(chunks), args.tamanho_lote):
+        lote = chunks[inicio:inicio + args.tamanho_lote]
+        with medidor.etapa("embeddings", itens=len(lote)):
+            vetores = embeddings.embed_documents([c.page_content for c in lote])
+        ids = [f"chunk-{inicio + i}" for i in range(len(lote))]
+        with medidor.etapa("inserção no índice", itens=len(lote)):
+            if vectorstore is None:
+                vectorstore = IndiceVetorial(embeddings, **opcoes)
+            vectorstore.add_embeddings(zip([c.page_content for c in lote], vetores),
+                                       metadatas=[c.metadata for c in lote], ids=ids)
+    with medidor.etapa("índice léxico", itens=len(chunks)):
+        indice_lexico = IndiceLexico.construir(vectorstore.iterar_documentos())
+    with tempfile.TemporaryDirectory() as pasta:
+        with medidor.etapa("gravação dos índices"):
+            vectorstore.save_local(pasta)
+            indice_lexico.salvar(pasta)
+
+    reranker = ReRanker(cross_encoder=CrossEncoderDeterministico(), tamanho_lote=32)
+    montador = MontadorDeContexto(orcamento_tokens=args.orcamento)
+    llm = LLMDeterministico(atraso_por_token=args.atraso_token)
+    qualidade = defaultdict(list)
+    tokens_contexto = []
+
+    for rodada in range(args.repeticoes):
+        # Cada rodada começa com o cache do re-ranker vazio: mede o caminho sem cache
+        reranker.cache = CacheLRU(20000)
+        for rotulo in rotulos:
+            pergunta = rotulo["pergunta"]
+            perguntas = [pergunta] + (expandir_localmente(pergunta) if args.expansao == "local" else [])
+
+            # 4. Recuperação (híbrida, a não ser com --sem-bm25)
+            with medidor.etapa("recuperação"):
+                candidatos = recuperar_multiplas(
+                    vectorstore, embeddings, perguntas, k=args.k,
+                    indice_lexico=None if args.sem_bm25 else indice_lexico, max_candidatos=args.max_candidatos,
+                )
+            # 5. Re-ranking
+            with medidor.etapa("re-ranking", itens=len(candidatos)):
+                docs_com_scores = reranker.reranquear(pergunta, candidatos, top_n=args.k_final,
+                                                      fator_corte=args.fator_corte)
+            # 6. Montagem do contexto
+            with medidor.etapa("montagem do contexto"):
+                documentos = montador.montar(docs_com_scores)
+            # 7. Geração
+            prompt = f"Contexto:\n{formatar_contexto(documentos)}\n\nPergunta:\n{pergunta}"
+            with medidor.etapa("geração"):
+                resposta = list(llm.stream(prompt))
+            medidor.itens["geração"] += len(resposta) - 1
+
+            if rodada == 0:
+                tokens_contexto.append(montador.ultimo_resumo["tokens"])
+                recuperados = relevancias([doc for _, doc, *_ in candidatos], rotulo)
+                rerankeados = relevancias([doc for doc, _ in docs_com_scores], rotulo)
+                for k in (1, 5, args.k):
+                    qualidade[f"recuperação recall@{k}"].append(recall_em_k(recuperados, k))
+                qualidade["recuperação MRR"].append(rank_reciproco(recuperados))
+                for k in (1, 3, args.k_final):
+                    qualidade[f"re-ranking recall@{k}"].append(recall_em_k(rerankeados, k))
+                qualidade["re-ranking MRR"].append(rank_reciproco(rerankeados))
+                qualidade["contexto recall"].append(float(any(relevancias(documentos, rotulo))))
+
+    if args.memoria:
+        tracemalloc.stop()
+    return {
+        "configuracao": {k: v for k, v in vars(args).items() if k != "saida"},
+        "corpus": {"paginas": len(paginas), "chunks": len(chunks), "perguntas": len(rotulos)},
+        "etapas": medidor.relatorio(),
+        "qualidade": {nome: float(np.mean(valores)) for nome, valores in qualidade.items()},
+        "tokens_contexto_medio": float(np.mean(tokens_contexto)) if tokens_contexto else 0.0,
+        # ru_maxrss vem em KB no Linux
+        "pico_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def imprimir(resultado: dict) -> None:
+    corpus = resultado["corpus"]
+    print(f"Corpus: {corpus['paginas']} páginas, {corpus['chunks']} chunks, {corpus['perguntas']} perguntas rotuladas")
+    memoria = any("pico_mb" in e for e in resultado["etapas"].values())
+    print(f"\n{'etapa':<24}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'itens/s':>12}"
+          + (f"{'pico MB':>10}" if memoria else ""))
+    for nome, e in resultado["etapas"].items():
+        print(f"{nome:<24}{e['execucoes']:>6}{e['p50_ms']:>10.2f}{e['p95_ms']:>10.2f}{e['p99_ms']:>10.2f}"
+              f"{e['itens_por_s']:>12.1f}" + (f"{e['pico_mb']:>10.2f}" if memoria else ""))
+    print("\nQualidade")
+    for nome, valor in resultado["qualidade"].items():
+        print(f"{nome:<28}{valor:>8.3f}")
+    print(f"\nTokens de contexto (média): {resultado['tokens_contexto_medio']:.0f}")
+    print(f"Pico de memória do processo: {resultado['pico_rss_mb']:.1f} MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline RAG com backends determinísticos")
+    parser.add_argument("--docs", default="docs")
+    parser.add_argument("--indice", default="faiss_index")
+    parser.add_argument("--perguntas", default=PERGUNTAS_PADRAO)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--tipo", default="hnsw", choices=["flat", "ivf", "hnsw"])
+    parser.add_argument("--quantizacao", default="sq8", type=lambda v: None if v == "nenhuma" else v,
+                        help="sq8, pq ou nenhuma")
+    parser.add_argument("--tamanho-lote", type=int, default=64)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--k-final", type=int, default=8)
+    parser.add_argument("--max-candidatos", type=int, default=30)
+    parser.add_argument("--fator-corte", type=float, default=0.3)
+    parser.add_argument("--orcamento", type=int, default=1500, help="orçamento de tokens do contexto")
+    parser.add_argument("--expansao", default="local", choices=["local", "nenhuma"])
+    parser.add_argument("--sem-bm25", action="store_true", help="recuperação só vetorial")
+    parser.add_argument("--atraso-token", type=float, default=0.0,
+                        help="segundos por token do LLM simulado (0 = só o custo do pipeline)")
+    parser.add_argument("--memoria", action="store_true", help="pico de memória por etapa (mais lento)")
+    parser.add_argument("--saida", help="grava o resultado completo em JSON")
+    args = parser.parse_args()
+
+    resultado = executar(args)
+    imprimir(resultado)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"\nResultado salvo em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
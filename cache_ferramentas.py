@@ -0,0 +1,156 @@
+# --- CACHE DE RESULTADOS DAS FERRAMENTAS DA CREW ---
+# O SQLiteCache do LangChain só guarda as respostas do LLM; cada busca de um agente
+# ia de novo ao Serper, e os agentes repetem buscas quase iguais ("restaurantes
+# tradicionais no Porto", "restaurante tradicional Porto"). Aqui:
+# - a consulta é normalizada (minúsculas, sem acentos, sem stopwords, radicais) e
+#   vira a chave do cache. A ordem dos termos é mantida e negação e direção ("sem",
+#   "com", "não", "de", "para") não são descartadas: "voos de Lisboa para o Porto" e
+#   "voos do Porto para Lisboa", ou "sem glúten" e "com glúten", são buscas diferentes;
+# - os resultados ficam em SQLite (WAL) e expiram por TTL, valendo entre execuções;
+# - chamadas simultâneas com a mesma chave são unidas: só a primeira vai ao backend
+#   e as demais esperam o mesmo resultado;
+# - o backend é qualquer função consulta -> texto; BuscaOffline responde a partir de
+#   um arquivo JSON, para rodar a crew sem rede ou em testes.
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+from concurrent.futures import Future
+from expansao import STOPWORDS, normalizar_pergunta
+from indice_lexico import radical, remover_acentos
+from telemetria import obter_rastreador
+
+CACHE_FERRAMENTAS_PADRAO = "cache_ferramentas.db"
+TTL_PADRAO = 24 * 3600
+
+# Stopwords que mudam o resultado da busca: negação, companhia e origem/destino
+_PALAVRAS_DE_SENTIDO = {"sem", "com", "nao", "nem", "de", "da", "do", "das", "dos", "para", "desde", "ate"}
+_IGNORADAS = {remover_acentos(p) for p in STOPWORDS} - _PALAVRAS_DE_SENTIDO
+
+
+def normalizar_consulta(consulta: str) -> str:
+    """Chave da consulta: termos radicalizados, na ordem original; consultas só de stopwords ficam como estão."""
+    palavras = re.findall(r"[a-z0-9]+", remover_acentos(consulta.lower()))
+    termos = [radical(p) for p in palavras if p not in _IGNORADAS and (len(p) > 1 or p.isdigit())]
+    return " ".join(termos) if termos else normalizar_pergunta(consulta)
+
+
+class BuscaOffline:
+    """Backend local: resultados gravados em JSON ({consulta: resultado}), casados pela chave normalizada."""
+
+    def __init__(self, arquivo: str | None = None, resultados: dict | None = None):
+        if arquivo:
+            with open(arquivo, encoding="utf-8") as f:
+                resultados = {**json.load(f), **(resultados or {})}
+        self.resultados = {normalizar_consulta(c): r for c, r in (resultados or {}).items()}
+        self.chamadas = 0
+
+    def __call__(self, consulta: str) -> str:
+        self.chamadas += 1
+        return self.resultados.get(normalizar_consulta(consulta),
+                                   f"Nenhum resultado offline para '{consulta}'.")
+
+
+class CacheDeFerramentas:
+    """
+    Envolve `backend(consulta) -> str` com cache persistente por consulta normalizada,
+    separado por `ferramenta`. `ttl_segundos=None` não expira.
+    """
+
+    def __init__(self, backend, caminho: str = CACHE_FERRAMENTAS_PADRAO, ferramenta: str = "busca",
+                 ttl_segundos: float | None = TTL_PADRAO):
+        self.backend = backend
+        self.ferramenta = ferramenta
+        self.ttl_segundos = ttl_segundos
+        self.acertos = 0
+        self.falhas = 0
+        self.unidas = 0
+        self._lock = threading.Lock()
+        self._em_andamento = {}
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS resultados (ferramenta TEXT NOT NULL, chave TEXT NOT NULL,"
+            " consulta TEXT NOT NULL, resultado TEXT NOT NULL, criado REAL NOT NULL,"
+            " PRIMARY KEY (ferramenta, chave))"
+        )
+        self._conexao.commit()
+        self._remover_expirados()
+
+    def _remover_expirados(self) -> None:
+        if self.ttl_segundos is None:
+            return
+        with self._lock:
+            self._conexao.execute("DELETE FROM resultados WHERE criado < ?", (time.time() - self.ttl_segundos,))
+            self._conexao.commit()
+
+    def _ler(self, chave: str) -> str | None:
+        linha = self._conexao.execute(
+            "SELECT resultado, criado FROM resultados WHERE ferramenta = ? AND chave = ?", (self.ferramenta, chave)
+        ).fetchone()
+        if linha is None or (self.ttl_segundos is not None and linha[1] < time.time() - self.ttl_segundos):
+            return None
+        return linha[0]
+
+    def _gravar(self, chave: str, consulta: str, resultado: str) -> None:
+        with self._lock:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO resultados (ferramenta, chave, consulta, resultado, criado)"
+                " VALUES (?, ?, ?, ?, ?)", (self.ferramenta, chave, consulta, resultado, time.time())
+            )
+            self._conexao.commit()
+
+    def executar(self, consulta: str) -> str:
+        chave = normalizar_consulta(consulta)
+        with obter_rastreador().etapa("cache de ferramentas", ferramenta=self.ferramenta) as etapa:
+            with self._lock:
+                resultado = self._ler(chave)
+                if resultado is not None:
+                    self.acertos += 1
+                    etapa["acertos_cache"] = 1
+                    return resultado
+                futuro = self._em_andamento.get(chave)
+                dono = futuro is None
+                if dono:
+                    futuro = self._em_andamento[chave] = Future()
+                    self.falhas += 1
+                else:
+                    self.unidas += 1
+            etapa["falhas_cache"] = 1
+            etapa["unida"] = not dono
+            if not dono:
+                # Outra thread já está buscando a mesma chave; erros dela também chegam aqui
+                return futuro.result()
+            try:
+                resultado = str(self.backend(consulta))
+            except BaseException as erro:
+                futuro.set_exception(erro)
+                raise
+            else:
+                self._gravar(chave, consulta, resultado)
+                futuro.set_result(resultado)
+                return resultado
+            finally:
+                with self._lock:
+                    del self._em_andamento[chave]
+
+    async def aexecutar(self, consulta: str) -> str:
+        return await asyncio.to_thread(self.executar, consulta)
+
+    def exportar(self, arquivo: str) -> int:
+        """Grava os resultados válidos em JSON no formato lido por BuscaOffline."""
+        with self._lock:
+            linhas = self._conexao.execute(
+                "SELECT consulta, resultado FROM resultados WHERE ferramenta = ? AND criado >= ?",
+                (self.ferramenta, 0 if self.ttl_segundos is None else time.time() - self.ttl_segundos),
+            ).fetchall()
+        with open(arquivo, "w", encoding="utf-8") as f:
+            json.dump(dict(linhas), f, ensure_ascii=False, indent=2)
+        return len(linhas)
+
+    def resumo(self) -> str:
+        return (f"Cache de ferramentas ({self.ferramenta}): {self.acertos} acertos, "
+                f"{self.falhas} buscas no backend, {self.unidas} chamadas unidas a uma busca em andamento")
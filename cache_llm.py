@@ -0,0 +1,234 @@
+# --- CACHE DE RESPOSTAS DO LLM EM SHARDS ---
+# Substitui o SQLiteCache do LangChain (um único cache.db, journal padrão, chave
+# com o prompt inteiro e sem limite de tamanho). Aqui:
+# - a chave é um hash blake2b de 16 bytes de (llm_string, prompt), e a resposta é
+#   guardada serializada e comprimida com zlib;
+# - as entradas ficam espalhadas em N arquivos SQLite em modo WAL, cada um com sua
+#   conexão e seu lock: leitores não bloqueiam e escritas em shards diferentes não
+#   disputam o mesmo lock;
+# - entradas mais antigas que o TTL expiram e, acima do tamanho máximo, as usadas
+#   há mais tempo são descartadas;
+# - um LRU pequeno em memória responde às chaves mais recentes sem tocar no disco.
+# A busca é sempre pela chave primária, então o custo não cresce com o cache.
+import os
+import json
+import time
+import zlib
+import atexit
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from langchain_core.caches import BaseCache
+from langchain_core.outputs import Generation, ChatGeneration
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.globals import set_llm_cache
+from recursos import reabrir_apos_fork, manter_herdada
+
+PASTA_CACHE_LLM_PADRAO = "cache_llm"
+NUM_SHARDS_PADRAO = 8
+TAMANHO_MAXIMO_PADRAO = 2 * 1024 ** 3
+TTL_PADRAO = 30 * 24 * 3600
+# Os acessos (para o LRU em disco) são gravados em lote, não a cada leitura
+ACESSOS_POR_GRAVACAO = 256
+
+
+def serializar(geracoes) -> bytes:
+    """Gerações em JSON (mensagens pelo formato estável message_to_dict), antes da compressão."""
+    return json.dumps([
+        {"mensagem": message_to_dict(g.message), "info": g.generation_info} if isinstance(g, ChatGeneration)
+        else {"texto": g.text, "info": g.generation_info}
+        for g in geracoes
+    ], ensure_ascii=False, default=str).encode("utf-8")
+
+
+def desserializar(dados: bytes) -> list:
+    return [
+        ChatGeneration(message=messages_from_dict([g["mensagem"]])[0], generation_info=g["info"])
+        if "mensagem" in g else Generation(text=g["texto"], generation_info=g["info"])
+        for g in json.loads(dados)
+    ]
+
+
+class _Shard:
+    """Um arquivo SQLite do cache, com o total de bytes que guarda."""
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        self.conexao = self._conectar()
+        self.conexao.execute("PRAGMA journal_mode=WAL")
+        self.conexao.execute(
+            "CREATE TABLE IF NOT EXISTS respostas (chave BLOB PRIMARY KEY, valor BLOB NOT NULL,"
+            " tamanho INTEGER NOT NULL, criado REAL NOT NULL, acesso REAL NOT NULL) WITHOUT ROWID"
+        )
+        self.conexao.execute("CREATE INDEX IF NOT EXISTS respostas_acesso ON respostas (acesso)")
+        self.conexao.execute("CREATE INDEX IF NOT EXISTS respostas_criado ON respostas (criado)")
+        self.conexao.commit()
+        self.bytes = self.conexao.execute("SELECT COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()[0]
+        self.acessos = {}
+
+    def _conectar(self) -> sqlite3.Connection:
+        conexao = sqlite3.connect(self.caminho, check_same_thread=False, timeout=30)
+        conexao.execute("PRAGMA synchronous=NORMAL")
+        return conexao
+
+    def _apos_fork(self) -> None:
+        self.lock = threading.Lock()
+        manter_herdada(self.conexao)
+        self.conexao = self._conectar()
+        self.acessos = {}
+
+
+class CacheLLMEmShards(BaseCache):
+    """
+    Cache do LangChain (set_llm_cache) em `num_shards` arquivos SQLite dentro de `pasta`.
+    `tamanho_maximo` (bytes comprimidos) e `ttl_segundos` limitam o cache em disco;
+    `itens_em_memoria` é o tamanho do LRU na frente dele.
+    """
+
+    def __init__(self, pasta: str = PASTA_CACHE_LLM_PADRAO, num_shards: int = NUM_SHARDS_PADRAO,
+                 tamanho_maximo: int = TAMANHO_MAXIMO_PADRAO, ttl_segundos: float | None = TTL_PADRAO,
+                 itens_em_memoria: int = 1024, nivel_compressao: int = 6):
+        os.makedirs(pasta, exist_ok=True)
+        self.pasta = pasta
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl_segundos = ttl_segundos
+        self.itens_em_memoria = itens_em_memoria
+        self.nivel_compressao = nivel_compressao
+        self.acertos_memoria = 0
+        self.acertos_disco = 0
+        self.falhas = 0
+        self._shards = [_Shard(os.path.join(pasta, f"shard_{i:02d}.db")) for i in range(num_shards)]
+        self._memoria = OrderedDict()
+        self._lock_memoria = threading.Lock()
+        for shard in self._shards:
+            self._remover_expirados(shard)
+        reabrir_apos_fork(self)
+
+    def _apos_fork(self) -> None:
+        self._lock_memoria = threading.Lock()
+        for shard in self._shards:
+            shard._apos_fork()
+
+    @staticmethod
+    def chave(prompt: str, llm_string: str) -> bytes:
+        return hashlib.blake2b(f"{llm_string}\x00{prompt}".encode("utf-8"), digest_size=16).digest()
+
+    def _shard(self, chave: bytes) -> _Shard:
+        return self._shards[int.from_bytes(chave[:4], "little") % len(self._shards)]
+
+    def _expirado(self, criado: float) -> bool:
+        return self.ttl_segundos is not None and criado < time.time() - self.ttl_segundos
+
+    def _lembrar(self, chave: bytes, geracoes: list, criado: float) -> None:
+        with self._lock_memoria:
+            self._memoria[chave] = (geracoes, criado)
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.itens_em_memoria:
+                self._memoria.popitem(last=False)
+
+    def lookup(self, prompt: str, llm_string: str):
+        chave = self.chave(prompt, llm_string)
+        with self._lock_memoria:
+            em_memoria = self._memoria.get(chave)
+            if em_memoria is not None and not self._expirado(em_memoria[1]):
+                self._memoria.move_to_end(chave)
+                self.acertos_memoria += 1
+                return em_memoria[0]
+
+        shard = self._shard(chave)
+        with shard.lock:
+            linha = shard.conexao.execute(
+                "SELECT valor, criado FROM respostas WHERE chave = ?", (chave,)
+            ).fetchone()
+            if linha is None or self._expirado(linha[1]):
+                self.falhas += 1
+                return None
+            shard.acessos[chave] = time.time()
+            if len(shard.acessos) >= ACESSOS_POR_GRAVACAO:
+                self._gravar_acessos(shard)
+        geracoes = desserializar(zlib.decompress(linha[0]))
+        self.acertos_disco += 1
+        self._lembrar(chave, geracoes, linha[1])
+        return geracoes
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        chave = self.chave(prompt, llm_string)
+        valor = zlib.compress(serializar(return_val), self.nivel_compressao)
+        agora = time.time()
+        shard = self._shard(chave)
+        with shard.lock:
+            anterior = shard.conexao.execute("SELECT tamanho FROM respostas WHERE chave = ?", (chave,)).fetchone()
+            shard.conexao.execute(
+                "INSERT OR REPLACE INTO respostas (chave, valor, tamanho, criado, acesso) VALUES (?, ?, ?, ?, ?)",
+                (chave, valor, len(valor), agora, agora),
+            )
+            shard.bytes += len(valor) - (anterior[0] if anterior else 0)
+            shard.conexao.commit()
+            if shard.bytes > self.tamanho_maximo / len(self._shards):
+                self._descartar_antigos(shard)
+        self._lembrar(chave, list(return_val), agora)
+
+    def _gravar_acessos(self, shard: _Shard) -> None:
+        """Chamado com shard.lock adquirido."""
+        if shard.acessos:
+            shard.conexao.executemany("UPDATE respostas SET acesso = ? WHERE chave = ?",
+                                      [(t, c) for c, t in shard.acessos.items()])
+            shard.conexao.commit()
+            shard.acessos.clear()
+
+    def _descartar_antigos(self, shard: _Shard) -> None:
+        """Chamado com shard.lock adquirido: expira pelo TTL e reduz o shard a 90% do limite."""
+        self._gravar_acessos(shard)
+        if self.ttl_segundos is not None:
+            shard.conexao.execute("DELETE FROM respostas WHERE criado < ?", (time.time() - self.ttl_segundos,))
+        limite = 0.9 * self.tamanho_maximo / len(self._shards)
+        total = shard.conexao.execute("SELECT COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()[0]
+        if total > limite:
+            remover, excesso = [], total - limite
+            for chave, tamanho in shard.conexao.execute("SELECT chave, tamanho FROM respostas ORDER BY acesso"):
+                remover.append((chave,))
+                excesso -= tamanho
+                if excesso <= 0:
+                    break
+            shard.conexao.executemany("DELETE FROM respostas WHERE chave = ?", remover)
+            total = shard.conexao.execute("SELECT COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()[0]
+        shard.conexao.commit()
+        shard.bytes = total
+
+    def _remover_expirados(self, shard: _Shard) -> None:
+        if self.ttl_segundos is None:
+            return
+        with shard.lock:
+            shard.conexao.execute("DELETE FROM respostas WHERE criado < ?", (time.time() - self.ttl_segundos,))
+            shard.conexao.commit()
+            shard.bytes = shard.conexao.execute("SELECT COALESCE(SUM(tamanho), 0) FROM respostas").fetchone()[0]
+
+    def clear(self, **kwargs) -> None:
+        with self._lock_memoria:
+            self._memoria.clear()
+        for shard in self._shards:
+            with shard.lock:
+                shard.conexao.execute("DELETE FROM respostas")
+                shard.conexao.commit()
+                shard.acessos.clear()
+                shard.bytes = 0
+
+    def fechar(self) -> None:
+        for shard in self._shards:
+            with shard.lock:
+                self._gravar_acessos(shard)
+                shard.conexao.close()
+
+    def resumo(self) -> str:
+        return (f"Cache do LLM: {self.acertos_memoria} acertos em memória, {self.acertos_disco} em disco, "
+                f"{self.falhas} falhas; {sum(s.bytes for s in self._shards) / 1024 ** 2:.1f} MB em disco")
+
+
+def ativar_cache_llm(pasta: str | None = None, **kwargs) -> CacheLLMEmShards:
+    """Instala o cache para todos os LLMs do LangChain no processo (pasta em RAG_CACHE_LLM)."""
+    cache = CacheLLMEmShards(pasta or os.environ.get("RAG_CACHE_LLM", PASTA_CACHE_LLM_PADRAO), **kwargs)
+    set_llm_cache(cache)
+    atexit.register(cache.fechar)
+    return cache
@@ -0,0 +1,207 @@
+# --- CACHE SEMÂNTICO DE RESPOSTAS ---
+# O SQLiteCache do LangChain só acerta quando o prompt é idêntico. Este cache fica
+# na frente do caminho pergunta -> resposta: a pergunta é transformada em vetor e
+# comparada (similaridade de cosseno) com as perguntas já respondidas. Acima do
+# limiar, a resposta guardada é devolvida junto com os ids dos chunks usados.
+#
+# As entradas guardam os ids (hash_chunk) dos chunks de origem e são apagadas
+# quando algum deles sai do índice; também expiram por TTL e, acima do tamanho
+# máximo, as menos usadas recentemente são descartadas. Com `pasta_indice`, cada
+# busca confere se o manifesto da ingestão mudou (pelo os.stat) e, se mudou, refaz
+# essa limpeza: um processo de longa duração não serve respostas de chunks que uma
+# ingestão posterior removeu. Sem manifesto, os chunks são desconhecidos e nada é apagado.
+import os
+import time
+import sqlite3
+import threading
+import numpy as np
+from telemetria import obter_rastreador
+from recursos import reabrir_apos_fork, manter_herdada
+
+CACHE_SEMANTICO_PADRAO = "cache_semantico.db"
+LIMIAR_SIMILARIDADE_PADRAO = 0.93
+TTL_PADRAO = 7 * 24 * 3600
+
+
+class CacheSemantico:
+    """Respostas indexadas pelo vetor da pergunta, separadas por `escopo` (ex.: "rag_app")."""
+
+    def __init__(self, embeddings, caminho: str = CACHE_SEMANTICO_PADRAO, escopo: str = "padrao",
+                 limiar_similaridade: float = LIMIAR_SIMILARIDADE_PADRAO,
+                 ttl_segundos: float | None = TTL_PADRAO, max_entradas: int = 5000,
+                 pasta_indice: str | None = None):
+        self.embeddings = embeddings
+        self.pasta_indice = pasta_indice
+        self._versao_do_manifesto = None
+        self.escopo = escopo
+        self.limiar_similaridade = limiar_similaridade
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self.acertos = 0
+        self.falhas = 0
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._conexao = self._conectar()
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS respostas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                escopo TEXT NOT NULL,
+                pergunta TEXT NOT NULL,
+                vetor BLOB NOT NULL,
+                resposta TEXT NOT NULL,
+                criado REAL NOT NULL,
+                ultimo_acesso REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS fontes (
+                resposta_id INTEGER NOT NULL REFERENCES respostas(id) ON DELETE CASCADE,
+                chunk_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS fontes_chunk ON fontes (chunk_id);
+            CREATE INDEX IF NOT EXISTS fontes_resposta ON fontes (resposta_id);
+            """
+        )
+        self._conexao.commit()
+        self._remover_expirados()
+        self._carregar_vetores()
+        reabrir_apos_fork(self)
+
+    def _conectar(self) -> sqlite3.Connection:
+        conexao = sqlite3.connect(self.caminho, check_same_thread=False)
+        conexao.execute("PRAGMA foreign_keys=ON")
+        return conexao
+
+    def _apos_fork(self) -> None:
+        """Conexões SQLite não podem ser usadas por dois processos: o filho abre a sua."""
+        self._lock = threading.Lock()
+        manter_herdada(self._conexao)
+        self._conexao = self._conectar()
+
+    def _carregar_vetores(self) -> None:
+        """Mantém em memória a matriz (normalizada) das perguntas do escopo."""
+        linhas = self._conexao.execute(
+            "SELECT id, vetor FROM respostas WHERE escopo = ? ORDER BY id", (self.escopo,)
+        ).fetchall()
+        self._ids = np.array([i for i, _ in linhas], dtype="int64")
+        self._matriz = (np.stack([np.frombuffer(v, dtype="float32") for _, v in linhas])
+                        if linhas else None)
+
+    def _remover_expirados(self) -> None:
+        if self.ttl_segundos is None:
+            return
+        self._conexao.execute("DELETE FROM respostas WHERE criado < ?", (time.time() - self.ttl_segundos,))
+        self._conexao.commit()
+
+    def _vetor(self, pergunta: str) -> np.ndarray:
+        vetor = np.asarray(self.embeddings.embed_query(pergunta), dtype="float32")
+        return vetor / (np.linalg.norm(vetor) or 1.0)
+
+    def verificar_indice(self) -> int:
+        """
+        Se o manifesto de `pasta_indice` mudou desde a última verificação, apaga as respostas
+        que usaram chunks que saíram do índice. Retorna quantas foram apagadas.
+        """
+        if self.pasta_indice is None:
+            return 0
+        # Importado aqui: ingestao traz o pypdf e o FAISS do LangChain
+        from ingestao import MANIFESTO_NOME, ids_dos_chunks
+        try:
+            estado = os.stat(os.path.join(self.pasta_indice, MANIFESTO_NOME))
+            versao = (estado.st_mtime_ns, estado.st_size, estado.st_ino)
+        except FileNotFoundError:
+            versao = None
+        if versao == self._versao_do_manifesto:
+            return 0
+        self._versao_do_manifesto = versao
+        return self.sincronizar_com_chunks(ids_dos_chunks(self.pasta_indice))
+
+    def buscar(self, pergunta: str) -> tuple[str, list[str]] | None:
+        """Retorna (resposta, ids_dos_chunks) da pergunta mais parecida acima do limiar, ou None."""
+        self.verificar_indice()
+        with obter_rastreador().etapa("cache semântico", escopo=self.escopo) as etapa:
+            encontrada = self._buscar(pergunta)
+            etapa["acertos_cache" if encontrada is not None else "falhas_cache"] = 1
+        return encontrada
+
+    def _buscar(self, pergunta: str) -> tuple[str, list[str]] | None:
+        vetor = self._vetor(pergunta)
+        with self._lock:
+            if self._matriz is not None and len(self._ids):
+                similaridades = self._matriz @ vetor
+                melhor = int(np.argmax(similaridades))
+                if similaridades[melhor] >= self.limiar_similaridade:
+                    id_resposta = int(self._ids[melhor])
+                    linha = self._conexao.execute(
+                        "SELECT resposta, criado FROM respostas WHERE id = ?", (id_resposta,)
+                    ).fetchone()
+                    expirada = (linha is not None and self.ttl_segundos is not None
+                                and linha[1] < time.time() - self.ttl_segundos)
+                    if linha is not None and not expirada:
+                        self._conexao.execute(
+                            "UPDATE respostas SET ultimo_acesso = ? WHERE id = ?", (time.time(), id_resposta)
+                        )
+                        self._conexao.commit()
+                        chunks = [c for (c,) in self._conexao.execute(
+                            "SELECT chunk_id FROM fontes WHERE resposta_id = ?", (id_resposta,)
+                        )]
+                        self.acertos += 1
+                        return linha[0], chunks
+            self.falhas += 1
+        return None
+
+    def guardar(self, pergunta: str, resposta: str, chunk_ids: list[str]) -> None:
+        vetor = self._vetor(pergunta)
+        agora = time.time()
+        with self._lock:
+            cursor = self._conexao.execute(
+                "INSERT INTO respostas (escopo, pergunta, vetor, resposta, criado, ultimo_acesso)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (self.escopo, pergunta, vetor.tobytes(), resposta, agora, agora),
+            )
+            self._conexao.executemany(
+                "INSERT INTO fontes (resposta_id, chunk_id) VALUES (?, ?)",
+                [(cursor.lastrowid, chunk_id) for chunk_id in dict.fromkeys(chunk_ids)],
+            )
+            # Descarta as entradas usadas há mais tempo acima do tamanho máximo
+            self._conexao.execute(
+                "DELETE FROM respostas WHERE escopo = ? AND id NOT IN ("
+                " SELECT id FROM respostas WHERE escopo = ? ORDER BY ultimo_acesso DESC LIMIT ?)",
+                (self.escopo, self.escopo, self.max_entradas),
+            )
+            self._conexao.commit()
+            self._remover_expirados()
+            self._carregar_vetores()
+
+    def invalidar_chunks(self, chunk_ids) -> int:
+        """Apaga as respostas que usaram algum dos chunks informados."""
+        with self._lock:
+            self._conexao.execute("CREATE TEMP TABLE IF NOT EXISTS alvo (chunk_id TEXT PRIMARY KEY)")
+            self._conexao.execute("DELETE FROM alvo")
+            self._conexao.executemany("INSERT OR IGNORE INTO alvo VALUES (?)", [(c,) for c in chunk_ids])
+            removidas = self._conexao.execute(
+                "DELETE FROM respostas WHERE id IN ("
+                " SELECT resposta_id FROM fontes WHERE chunk_id IN (SELECT chunk_id FROM alvo))"
+            ).rowcount
+            self._conexao.commit()
+            self._carregar_vetores()
+        return removidas
+
+    def sincronizar_com_chunks(self, chunk_ids_atuais) -> int:
+        """
+        Apaga as respostas que usaram chunks que não existem mais no índice.
+        Com `chunk_ids_atuais=None` (índice sem manifesto) não apaga nada.
+        """
+        if chunk_ids_atuais is None:
+            return 0
+        with self._lock:
+            self._conexao.execute("CREATE TEMP TABLE IF NOT EXISTS atuais (chunk_id TEXT PRIMARY KEY)")
+            self._conexao.execute("DELETE FROM atuais")
+            self._conexao.executemany("INSERT OR IGNORE INTO atuais VALUES (?)", [(c,) for c in chunk_ids_atuais])
+            removidas = self._conexao.execute(
+                "DELETE FROM respostas WHERE id IN ("
+                " SELECT resposta_id FROM fontes WHERE chunk_id NOT IN (SELECT chunk_id FROM atuais))"
+            ).rowcount
+            self._conexao.commit()
+            self._carregar_vetores()
+        return removidas
@@ -0,0 +1,217 @@
+# --- CALCULADORA DETERMINÍSTICA ---
+# Antes, a calculadora do agent_app.py pedia ao LLM uma linha de Python e a executava
+# no PythonAstREPLTool: uma geração inteira (e um interpretador sem restrições) para
+# contas como "15% de 5000". Aqui a pergunta em português/inglês é reescrita por
+# regras em uma expressão aritmética, que é avaliada por um avaliador de AST restrito
+# (só números, operadores aritméticos e algumas funções). Se sobrar algum número fora
+# da expressão reconhecida ("aumento de 10% sobre 200"), a pergunta não é tratada
+# pelas regras e segue para a tradução pelo LLM. Várias contas na mesma pergunta,
+# separadas por ";" ou por linha, são avaliadas de uma vez: as que têm a mesma
+# estrutura ("a * b / c") viram uma operação NumPy por nó, sobre vetores.
+import ast
+import re
+import numpy as np
+
+MAX_COMPRIMENTO_EXPRESSAO = 200
+
+_FUNCOES = {
+    "sqrt": np.sqrt, "cbrt": np.cbrt, "abs": np.abs, "exp": np.exp,
+    "log": np.log, "log10": np.log10, "log2": np.log2,
+}
+_BINARIOS = {
+    ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide,
+    ast.Pow: np.power, ast.Mod: np.mod, ast.FloorDiv: np.floor_divide,
+}
+_UNARIOS = {ast.UAdd: np.positive, ast.USub: np.negative}
+
+_NUMERO = r"\d+(?:[.,]\d+)*"
+# Regras aplicadas em ordem; as mais específicas ("15% de") antes das genéricas ("%")
+_REGRAS = [
+    (rf"({_NUMERO})\s*(?:%|por cento|percent)\s*(?:de|do|da|of)\s+", r"(\1/100)*"),
+    (rf"({_NUMERO})\s*(?:%|por cento|percent)", r"(\1/100)"),
+    (r"(?:raiz quadrada|square root)\s*(?:de|do|da|of)?\s*", "sqrt "),
+    (r"(?:raiz c[úu]bica|cube root)\s*(?:de|do|da|of)?\s*", "cbrt "),
+    (r"\braiz\s*(?:de|do|da)?\s*", "sqrt "),
+    (r"√\s*", "sqrt "),
+    (rf"\b(sqrt|cbrt) ({_NUMERO}|\([^()]*\))", r"\1(\2)"),
+    (rf"({_NUMERO}|\))\s*(?:ao quadrado|squared)", r"\1**2"),
+    (rf"({_NUMERO}|\))\s*(?:ao cubo|cubed)", r"\1**3"),
+    (r"\b(?:elevado (?:ao|a)|to the power of|to the)\b|\^", "**"),
+    (r"\b(?:mais|plus)\b", "+"),
+    (r"\b(?:menos|minus)\b", "-"),
+    (r"\b(?:multiplicado por|vezes|times|multiplied by)\b|×", "*"),
+    (r"(?<=[\d)])\s*x\s*(?=[\d(])", "*"),
+    (r"\b(?:dividido por|divided by|over)\b|÷", "/"),
+    (r"\b(?:resto de|mod|modulo)\b", "%"),
+]
+_REGRAS = [(re.compile(padrao), troca) for padrao, troca in _REGRAS]
+_TRECHO_EXPRESSAO = re.compile(r"(?:sqrt|cbrt|[\d.+\-*/%()\s])+")
+
+
+def _normalizar_numero(numero: re.Match) -> str:
+    """'5.000' e '5.000,50' no formato brasileiro; '2,5' vira 2.5."""
+    texto = numero.group(0)
+    if re.fullmatch(r"\d{1,3}(?:\.\d{3})+(?:,\d+)?", texto):
+        return texto.replace(".", "").replace(",", ".")
+    if re.fullmatch(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?", texto) and "." in texto:
+        return texto.replace(",", "")
+    return texto.replace(",", ".")
+
+
+def traduzir_para_expressao(pergunta: str) -> str | None:
+    """Reescreve a pergunta como expressão aritmética; None se não houver uma conta reconhecível."""
+    texto = re.sub(_NUMERO, _normalizar_numero, pergunta.lower())
+    for padrao, troca in _REGRAS:
+        texto = padrao.sub(troca, texto)
+    trechos = [t for t in _TRECHO_EXPRESSAO.finditer(texto) if re.search(r"\d", t.group(0))]
+    if not trechos:
+        return None
+    escolhido = max(trechos, key=lambda t: len(t.group(0).strip()))
+    # Números fora do trecho escolhido ficariam de fora da conta: melhor não responder
+    if re.search(r"\d", texto[:escolhido.start()] + " " + texto[escolhido.end():]):
+        return None
+    expressao = escolhido.group(0).strip(" .")
+    try:
+        arvore = _analisar(expressao)
+    except ValueError:
+        return None
+    # Um número solto ("o ano de 2023") não é uma conta
+    return None if isinstance(arvore, ast.Constant) else expressao
+
+
+def _analisar(expressao: str) -> ast.AST:
+    """Converte a expressão em AST, recusando qualquer nó fora da aritmética permitida."""
+    if len(expressao) > MAX_COMPRIMENTO_EXPRESSAO:
+        raise ValueError("Expressão longa demais")
+    try:
+        arvore = ast.parse(expressao.strip(), mode="eval").body
+    except SyntaxError as erro:
+        raise ValueError(f"Expressão inválida: {expressao!r}") from erro
+    _validar(arvore)
+    return arvore
+
+
+def _validar(no: ast.AST) -> None:
+    if isinstance(no, ast.Constant):
+        if isinstance(no.value, bool) or not isinstance(no.value, (int, float)):
+            raise ValueError(f"Constante não permitida: {no.value!r}")
+    elif isinstance(no, ast.BinOp) and type(no.op) in _BINARIOS:
+        _validar(no.left)
+        _validar(no.right)
+    elif isinstance(no, ast.UnaryOp) and type(no.op) in _UNARIOS:
+        _validar(no.operand)
+    elif isinstance(no, ast.Call) and _nome_funcao(no.func) in _FUNCOES and len(no.args) == 1 and not no.keywords:
+        _validar(no.args[0])
+    else:
+        raise ValueError(f"Construção não permitida: {ast.unparse(no)}")
+
+
+def _nome_funcao(no: ast.AST) -> str | None:
+    # Aceita sqrt(x), math.sqrt(x) e np.sqrt(x), comuns nas respostas do LLM
+    if isinstance(no, ast.Name):
+        return no.id
+    if isinstance(no, ast.Attribute) and isinstance(no.value, ast.Name) and no.value.id in ("math", "np", "numpy"):
+        return no.attr
+    return None
+
+
+def _estrutura(no: ast.AST, constantes: list) -> str:
+    """Assinatura da expressão sem as constantes, que são acumuladas em `constantes`."""
+    if isinstance(no, ast.Constant):
+        constantes.append(float(no.value))
+        return "c"
+    if isinstance(no, ast.BinOp):
+        return f"({_estrutura(no.left, constantes)}{type(no.op).__name__}{_estrutura(no.right, constantes)})"
+    if isinstance(no, ast.UnaryOp):
+        return f"{type(no.op).__name__}{_estrutura(no.operand, constantes)}"
+    return f"{_nome_funcao(no.func)}({_estrutura(no.args[0], constantes)})"
+
+
+def _avaliar(no: ast.AST, valores) -> np.ndarray:
+    """Avalia a AST com cada constante trocada pelo próximo item de `valores` (mesma ordem de _estrutura)."""
+    if isinstance(no, ast.Constant):
+        return next(valores)
+    if isinstance(no, ast.BinOp):
+        esquerda = _avaliar(no.left, valores)
+        return _BINARIOS[type(no.op)](esquerda, _avaliar(no.right, valores))
+    if isinstance(no, ast.UnaryOp):
+        return _UNARIOS[type(no.op)](_avaliar(no.operand, valores))
+    return _FUNCOES[_nome_funcao(no.func)](_avaliar(no.args[0], valores))
+
+
+def avaliar_expressao(expressao: str) -> float:
+    """Avalia a expressão já validada; ValueError se for inválida ou indefinida (divisão por zero, etc.)."""
+    arvore = _analisar(expressao)
+    constantes = []
+    _estrutura(arvore, constantes)
+    with np.errstate(all="ignore"):
+        resultado = float(_avaliar(arvore, iter(constantes)))
+    if not np.isfinite(resultado):
+        raise ValueError(f"Não foi possível avaliar {expressao!r}")
+    return resultado
+
+
+def avaliar_em_lote(expressoes: list[str]) -> np.ndarray:
+    """
+    Avalia várias expressões; as que têm a mesma estrutura (ex.: "a * b / c") são
+    calculadas juntas, uma operação NumPy por nó. Inválidas ou indefinidas viram NaN.
+    """
+    resultados = np.full(len(expressoes), np.nan)
+    grupos = {}
+    for i, expressao in enumerate(expressoes):
+        try:
+            arvore = _analisar(expressao)
+        except ValueError:
+            continue
+        constantes = []
+        chave = _estrutura(arvore, constantes)
+        grupo = grupos.setdefault(chave, (arvore, [], []))
+        grupo[1].append(i)
+        grupo[2].append(constantes)
+
+    with np.errstate(all="ignore"):
+        for arvore, indices, constantes in grupos.values():
+            # Uma linha por constante, uma coluna por expressão do grupo
+            matriz = np.array(constantes, dtype="float64").reshape(len(indices), -1).T
+            valores = _avaliar(arvore, iter(matriz))
+            resultados[indices] = np.broadcast_to(valores, (len(indices),))
+    resultados[~np.isfinite(resultados)] = np.nan
+    return resultados
+
+
+def calcular(pergunta: str) -> tuple[str, float] | None:
+    """(expressão, resultado) de uma pergunta em linguagem natural, ou None se as regras não a entenderem."""
+    expressao = traduzir_para_expressao(pergunta)
+    if expressao is None:
+        return None
+    try:
+        return expressao, avaliar_expressao(expressao)
+    except ValueError:
+        return None
+
+
+def calcular_em_lote(perguntas: list[str]) -> list[tuple[str, float] | None]:
+    """calcular() de várias perguntas, com uma única avaliação vetorizada."""
+    expressoes = [traduzir_para_expressao(p) for p in perguntas]
+    validas = [i for i, e in enumerate(expressoes) if e is not None]
+    valores = avaliar_em_lote([expressoes[i] for i in validas])
+    resultados = [None] * len(perguntas)
+    for i, valor in zip(validas, valores):
+        if not np.isnan(valor):
+            resultados[i] = (expressoes[i], float(valor))
+    return resultados
+
+
+def calcular_varias(pergunta: str) -> list[tuple[str, float]] | None:
+    """Contas separadas por ";" ou por linha ("2+3; 15% de 80"); None se não forem várias ou alguma falhar."""
+    partes = [p for p in re.split(r"[;\n]+", pergunta) if p.strip()]
+    if len(partes) < 2:
+        return None
+    calculos = calcular_em_lote(partes)
+    return None if None in calculos else calculos
+
+
+def formatar_numero(valor: float) -> str:
+    if valor.is_integer() and abs(valor) < 1e15:
+        return str(int(valor))
+    return f"{valor:.10g}"
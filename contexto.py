@@ -0,0 +1,196 @@
+# --- MONTAGEM DO CONTEXTO COM ORÇAMENTO DE TOKENS ---
+# Os documentos re-rankeados iam inteiros para o prompt: chunks vizinhos da mesma
+# página repetiam os 70 caracteres de sobreposição, frases iguais apareciam em mais
+# de um chunk e nada limitava o tamanho do contexto enviado ao llama3. Aqui:
+# - chunks da mesma página que se sobrepõem ou são vizinhos (pelo start_index do
+#   text splitter, quando existe) são unidos em um único trecho;
+# - frases quase idênticas a outras já incluídas são descartadas;
+# - os trechos entram em ordem de score do re-ranker até o orçamento de tokens,
+#   e o último que não cabe inteiro é cortado no fim de uma frase.
+# Cada trecho guarda em metadata["chunks_de_origem"] os hashes dos chunks que o
+# formaram, usados pelo cache semântico para invalidar respostas.
+import re
+import math
+import unicodedata
+from langchain_core.documents import Document
+from ingestao import hash_chunk
+from telemetria import obter_rastreador
+
+ORCAMENTO_TOKENS_PADRAO = 1500
+# Estimativa para texto em português quando não há um tokenizador à mão
+CARACTERES_POR_TOKEN = 3.5
+SOBREPOSICAO_MINIMA = 20
+SOBREPOSICAO_MAXIMA = 300
+# Distância máxima, em caracteres, entre o fim de um chunk e o início do seguinte
+SEPARACAO_MAXIMA = 5
+
+_FIM_DE_FRASE = re.compile(r"(?<=[.!?;:])\s+|\n{2,}")
+
+
+def estimar_tokens(texto: str) -> int:
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+
+def _sobreposicao(anterior: str, seguinte: str) -> int:
+    """Tamanho do maior sufixo de `anterior` que é prefixo de `seguinte` (0 se menor que o mínimo)."""
+    for tamanho in range(min(len(anterior), len(seguinte), SOBREPOSICAO_MAXIMA), SOBREPOSICAO_MINIMA - 1, -1):
+        if anterior.endswith(seguinte[:tamanho]):
+            return tamanho
+    return 0
+
+
+def _unir_por_posicao(a: dict, b: dict) -> tuple[str, int, int] | None:
+    """Une dois trechos pelas posições na página: (texto, início, fim), ou None se não se tocam."""
+    primeiro, segundo = (a, b) if a["inicio"] <= b["inicio"] else (b, a)
+    if segundo["inicio"] > primeiro["fim"] + SEPARACAO_MAXIMA:
+        return None
+    if segundo["fim"] <= primeiro["fim"]:
+        return primeiro["texto"], primeiro["inicio"], primeiro["fim"]
+    if segundo["inicio"] >= primeiro["fim"]:
+        texto = primeiro["texto"] + "\n" + segundo["texto"]
+    else:
+        texto = primeiro["texto"] + segundo["texto"][primeiro["fim"] - segundo["inicio"]:]
+    return texto, primeiro["inicio"], segundo["fim"]
+
+
+def _unir(anterior: str, seguinte: str) -> str | None:
+    """Texto combinado de dois chunks sobrepostos (em qualquer ordem), ou None se não se tocam."""
+    if seguinte in anterior:
+        return anterior
+    if anterior in seguinte:
+        return seguinte
+    if tamanho := _sobreposicao(anterior, seguinte):
+        return anterior + seguinte[tamanho:]
+    if tamanho := _sobreposicao(seguinte, anterior):
+        return seguinte + anterior[tamanho:]
+    return None
+
+
+def _chave_frase(frase: str) -> tuple[frozenset, frozenset]:
+    """(palavras, números) da frase; frases com números diferentes nunca são duplicatas."""
+    texto = unicodedata.normalize("NFKD", frase.lower())
+    palavras = frozenset(re.findall(r"\w+", "".join(c for c in texto if not unicodedata.combining(c))))
+    return palavras, frozenset(p for p in palavras if p.isdigit())
+
+
+def chunks_de_origem(documentos: list[Document]) -> list[str]:
+    """Hashes dos chunks originais por trás dos documentos (montados ou não)."""
+    ids = []
+    for doc in documentos:
+        ids.extend(doc.metadata.get("chunks_de_origem") or [hash_chunk(doc)])
+    return list(dict.fromkeys(ids))
+
+
+def formatar_contexto(documentos: list[Document]) -> str:
+    """Só o texto dos trechos, para prompts que recebem o contexto como string."""
+    return "\n\n".join(doc.page_content for doc in documentos)
+
+
+class MontadorDeContexto:
+    """
+    Recebe [(Document, score)] em ordem decrescente de score e devolve os trechos que
+    cabem em `orcamento_tokens`. `contar_tokens` pode ser o contador do próprio LLM
+    (ex.: llm.get_num_tokens); por padrão usa uma estimativa por caracteres.
+    """
+
+    def __init__(self, orcamento_tokens: int = ORCAMENTO_TOKENS_PADRAO, contar_tokens=None,
+                 limiar_duplicata: float = 0.85, min_palavras_duplicata: int = 5,
+                 min_tokens_parcial: int = 48):
+        self.orcamento_tokens = orcamento_tokens
+        self.contar_tokens = contar_tokens or estimar_tokens
+        self.limiar_duplicata = limiar_duplicata
+        self.min_palavras_duplicata = min_palavras_duplicata
+        self.min_tokens_parcial = min_tokens_parcial
+        self.ultimo_resumo = {}
+
+    @staticmethod
+    def unir_vizinhos(docs_com_scores) -> list[dict]:
+        """Une chunks sobrepostos da mesma página; retorna os trechos em ordem de score."""
+        trechos = []
+        for doc, score in docs_com_scores:
+            inicio = doc.metadata.get("start_index")
+            trecho = {"texto": doc.page_content, "metadata": dict(doc.metadata), "score": float(score),
+                      "hashes": [hash_chunk(doc)], "inicio": inicio,
+                      "fim": None if inicio is None else inicio + len(doc.page_content)}
+            pagina = (doc.metadata.get("source"), doc.metadata.get("page"))
+            # Um chunk pode ligar dois trechos já existentes; repete até não unir mais nada
+            unido = True
+            while unido:
+                unido = False
+                for i, outro in enumerate(trechos):
+                    if (outro["metadata"].get("source"), outro["metadata"].get("page")) != pagina:
+                        continue
+                    if outro["inicio"] is not None and trecho["inicio"] is not None:
+                        combinado = _unir_por_posicao(outro, trecho)
+                    else:
+                        texto = _unir(outro["texto"], trecho["texto"])
+                        combinado = None if texto is None else (texto, None, None)
+                    if combinado is None:
+                        continue
+                    melhor = outro if outro["score"] >= trecho["score"] else trecho
+                    trecho = {"texto": combinado[0], "metadata": melhor["metadata"], "score": melhor["score"],
+                              "hashes": outro["hashes"] + trecho["hashes"], "inicio": combinado[1],
+                              "fim": combinado[2]}
+                    del trechos[i]
+                    unido = True
+                    break
+            trechos.append(trecho)
+        return sorted(trechos, key=lambda t: t["score"], reverse=True)
+
+    def _sem_duplicatas(self, texto: str, vistas: list[tuple]) -> list[str]:
+        """Frases do trecho que não repetem (quase) literalmente uma frase já incluída."""
+        frases = []
+        for frase in _FIM_DE_FRASE.split(texto):
+            if not frase.strip():
+                continue
+            palavras, numeros = chave = _chave_frase(frase)
+            if len(palavras) >= self.min_palavras_duplicata and any(
+                numeros == outros_numeros
+                and len(palavras & outras) / len(palavras | outras) >= self.limiar_duplicata
+                for outras, outros_numeros in vistas
+            ):
+                continue
+            vistas.append(chave)
+            frases.append(frase.strip())
+        return frases
+
+    def montar(self, docs_com_scores) -> list[Document]:
+        with obter_rastreador().etapa("montagem do contexto") as etapa:
+            documentos = self._montar(docs_com_scores)
+            etapa.update(self.ultimo_resumo)
+        return documentos
+
+    def _montar(self, docs_com_scores) -> list[Document]:
+        trechos = self.unir_vizinhos(docs_com_scores)
+        vistas, documentos = [], []
+        restante = self.orcamento_tokens
+        for trecho in trechos:
+            frases = self._sem_duplicatas(trecho["texto"], vistas)
+            conteudo = " ".join(frases)
+            if not conteudo:
+                continue
+            tokens = self.contar_tokens(conteudo)
+            if tokens > restante:
+                if restante < self.min_tokens_parcial:
+                    continue
+                # Corta no fim da última frase que ainda cabe
+                parcial = []
+                for frase in frases:
+                    if self.contar_tokens(" ".join(parcial + [frase])) > restante:
+                        break
+                    parcial.append(frase)
+                if not parcial:
+                    continue
+                conteudo = " ".join(parcial)
+                tokens = self.contar_tokens(conteudo)
+            restante -= tokens
+            documentos.append(Document(page_content=conteudo, metadata={
+                **trecho["metadata"], "score_reranking": trecho["score"], "chunks_de_origem": trecho["hashes"],
+            }))
+
+        tokens_originais = sum(self.contar_tokens(doc.page_content) for doc, _ in docs_com_scores)
+        self.ultimo_resumo = {
+            "chunks": len(docs_com_scores), "trechos": len(documentos),
+            "tokens_originais": tokens_originais, "tokens": self.orcamento_tokens - restante,
+        }
+        return documentos
@@ -6,18 +6,33 @@ from crewai_tools import SerperDevTool
 
 # # Importe a anotação @tool para criar ferramentas personalizadas
 from crewai.tools import tool
+from telemetria import obter_rastreador, CronometroDeTarefas
+from cache_ferramentas import CacheDeFerramentas, BuscaOffline
+from cache_llm import ativar_cache_llm
 
 load_dotenv()
+# Respostas do LLM em cache compartilhado com os outros scripts (pasta cache_llm/)
+cache_llm = ativar_cache_llm()
+# Tempo de cada tarefa e de cada busca (variáveis RAG_*, ver telemetria.py)
+rastreador = obter_rastreador()
 ollama_llm = OllamaLLM(model="ollama/llama3")
 
 # #############################################################################
 # ## ESTRATÉGIA 2: CRIANDO NOSSA FERRAMENTA SEGURA                       ##
 # #############################################################################
 
-# Inicializamos a ferramenta original que queremos "envolver"
-serper_tool = SerperDevTool()
+# Inicializamos a ferramenta original que queremos "envolver".
+# CREW_BUSCA_OFFLINE=arquivo.json troca o Serper por resultados gravados (sem rede)
+if os.environ.get("CREW_BUSCA_OFFLINE"):
+    backend_busca = BuscaOffline(os.environ["CREW_BUSCA_OFFLINE"])
+else:
+    serper_tool = SerperDevTool()
+    backend_busca = serper_tool.run
+# Buscas repetidas (ou quase iguais) vêm do cache em vez de ir de novo ao Serper
+busca_em_cache = CacheDeFerramentas(backend_busca, ferramenta="serper")
 
 @tool("Ferramenta de Busca Segura na Internet")
+@rastreador.instrumentar("ferramenta: busca na internet")
 def safe_serper_search(query: str) -> str:
     """
     Uma ferramenta de busca na internet que é mais segura de usar.
@@ -32,8 +47,8 @@ def safe_serper_search(query: str) -> str:
         # Se não, o input já é um texto simples (string)
         search_query = query
     
-    # Executa a busca com o texto limpo e retorna o resultado
-    return serper_tool.run(search_query)
+    # Executa a busca com o texto limpo (ou reaproveita uma busca equivalente) e retorna o resultado
+    return busca_em_cache.executar(search_query)
 
 # #############################################################################
 # ## AGORA USAMOS a 'safe_serper_search' em vez da 'SerperDevTool'         ##
@@ -95,12 +110,14 @@ task_create_itinerary = Task(
 )
 
 # --- MONTAGEM DA CREW ---
+cronometro = CronometroDeTarefas(rastreador)
 
 travel_crew = Crew(
   agents=[city_researcher, food_critic, travel_concierge],
   tasks=[task_city_research, task_food_research, task_create_itinerary],
   verbose=True, # ## CORREÇÃO APLICADA AQUI ##
-  process=Process.sequential
+  process=Process.sequential,
+  task_callback=cronometro
 )
 
 # --- EXECUÇÃO ---
@@ -108,9 +125,13 @@ travel_crew = Crew(
 print("######################")
 print("## A Crew de Viagem está pronta para a decolagem! ##")
 print("######################")
-result = travel_crew.kickoff()
+with rastreador.rastro("crew") as rastro:
+    cronometro.iniciar()
+    result = travel_crew.kickoff()
+    rastro["tokens"] = getattr(result.token_usage, "total_tokens", None)
 
 print("\n\n######################")
 print("## Roteiro de Viagem Finalizado: ##")
 print("######################\n")
-print(result)
\ No newline at end of file
+print(result)
+print(busca_em_cache.resumo())
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+import sys
 import asyncio
 from crewai import Agent, Task, Crew, Process
 from langchain_ollama import OllamaLLM
@@ -7,16 +8,30 @@ from dotenv import load_dotenv
 from crewai.tools import tool
 from crewai_tools import SerperDevTool
 
-from langchain_community.cache import SQLiteCache 
-from langchain.globals import set_llm_cache
+from cache_llm import ativar_cache_llm
+from telemetria import obter_rastreador, CronometroDeTarefas
+from crew_em_grafo import ExecutorEmGrafo
+from cache_ferramentas import CacheDeFerramentas, BuscaOffline
 
 load_dotenv()
 
-set_llm_cache(SQLiteCache(database_path="cache.db"))
-
-serper_tool = SerperDevTool()
+# Cache do LLM em shards SQLite (WAL), com chaves em hash, valores comprimidos e limite de tamanho
+cache_llm = ativar_cache_llm()
+# Tempo de cada tarefa e de cada busca (variáveis RAG_*, ver telemetria.py)
+rastreador = obter_rastreador()
+
+# CREW_BUSCA_OFFLINE=arquivo.json troca o Serper por resultados gravados (sem rede)
+if os.environ.get("CREW_BUSCA_OFFLINE"):
+    backend_busca = BuscaOffline(os.environ["CREW_BUSCA_OFFLINE"])
+else:
+    serper_tool = SerperDevTool()
+    backend_busca = serper_tool.run
+# Buscas repetidas (ou quase iguais) vêm do cache; agentes que pedem a mesma busca ao
+# mesmo tempo esperam uma única chamada ao Serper
+busca_em_cache = CacheDeFerramentas(backend_busca, ferramenta="serper")
 
 @tool("Ferramenta de Busca Segura na Internet")
+@rastreador.instrumentar("ferramenta: busca na internet")
 async def safe_serper_search(query: str) -> str:
     """
     Uma ferramenta de busca na internet assíncrona e segura.
@@ -27,7 +42,7 @@ async def safe_serper_search(query: str) -> str:
     else:
         search_query = query
     
-    return await serper_tool.arun(search_query)
+    return await busca_em_cache.aexecutar(search_query)
 
 # --- CONFIGURAÇÃO DOS AGENTES E LLM ---
 ollama_llm = OllamaLLM(model="ollama/llama3")
@@ -69,12 +84,15 @@ task_city_research = Task(
     # async_execution=True # ## REMOVIDO PARA CORRIGIR O ERRO DE CONTEXTO ##
 )
 
+# Em crew_ai.py esta tarefa declara context=[task_city_research]. Aqui a dependência
+# foi retirada de propósito: a descrição já traz a cidade e os restaurantes não
+# dependem das atrações escolhidas, então esperar o resumo da primeira pesquisa só
+# serializaria as duas buscas. Sem a aresta, o ExecutorEmGrafo roda as duas pesquisas
+# ao mesmo tempo, e o roteiro continua recebendo as saídas de ambas pelo seu `context`.
 task_food_research = Task(
-    description="""Com base nas informações da cidade de Porto, encontre 5 opções de restaurantes...""",
+    description="""Na cidade do Porto, Portugal, encontre 5 opções de restaurantes...""",
     expected_output='Uma lista de 5 restaurantes...',
-    agent=food_critic,
-    context=[task_city_research]
-    # async_execution=True # ## REMOVIDO PARA CORRIGIR O ERRO DE CONTEXTO ##
+    agent=food_critic
 )
 
 task_create_itinerary = Task(
@@ -85,24 +103,47 @@ task_create_itinerary = Task(
 )
 
 # --- MONTAGEM E EXECUÇÃO DA CREW ---
+# As tarefas rodam em grafo pelo `context` declarado: as duas pesquisas em paralelo (a
+# gastronômica não depende mais das atrações, ver task_food_research) e o roteiro
+# quando ambas terminam. Limite de tarefas simultâneas enviadas ao Ollama
+# (acima de OLLAMA_NUM_PARALLEL as requisições só esperam na fila do servidor)
+MAX_TAREFAS_SIMULTANEAS = int(os.environ.get("CREW_MAX_TAREFAS_SIMULTANEAS", "2"))
+executor = ExecutorEmGrafo([task_city_research, task_food_research, task_create_itinerary],
+                           max_simultaneas=MAX_TAREFAS_SIMULTANEAS, rastreador=rastreador)
+
+# A Crew sequencial continua disponível para comparação: python crew_ai_optimized.py --sequencial
+cronometro = CronometroDeTarefas(rastreador)
 travel_crew = Crew(
     agents=[city_researcher, food_critic, travel_concierge],
     tasks=[task_city_research, task_food_research, task_create_itinerary],
     verbose=True,
-    process=Process.sequential 
+    process=Process.sequential,
+    task_callback=cronometro
 )
 
-async def main():
+async def main(sequencial: bool = False):
     print("######################")
     print("## A Crew de Viagem Otimizada está pronta para a decolagem! ##")
     print("######################")
     
-    result = await travel_crew.kickoff_async()
+    with rastreador.rastro("crew", sequencial=sequencial) as rastro:
+        if sequencial:
+            cronometro.iniciar()
+            result = await travel_crew.kickoff_async()
+            rastro["tokens"] = getattr(result.token_usage, "total_tokens", None)
+        else:
+            # A saída do roteiro é a resposta final, como na Crew sequencial
+            result = (await executor.executar())[-1]
+            resumo = executor.ultimo_resumo
+            print(f"\nTempo total {resumo['tempo_total']:.1f}s; soma das tarefas {resumo['soma_das_tarefas']:.1f}s; "
+                  f"caminho crítico {resumo['caminho_critico']:.1f}s")
 
     print("\n\n######################")
     print("## Roteiro de Viagem Finalizado: ##")
     print("######################\n")
     print(result)
+    print(busca_em_cache.resumo())
+    print(cache_llm.resumo())
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main(sequencial="--sequencial" in sys.argv))
\ No newline at end of file
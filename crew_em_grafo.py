@@ -0,0 +1,125 @@
+# --- EXECUÇÃO DAS TAREFAS DA CREW EM GRAFO ---
+# Process.sequential executa as tarefas uma após a outra, mesmo quando uma não
+# depende da outra, e o async_execution do CrewAI falha ao repassar o contexto para
+# as tarefas seguintes. Aqui o `context` declarado em cada Task vira uma aresta de
+# um grafo de dependências:
+# - a tarefa começa assim que todas as tarefas do seu contexto terminam;
+# - as tarefas prontas rodam em paralelo (asyncio + threads), limitadas por um
+#   semáforo para não enfileirar gerações demais no Ollama;
+# - um mesmo agente nunca executa duas tarefas ao mesmo tempo;
+# - a saída das dependências chega à tarefa como contexto, no mesmo formato usado
+#   pela Crew.
+# O tempo total fica próximo do caminho crítico do grafo em vez da soma das tarefas.
+import time
+import asyncio
+from telemetria import obter_rastreador
+
+# Mesmo separador que a Crew usa ao juntar as saídas do contexto de uma tarefa
+SEPARADOR_CONTEXTO = "\n\n----------\n\n"
+MAX_TAREFAS_SIMULTANEAS = 2
+
+
+def dependencias_de(tarefa) -> list:
+    # Versões recentes do CrewAI usam um sentinela (não uma lista) quando não há contexto
+    contexto = getattr(tarefa, "context", None)
+    return list(contexto) if isinstance(contexto, (list, tuple)) else []
+
+
+def ordenar_tarefas(tarefas: list) -> list:
+    """Ordem topológica das tarefas; ValueError se houver ciclo ou dependência fora da lista."""
+    posicao = {id(t): i for i, t in enumerate(tarefas)}
+    pendentes = {}
+    for tarefa in tarefas:
+        dependencias = dependencias_de(tarefa)
+        for dependencia in dependencias:
+            if id(dependencia) not in posicao:
+                raise ValueError(f"A tarefa '{_nome(tarefa)}' depende de '{_nome(dependencia)}', "
+                                 "que não está na lista de tarefas")
+        pendentes[id(tarefa)] = {id(d) for d in dependencias}
+
+    ordem = []
+    prontas = [t for t in tarefas if not pendentes[id(t)]]
+    while prontas:
+        tarefa = prontas.pop(0)
+        ordem.append(tarefa)
+        for outra in tarefas:
+            dependencias = pendentes[id(outra)]
+            if id(tarefa) in dependencias:
+                dependencias.discard(id(tarefa))
+                if not dependencias:
+                    prontas.append(outra)
+    if len(ordem) != len(tarefas):
+        ciclo = [_nome(t) for t in tarefas if pendentes[id(t)]]
+        raise ValueError(f"Dependências circulares entre as tarefas: {ciclo}")
+    return ordem
+
+
+def _nome(tarefa) -> str:
+    return (getattr(tarefa, "name", None) or str(getattr(tarefa, "description", tarefa)))[:60]
+
+
+class ExecutorEmGrafo:
+    """
+    Executa `tarefas` (Tasks do CrewAI com agente definido) respeitando o `context` de
+    cada uma, com no máximo `max_simultaneas` tarefas em execução ao mesmo tempo.
+    """
+
+    def __init__(self, tarefas: list, max_simultaneas: int = MAX_TAREFAS_SIMULTANEAS, rastreador=None):
+        self.declaradas = list(tarefas)
+        self.tarefas = ordenar_tarefas(self.declaradas)
+        self.max_simultaneas = max_simultaneas
+        self.rastreador = rastreador or obter_rastreador()
+        self.duracoes = {}
+        self.ultimo_resumo = {}
+
+    def _executar_tarefa(self, tarefa, contexto: str | None):
+        """Roda em uma thread: o CrewAI executa o agente (e suas ferramentas) de forma síncrona."""
+        with self.rastreador.etapa("tarefa da crew", tarefa=_nome(tarefa),
+                                   agente=str(getattr(tarefa.agent, "role", ""))) as etapa:
+            saida = tarefa.execute_sync(agent=tarefa.agent, context=contexto)
+            etapa["tokens"] = len(str(saida.raw).split())
+        return saida
+
+    async def executar(self) -> list:
+        """Saídas (TaskOutput) na ordem em que as tarefas foram declaradas."""
+        semaforo = asyncio.Semaphore(self.max_simultaneas)
+        travas_agente = {}
+        agendadas = {}
+        self.duracoes = {}
+        inicio = time.perf_counter()
+
+        async def rodar(tarefa):
+            dependencias = dependencias_de(tarefa)
+            saidas = [await agendadas[id(d)] for d in dependencias]
+            contexto = SEPARADOR_CONTEXTO.join(str(s.raw) for s in saidas) if saidas else None
+            trava = travas_agente.setdefault(id(tarefa.agent), asyncio.Lock())
+            async with trava, semaforo:
+                comeco = time.perf_counter()
+                saida = await asyncio.to_thread(self._executar_tarefa, tarefa, contexto)
+                self.duracoes[id(tarefa)] = time.perf_counter() - comeco
+            return saida
+
+        # Em ordem topológica, as dependências de cada tarefa já estão agendadas
+        for tarefa in self.tarefas:
+            agendadas[id(tarefa)] = asyncio.ensure_future(rodar(tarefa))
+        try:
+            await asyncio.gather(*agendadas.values())
+        except BaseException:
+            for futuro in agendadas.values():
+                futuro.cancel()
+            raise
+
+        self.ultimo_resumo = {
+            "tempo_total": time.perf_counter() - inicio,
+            "soma_das_tarefas": sum(self.duracoes.values()),
+            "caminho_critico": self.caminho_critico(),
+        }
+        return [agendadas[id(t)].result() for t in self.declaradas]
+
+    def caminho_critico(self) -> float:
+        """Maior soma de durações ao longo de uma cadeia de dependências da última execução."""
+        termino = {}
+        for tarefa in self.tarefas:
+            anteriores = [termino[id(d)] for d in dependencias_de(tarefa)]
+            termino[id(tarefa)] = max(anteriores, default=0.0) + self.duracoes.get(id(tarefa), 0.0)
+        return max(termino.values(), default=0.0)
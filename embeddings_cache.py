@@ -0,0 +1,143 @@
+# --- CLIENTE DE EMBEDDINGS EM LOTE COM CACHE PERSISTENTE ---
+# Substitui o OllamaEmbeddings: envia os textos em lotes de tamanho configurável,
+# com um número limitado de requisições simultâneas ao endpoint local do Ollama,
+# e guarda cada vetor em um cache SQLite chaveado por (modelo, hash do texto).
+# Assim, o mesmo chunk ou a mesma pergunta nunca são enviados duas vezes.
+#
+# O /api/embed devolve vetores normalizados, ao contrário do /api/embeddings usado
+# pelo OllamaEmbeddings do langchain_community (que ainda prefixava "passage: " e
+# "query: "). Vetores dos dois não podem ser comparados: `identificador` nomeia o
+# espaço vetorial e a ingestão o grava no manifesto para recalcular o índice quando
+# ele muda.
+import os
+import json
+import array
+import sqlite3
+import hashlib
+import asyncio
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+from recursos import reabrir_apos_fork, manter_herdada
+
+OLLAMA_URL_PADRAO = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+CACHE_EMBEDDINGS_PADRAO = "embeddings_cache.db"
+
+
+class CacheDeEmbeddings:
+    """Cache em disco (SQLite) de vetores, chaveado por modelo + hash do texto."""
+
+    def __init__(self, caminho: str = CACHE_EMBEDDINGS_PADRAO):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._conexao = self._conectar()
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (chave TEXT PRIMARY KEY, vetor BLOB NOT NULL)"
+        )
+        self._conexao.commit()
+        reabrir_apos_fork(self)
+
+    def _conectar(self) -> sqlite3.Connection:
+        conexao = sqlite3.connect(self.caminho, check_same_thread=False)
+        conexao.execute("PRAGMA synchronous=NORMAL")
+        return conexao
+
+    def _apos_fork(self) -> None:
+        self._lock = threading.Lock()
+        manter_herdada(self._conexao)
+        self._conexao = self._conectar()
+
+    @staticmethod
+    def chave(modelo: str, texto: str) -> str:
+        return hashlib.sha256(f"{modelo}\x00{texto}".encode("utf-8")).hexdigest()
+
+    def buscar(self, chaves: list[str]) -> dict:
+        encontrados = {}
+        with self._lock:
+            # O SQLite limita o número de parâmetros por consulta
+            for i in range(0, len(chaves), 500):
+                parte = chaves[i:i + 500]
+                marcadores = ",".join("?" * len(parte))
+                for chave, blob in self._conexao.execute(
+                    f"SELECT chave, vetor FROM embeddings WHERE chave IN ({marcadores})", parte
+                ):
+                    encontrados[chave] = array.array("f", blob).tolist()
+        return encontrados
+
+    def guardar(self, itens: dict) -> None:
+        with self._lock:
+            self._conexao.executemany(
+                "INSERT OR REPLACE INTO embeddings (chave, vetor) VALUES (?, ?)",
+                [(chave, array.array("f", vetor).tobytes()) for chave, vetor in itens.items()],
+            )
+            self._conexao.commit()
+
+
+class OllamaEmbeddingsEmCache(Embeddings):
+    """
+    Embeddings do Ollama (/api/embed) com lotes, concorrência limitada e cache em disco.
+    `base_url` pode apontar para um servidor falso local nos testes.
+    """
+
+    def __init__(self, model: str = "nomic-embed-text", base_url: str = OLLAMA_URL_PADRAO,
+                 tamanho_lote: int = 32, max_concorrencia: int = 4,
+                 caminho_cache: str | None = CACHE_EMBEDDINGS_PADRAO, timeout: float = 120.0):
+        self.model = model
+        self.identificador = f"ollama:{model}:/api/embed"
+        self.base_url = base_url.rstrip("/")
+        self.tamanho_lote = tamanho_lote
+        self.max_concorrencia = max_concorrencia
+        self.timeout = timeout
+        self.cache = CacheDeEmbeddings(caminho_cache) if caminho_cache else None
+        self._pool = ThreadPoolExecutor(max_workers=max_concorrencia)
+        reabrir_apos_fork(self)
+
+    def _apos_fork(self) -> None:
+        """As threads do pool não sobrevivem ao fork; o processo filho cria as suas."""
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concorrencia)
+
+    def _requisitar_lote(self, textos: list[str]) -> list[list[float]]:
+        corpo = json.dumps({"model": self.model, "input": textos}).encode("utf-8")
+        requisicao = urllib.request.Request(
+            f"{self.base_url}/api/embed", data=corpo, headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(requisicao, timeout=self.timeout) as resposta:
+            dados = json.loads(resposta.read())
+        return dados["embeddings"]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        chaves = [CacheDeEmbeddings.chave(self.model, texto) for texto in texts]
+        vetores = self.cache.buscar(list(set(chaves))) if self.cache else {}
+
+        # Textos repetidos dentro da mesma chamada também são enviados uma única vez
+        pendentes = {}
+        for chave, texto in zip(chaves, texts):
+            if chave not in vetores:
+                pendentes.setdefault(chave, texto)
+
+        if pendentes:
+            chaves_pendentes = list(pendentes)
+            lotes = [chaves_pendentes[i:i + self.tamanho_lote]
+                     for i in range(0, len(chaves_pendentes), self.tamanho_lote)]
+            resultados = self._pool.map(
+                lambda lote: self._requisitar_lote([pendentes[chave] for chave in lote]), lotes
+            )
+            novos = {}
+            for lote, embeddings_lote in zip(lotes, resultados):
+                novos.update(zip(lote, embeddings_lote))
+            if self.cache:
+                self.cache.guardar(novos)
+            vetores.update(novos)
+
+        return [vetores[chave] for chave in chaves]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await asyncio.to_thread(self.embed_query, text)
@@ -0,0 +1,162 @@
+# --- EXPANSÃO ADAPTATIVA DE PERGUNTAS ---
+# A expansão pelo LLM custa uma geração inteira antes da recuperação. Aqui:
+# - a primeira recuperação usa só a pergunta original;
+# - se o melhor score do re-ranker já passa do limiar de confiança, a expansão
+#   é dispensada e o LLM nem é chamado; só abaixo do limiar a pergunta é
+#   expandida e a busca refeita com as variações;
+# - a primeira busca não roda em paralelo com a expansão: disparar o LLM junto
+#   economizaria a espera só nas perguntas abaixo do limiar, mas nas que passam
+#   (a maioria) a geração seria paga e jogada fora: uma thread em execução não
+#   pode ser cancelada, e a chamada ocuparia o Ollama, atrasando as gerações das
+#   outras requisições;
+# - as expansões ficam em cache por pergunta normalizada;
+# - o modo "local" troca o LLM por variações baratas (palavras-chave e sinônimos).
+import re
+import asyncio
+import threading
+import unicodedata
+from collections import OrderedDict
+from telemetria import obter_rastreador
+from recursos import reabrir_apos_fork
+
+MODOS_EXPANSAO = ("llm", "adaptativo", "local", "nenhuma")
+LIMIAR_CONFIANCA_PADRAO = 0.8
+
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "uns", "umas", "de", "da", "do", "das", "dos", "em", "na", "no",
+    "nas", "nos", "por", "para", "com", "sem", "sobre", "e", "ou", "que", "qual", "quais", "quem",
+    "como", "quando", "onde", "se", "é", "são", "foi", "há", "ao", "aos", "à", "às", "pela", "pelo",
+    "pelas", "pelos", "seu", "sua", "seus", "suas", "existe", "existem", "possui", "tem",
+}
+
+# Sinônimos frequentes nas perguntas sobre o relatório de governança
+SINONIMOS = {
+    "empresa": ["companhia"],
+    "companhia": ["empresa"],
+    "conselho": ["conselho de administração"],
+    "diretoria": ["diretoria executiva"],
+    "diretores": ["administradores"],
+    "acionistas": ["investidores"],
+    "remuneração": ["compensação"],
+    "política": ["diretriz"],
+    "regras": ["normas"],
+    "código de conduta": ["código de ética"],
+    "auditoria": ["comitê de auditoria"],
+    "riscos": ["gerenciamento de riscos"],
+    "independente": ["independência"],
+}
+
+# Termos mais longos primeiro, para "código de conduta" ganhar de termos contidos nele
+_PADRAO_SINONIMOS = re.compile(
+    r"\b(" + "|".join(re.escape(t) for t in sorted(SINONIMOS, key=len, reverse=True)) + r")\b"
+)
+
+
+def normalizar_pergunta(pergunta: str) -> str:
+    texto = unicodedata.normalize("NFKC", pergunta).lower().strip()
+    texto = re.sub(r"\s+", " ", texto)
+    return texto.rstrip(" ?!.")
+
+
+def expandir_localmente(pergunta: str) -> list[str]:
+    """Variações sem LLM: só as palavras-chave e a pergunta com sinônimos trocados."""
+    normalizada = normalizar_pergunta(pergunta)
+    variacoes = []
+    palavras_chave = " ".join(p for p in re.findall(r"\w+", normalizada) if p not in STOPWORDS)
+    if palavras_chave and palavras_chave != normalizada:
+        variacoes.append(palavras_chave)
+    # Uma única passada, para que "empresa" -> "companhia" não volte a ser "empresa"
+    com_sinonimos = _PADRAO_SINONIMOS.sub(lambda m: SINONIMOS[m.group(0)][0], normalizada)
+    if com_sinonimos != normalizada:
+        variacoes.append(com_sinonimos)
+    return [pergunta] + variacoes
+
+
+class ExpansorAdaptativo:
+    """
+    Decide se e como expandir a pergunta. `expandir_com_llm(pergunta)` deve devolver a
+    lista de perguntas (a original primeiro), como expandir_pergunta em rag_app.py.
+    """
+
+    def __init__(self, expandir_com_llm, modo: str = "adaptativo",
+                 limiar_confianca: float = LIMIAR_CONFIANCA_PADRAO, tamanho_cache: int = 1024):
+        if modo not in MODOS_EXPANSAO:
+            raise ValueError(f"Modo de expansão desconhecido: {modo!r}. Use um de {MODOS_EXPANSAO}.")
+        self.expandir_com_llm = expandir_com_llm
+        self.modo = modo
+        self.limiar_confianca = limiar_confianca
+        self.tamanho_cache = tamanho_cache
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        reabrir_apos_fork(self)
+        self.expansoes_evitadas = 0
+
+    def _buscar_no_cache(self, chave: str):
+        with self._lock:
+            if chave in self._cache:
+                self._cache.move_to_end(chave)
+                return self._cache[chave]
+        return None
+
+    def _guardar_no_cache(self, chave: str, perguntas: list[str]) -> None:
+        with self._lock:
+            self._cache[chave] = perguntas
+            while len(self._cache) > self.tamanho_cache:
+                self._cache.popitem(last=False)
+
+    def _apos_fork(self) -> None:
+        """Um lock herdado no meio do fork pode ficar preso; o processo filho cria o seu."""
+        self._lock = threading.Lock()
+
+    def expandir(self, pergunta: str) -> list[str]:
+        """Expansão pelo modo configurado, com cache por pergunta normalizada."""
+        if self.modo == "nenhuma":
+            return [pergunta]
+        with obter_rastreador().etapa("expansão", modo=self.modo) as etapa:
+            if self.modo == "local":
+                perguntas = expandir_localmente(pergunta)
+            else:
+                chave = normalizar_pergunta(pergunta)
+                perguntas = self._buscar_no_cache(chave)
+                etapa["acertos_cache" if perguntas is not None else "falhas_cache"] = 1
+                if perguntas is None:
+                    perguntas = [p for p in self.expandir_com_llm(pergunta) if p.strip()]
+                    self._guardar_no_cache(chave, perguntas)
+            etapa["perguntas"] = len(perguntas)
+        return perguntas
+
+    def _registrar_expansao_evitada(self) -> None:
+        self.expansoes_evitadas += 1
+        obter_rastreador().registro.incrementar("rag_expansoes_evitadas_total", 1,
+                                                "Expansões pelo LLM dispensadas pelo modo adaptativo")
+
+    def recuperar(self, pergunta: str, recuperar, reranquear) -> tuple[list[str], list]:
+        """
+        Executa expansão, recuperação e re-ranking. `recuperar(perguntas)` devolve os
+        candidatos e `reranquear(candidatos)` devolve [(Document, score)] em ordem.
+        Retorna (perguntas usadas na busca, documentos re-rankeados).
+        """
+        if self.modo != "adaptativo" or self._buscar_no_cache(normalizar_pergunta(pergunta)) is not None:
+            perguntas = self.expandir(pergunta)
+            return perguntas, reranquear(recuperar(perguntas))
+
+        # O LLM só é chamado se a pergunta original não bastar
+        primeira = reranquear(recuperar([pergunta]))
+        if primeira and primeira[0][1] >= self.limiar_confianca:
+            self._registrar_expansao_evitada()
+            return [pergunta], primeira
+        perguntas = self.expandir(pergunta)
+        return perguntas, reranquear(recuperar(perguntas))
+
+    async def arecuperar(self, pergunta: str, recuperar, reranquear) -> tuple[list[str], list]:
+        """Versão assíncrona de `recuperar`: `recuperar` e `reranquear` são corrotinas."""
+        if self.modo != "adaptativo" or self._buscar_no_cache(normalizar_pergunta(pergunta)) is not None:
+            perguntas = await asyncio.to_thread(self.expandir, pergunta)
+            return perguntas, await reranquear(await recuperar(perguntas))
+
+        primeira = await reranquear(await recuperar([pergunta]))
+        if primeira and primeira[0][1] >= self.limiar_confianca:
+            self._registrar_expansao_evitada()
+            return [pergunta], primeira
+        perguntas = await asyncio.to_thread(self.expandir, pergunta)
+        return perguntas, await reranquear(await recuperar(perguntas))
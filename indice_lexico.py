@@ -0,0 +1,177 @@
+# --- ÍNDICE LÉXICO (BM25) PERSISTENTE ---
+# A busca densa sozinha é fraca para termos exatos (números de artigos, siglas como
+# CBGC) e cara de alargar. Este índice invertido é montado na ingestão e salvo em
+# faiss_index/lexico.npz, ao lado do índice vetorial:
+# - tokenização em português: minúsculas, sem acentos, sem stopwords e com um
+#   radicalizador leve (plurais e sufixos comuns), mantendo números e siglas;
+# - postings compactas: para cada termo, os índices dos chunks em deltas uint32 e
+#   as frequências em uint16, tudo em arrays contíguos;
+# - consultas pontuadas com BM25 em NumPy. A fusão com os scores vetoriais é feita
+#   em recuperacao.py.
+import os
+import re
+import hashlib
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+import numpy as np
+from expansao import STOPWORDS
+
+ARQUIVO_LEXICO = "lexico.npz"
+K1_PADRAO = 1.2
+B_PADRAO = 0.75
+
+
+def remover_acentos(texto: str) -> str:
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+_STOPWORDS = {remover_acentos(p) for p in STOPWORDS}
+_PLURAIS = [("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ois", "ol"), ("ns", "m"),
+            ("res", "r"), ("s", "")]
+# Mais longos primeiro; aplicado no máximo um sufixo por palavra
+_SUFIXOS = sorted(["amento", "imento", "acao", "icao", "idade", "mente", "ancia", "encia", "ismo", "ista",
+                   "avel", "ivel", "ador", "edor", "ora", "ivo", "iva", "ico", "ica", "oso", "osa"],
+                  key=len, reverse=True)
+
+
+@lru_cache(maxsize=100_000)
+def radical(palavra: str) -> str:
+    """Radicalizador leve para português (sem acentos): plural e, depois, um sufixo."""
+    if len(palavra) <= 4 or not palavra.isalpha():
+        return palavra
+    for sufixo, troca in _PLURAIS:
+        if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= 3:
+            palavra = palavra[:-len(sufixo)] + troca
+            break
+    for sufixo in _SUFIXOS:
+        if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= 3:
+            return palavra[:-len(sufixo)]
+    return palavra
+
+
+def tokenizar(texto: str) -> list[str]:
+    palavras = re.findall(r"[a-z0-9]+", remover_acentos(texto.lower()))
+    return [radical(p) for p in palavras if p not in _STOPWORDS and (len(p) > 1 or p.isdigit())]
+
+
+def assinatura_dos_ids(doc_ids) -> str:
+    """Identifica o conjunto de chunks indexado, para saber se o índice léxico está atualizado."""
+    h = hashlib.sha256()
+    for doc_id in sorted(doc_ids):
+        h.update(str(doc_id).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class IndiceLexico:
+    """Índice invertido com pontuação BM25 sobre os chunks, identificados pelo doc_id do vector store."""
+
+    def __init__(self, vocabulario: np.ndarray, inicio: np.ndarray, docs: np.ndarray, tfs: np.ndarray,
+                 comprimentos: np.ndarray, doc_ids: np.ndarray, assinatura: str,
+                 k1: float = K1_PADRAO, b: float = B_PADRAO):
+        self.vocabulario = vocabulario
+        self.inicio = inicio
+        self.docs = docs
+        self.tfs = tfs
+        self.comprimentos = comprimentos
+        self.doc_ids = doc_ids
+        self.assinatura = assinatura
+        self.k1 = k1
+        self.b = b
+        self._posicao = {termo: i for i, termo in enumerate(vocabulario.tolist())}
+        total = len(doc_ids)
+        media = float(comprimentos.mean()) if total else 1.0
+        # Parte do denominador do BM25 que só depende do chunk, calculada uma vez
+        self._normalizacao = (k1 * (1 - b + b * comprimentos / (media or 1.0))).astype("float32")
+        df = np.diff(inicio)
+        self._idf = np.log1p((total - df + 0.5) / (df + 0.5)).astype("float32")
+
+    @classmethod
+    def construir(cls, documentos, **kwargs) -> "IndiceLexico":
+        """Monta o índice a partir de pares (doc_id, Document)."""
+        postings = {}
+        doc_ids, comprimentos = [], []
+        for posicao, (doc_id, doc) in enumerate(documentos):
+            tokens = tokenizar(doc.page_content)
+            doc_ids.append(str(doc_id))
+            comprimentos.append(len(tokens))
+            for termo, frequencia in Counter(tokens).items():
+                postings.setdefault(termo, []).append((posicao, frequencia))
+
+        vocabulario = sorted(postings)
+        inicio = np.zeros(len(vocabulario) + 1, dtype="int64")
+        inicio[1:] = np.cumsum([len(postings[t]) for t in vocabulario])
+        docs = np.empty(inicio[-1], dtype="uint32")
+        tfs = np.empty(inicio[-1], dtype="uint16")
+        for i, termo in enumerate(vocabulario):
+            posicoes, frequencias = zip(*postings[termo])
+            # Posições crescentes guardadas como diferenças: valores pequenos, bons para compressão
+            docs[inicio[i]:inicio[i + 1]] = np.diff(posicoes, prepend=0)
+            tfs[inicio[i]:inicio[i + 1]] = np.minimum(frequencias, np.iinfo("uint16").max)
+        return cls(np.array(vocabulario, dtype=str), inicio, docs, tfs,
+                   np.array(comprimentos, dtype="uint32"), np.array(doc_ids, dtype=str),
+                   assinatura_dos_ids(doc_ids), **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def pontuar(self, pergunta: str) -> np.ndarray:
+        """Score BM25 da pergunta para cada chunk (zero para os que não contêm nenhum termo)."""
+        scores = np.zeros(len(self.doc_ids), dtype="float32")
+        for termo in set(tokenizar(pergunta)):
+            i = self._posicao.get(termo)
+            if i is None:
+                continue
+            a, b = self.inicio[i], self.inicio[i + 1]
+            docs = np.cumsum(self.docs[a:b], dtype="int64")
+            tfs = self.tfs[a:b].astype("float32")
+            scores[docs] += self._idf[i] * tfs * (self.k1 + 1) / (tfs + self._normalizacao[docs])
+        return scores
+
+    def mascara(self, doc_ids) -> np.ndarray:
+        """Posições dos chunks com os doc_ids dados, para restringir buscar(..., mascara=...)."""
+        return np.isin(self.doc_ids, np.asarray(list(doc_ids), dtype=str))
+
+    def buscar(self, pergunta: str, k: int, mascara: np.ndarray | None = None) -> tuple[list[str], np.ndarray]:
+        """Retorna (doc_ids, scores) dos k chunks com maior BM25, em ordem decrescente."""
+        scores = self.pontuar(pergunta)
+        if mascara is not None:
+            scores[~mascara] = 0
+        candidatos = np.flatnonzero(scores)
+        if len(candidatos) > k:
+            candidatos = candidatos[np.argpartition(-scores[candidatos], k - 1)[:k]]
+        candidatos = candidatos[np.argsort(-scores[candidatos], kind="stable")]
+        return self.doc_ids[candidatos].tolist(), scores[candidatos]
+
+    def buscar_em_lote(self, perguntas: list[str], k: int,
+                       mascara: np.ndarray | None = None) -> list[tuple[list[str], np.ndarray]]:
+        return [self.buscar(pergunta, k, mascara) for pergunta in perguntas]
+
+    def salvar(self, pasta: str) -> None:
+        os.makedirs(pasta, exist_ok=True)
+        caminho = os.path.join(pasta, ARQUIVO_LEXICO)
+        temporario = caminho + ".tmp"
+        with open(temporario, "wb") as f:
+            np.savez(f, vocabulario=self.vocabulario, inicio=self.inicio, docs=self.docs, tfs=self.tfs,
+                     comprimentos=self.comprimentos, doc_ids=self.doc_ids, assinatura=np.array(self.assinatura))
+        os.replace(temporario, caminho)
+
+    @staticmethod
+    def assinatura_salva(pasta: str) -> str | None:
+        """Lê só a assinatura do arquivo salvo (np.load carrega cada array sob demanda)."""
+        caminho = os.path.join(pasta, ARQUIVO_LEXICO)
+        if not os.path.exists(caminho):
+            return None
+        with np.load(caminho, allow_pickle=False) as dados:
+            return str(dados["assinatura"])
+
+    @classmethod
+    def carregar(cls, pasta: str, **kwargs) -> "IndiceLexico | None":
+        caminho = os.path.join(pasta, ARQUIVO_LEXICO)
+        if not os.path.exists(caminho):
+            return None
+        with np.load(caminho, allow_pickle=False) as dados:
+            return cls(dados["vocabulario"], dados["inicio"], dados["docs"], dados["tfs"],
+                       dados["comprimentos"], dados["doc_ids"], str(dados["assinatura"]), **kwargs)
@@ -0,0 +1,248 @@
+# --- ÍNDICE DE METADADOS DOS CHUNKS ---
+# Os chunks só guardavam source e page, dentro do docstore, e toda busca percorria
+# o corpus inteiro. Com vários informes (um por ano), perguntas como "o que o
+# Conselho fez em 2024" deveriam olhar só uma parte dos vetores. Aqui:
+# - na ingestão, cada chunk recebe documento, ano, seção e página, gravados em
+#   faiss_index/metadados.sqlite ao lado dos índices vetorial e léxico;
+# - o ano vem do nome do arquivo ("Informe CBGC 2024.pdf") ou, se não houver, do
+#   texto da primeira página; a seção é o último título "Capítulo N - ..." visto
+#   no arquivo, e vale desde o início da página em que aparece;
+# - `ids(filtro)` resolve filtros como {"ano": 2024, "secao": "Conselho"} em
+#   doc_ids com uma consulta SQL; recuperacao.py busca só nos vetores desses chunks.
+# Seção e documento casam por trecho, sem acentos e sem diferenciar maiúsculas.
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import defaultdict
+from indice_lexico import remover_acentos, assinatura_dos_ids
+from recursos import reabrir_apos_fork, manter_herdada
+
+ARQUIVO_METADADOS = "metadados.sqlite"
+CAMPOS = ("documento", "ano", "secao", "pagina")
+_CAMPOS_INTEIROS = ("ano", "pagina")
+_COLUNAS_NORMALIZADAS = {"documento": "documento_normalizado", "secao": "secao_normalizada"}
+
+_TITULO_SECAO = re.compile(r"^\s*cap[ií]tulo\s+\d+\s*[-–—:.]\s*(.+?)\s*$", re.IGNORECASE | re.MULTILINE)
+_ANO = re.compile(r"(?<!\d)(19[5-9]\d|20\d\d)(?!\d)")
+# Filtros digitados antes da pergunta: ano:2024 secao:"Conselho de Administração" ...
+_FILTRO_NO_TEXTO = re.compile(r'^\s*(\w+)\s*[:=]\s*(?:"([^"]*)"|(\S+))')
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sem acentos (e sem ligaduras como 'ﬁ') e com espaços simples."""
+    return " ".join(remover_acentos(texto).lower().split())
+
+
+def documento_e_ano(source: str) -> tuple[str, int | None]:
+    """('Informe CBGC', 2024) para 'docs/Informe CBGC 2024.pdf'; ano None se o nome não tiver."""
+    nome = os.path.splitext(os.path.basename(source))[0]
+    anos = _ANO.findall(nome)
+    if not anos:
+        return nome.strip(), None
+    documento = " ".join(_ANO.sub(" ", nome).split()).strip(" -_")
+    return documento or nome, int(anos[-1])
+
+
+def titulo_de_secao(texto: str) -> str | None:
+    """Primeiro título de capítulo do texto, com quebras de linha e ligaduras ('ﬁ') do PDF desfeitas."""
+    encontrado = _TITULO_SECAO.search(texto)
+    return unicodedata.normalize("NFKC", " ".join(encontrado.group(1).split())) if encontrado else None
+
+
+def extrair_metadados(documentos):
+    """
+    Gera (doc_id, {documento, ano, secao, pagina}) a partir de pares (doc_id, Document).
+    Os chunks são ordenados por arquivo, página e posição para a seção seguir a ordem do texto.
+    """
+    por_arquivo = defaultdict(list)
+    textos_iniciais = defaultdict(list)
+    for doc_id, doc in documentos:
+        source = str(doc.metadata.get("source", ""))
+        pagina = int(doc.metadata.get("page", 0) or 0)
+        por_arquivo[source].append((pagina, doc.metadata.get("start_index") or 0, str(doc_id),
+                                    titulo_de_secao(doc.page_content)))
+        if pagina == 0:
+            textos_iniciais[source].append(doc.page_content)
+
+    for source, chunks in por_arquivo.items():
+        documento, ano = documento_e_ano(source)
+        if ano is None:
+            anos = _ANO.findall(" ".join(textos_iniciais[source]))
+            ano = int(anos[0]) if anos else None
+        chunks.sort()
+        # O título do capítulo pode estar no meio da página, mas o cabeçalho da página já é o do capítulo novo
+        titulos_por_pagina = {}
+        for pagina, _, _, titulo in chunks:
+            if titulo and pagina not in titulos_por_pagina:
+                titulos_por_pagina[pagina] = titulo
+        secao = None
+        for pagina, _, doc_id, _ in chunks:
+            secao = titulos_por_pagina.get(pagina, secao)
+            yield doc_id, {"documento": documento, "ano": ano, "secao": secao, "pagina": pagina}
+
+
+def separar_filtro(texto: str) -> tuple[dict, str]:
+    """
+    Separa os filtros escritos antes da pergunta: 'ano:2024 secao:Conselho Quem preside?'
+    vira ({"ano": 2024, "secao": "Conselho"}, "Quem preside?"). Valores com espaços vão
+    entre aspas; vírgulas ou o mesmo campo repetido aceitam mais de um valor.
+    """
+    filtro = {}
+    while encontrado := _FILTRO_NO_TEXTO.match(texto):
+        campo = normalizar(encontrado.group(1))
+        if campo not in CAMPOS:
+            break
+        valores = [v.strip() for v in (encontrado.group(2) if encontrado.group(2) is not None
+                                       else encontrado.group(3)).split(",") if v.strip()]
+        if campo in _CAMPOS_INTEIROS:
+            if not all(v.isdigit() for v in valores):
+                break
+            valores = [int(v) for v in valores]
+        filtro.setdefault(campo, []).extend(valores)
+        texto = texto[encontrado.end():]
+    return {c: v[0] if len(v) == 1 else v for c, v in filtro.items()}, texto.strip()
+
+
+def validar_filtro(filtro) -> dict:
+    """
+    Confere um filtro vindo de fora (ex.: o JSON do servidor): campos de CAMPOS, inteiros
+    em ano e página, texto em documento e seção; cada um com um valor ou uma lista não vazia.
+    Levanta ValueError com a explicação do problema.
+    """
+    if not isinstance(filtro, dict):
+        raise ValueError("O filtro deve ser um objeto, como {\"ano\": 2024, \"secao\": \"Conselho\"}.")
+    for campo, valor in filtro.items():
+        if campo not in CAMPOS:
+            raise ValueError(f"Campo de filtro desconhecido: {campo!r}. Use um de {list(CAMPOS)}.")
+        valores = valor if isinstance(valor, list) else [valor]
+        tipo, nome_tipo = (int, "inteiros") if campo in _CAMPOS_INTEIROS else (str, "texto")
+        if not valores or not all(isinstance(v, tipo) and not isinstance(v, bool) for v in valores):
+            raise ValueError(f"Os valores de {campo!r} devem ser {nome_tipo} (um valor ou uma lista).")
+    return filtro
+
+
+def chave_do_filtro(filtro: dict) -> tuple:
+    """Forma canônica do filtro, usada como chave de cache."""
+    chave = []
+    for campo in sorted(filtro):
+        valores = filtro[campo] if isinstance(filtro[campo], (list, tuple, set)) else [filtro[campo]]
+        if campo not in _CAMPOS_INTEIROS:
+            valores = [normalizar(str(v)) for v in valores]
+        chave.append((campo, tuple(sorted(set(valores)))))
+    return tuple(chave)
+
+
+class IndiceMetadados:
+    """Metadados por chunk (doc_id do vector store) em SQLite, consultáveis por documento, ano, seção e página."""
+
+    def __init__(self, conexao: sqlite3.Connection, caminho: str | None = None):
+        self.caminho = caminho
+        self._conexao = conexao
+        self._lock = threading.Lock()
+        if caminho is not None:
+            reabrir_apos_fork(self)
+
+    def _apos_fork(self) -> None:
+        self._lock = threading.Lock()
+        manter_herdada(self._conexao)
+        self._conexao = self._conectar(self.caminho)
+
+    @staticmethod
+    def _conectar(caminho: str) -> sqlite3.Connection:
+        return sqlite3.connect(f"file:{caminho}?mode=ro", uri=True, check_same_thread=False)
+
+    @classmethod
+    def construir(cls, documentos) -> "IndiceMetadados":
+        """Monta o índice (em memória) a partir de pares (doc_id, Document)."""
+        conexao = sqlite3.connect(":memory:", check_same_thread=False)
+        conexao.execute(
+            "CREATE TABLE chunks (doc_id TEXT PRIMARY KEY, documento TEXT NOT NULL, ano INTEGER,"
+            " secao TEXT, pagina INTEGER NOT NULL, documento_normalizado TEXT NOT NULL,"
+            " secao_normalizada TEXT) WITHOUT ROWID"
+        )
+        conexao.execute("CREATE TABLE info (chave TEXT PRIMARY KEY, valor TEXT NOT NULL)")
+        doc_ids = []
+        linhas = []
+        for doc_id, meta in extrair_metadados(documentos):
+            doc_ids.append(doc_id)
+            linhas.append((doc_id, meta["documento"], meta["ano"], meta["secao"], meta["pagina"],
+                           normalizar(meta["documento"]), normalizar(meta["secao"]) if meta["secao"] else None))
+        conexao.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)", linhas)
+        # Seção e documento casam por trecho (LIKE '%...%'), que não usa índice; a tabela é pequena
+        for campo in _CAMPOS_INTEIROS:
+            conexao.execute(f"CREATE INDEX chunks_{campo} ON chunks ({campo})")
+        conexao.execute("INSERT INTO info VALUES ('assinatura', ?)", (assinatura_dos_ids(doc_ids),))
+        conexao.commit()
+        return cls(conexao)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conexao.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    @property
+    def assinatura(self) -> str:
+        with self._lock:
+            return self._conexao.execute("SELECT valor FROM info WHERE chave = 'assinatura'").fetchone()[0]
+
+    def ids(self, filtro: dict) -> list[str]:
+        """doc_ids dos chunks que atendem a todos os campos do filtro (qualquer um dos valores de cada campo)."""
+        condicoes, parametros = [], []
+        for campo, valores in chave_do_filtro(filtro):
+            if campo not in CAMPOS:
+                raise ValueError(f"Campo de filtro desconhecido: {campo!r}. Use um de {CAMPOS}.")
+            if campo in _CAMPOS_INTEIROS:
+                condicoes.append(f"{campo} IN ({','.join('?' * len(valores))})")
+                parametros.extend(int(v) for v in valores)
+            else:
+                condicoes.append("(" + " OR ".join([f"{_COLUNAS_NORMALIZADAS[campo]} LIKE ?"] * len(valores)) + ")")
+                parametros.extend(f"%{v}%" for v in valores)
+        onde = " AND ".join(condicoes) or "1"
+        with self._lock:
+            return [linha[0] for linha in self._conexao.execute(
+                f"SELECT doc_id FROM chunks WHERE {onde}", parametros)]
+
+    def valores(self, campo: str) -> list:
+        """Valores distintos de um campo, para mostrar quais filtros existem."""
+        if campo not in CAMPOS:
+            raise ValueError(f"Campo de filtro desconhecido: {campo!r}. Use um de {CAMPOS}.")
+        with self._lock:
+            return [linha[0] for linha in self._conexao.execute(
+                f"SELECT DISTINCT {campo} FROM chunks WHERE {campo} IS NOT NULL ORDER BY {campo}")]
+
+    def salvar(self, pasta: str) -> None:
+        os.makedirs(pasta, exist_ok=True)
+        caminho = os.path.join(pasta, ARQUIVO_METADADOS)
+        temporario = caminho + ".tmp"
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        destino = sqlite3.connect(temporario)
+        try:
+            with self._lock:
+                self._conexao.backup(destino)
+        finally:
+            destino.close()
+        os.replace(temporario, caminho)
+
+    @staticmethod
+    def assinatura_salva(pasta: str) -> str | None:
+        caminho = os.path.join(pasta, ARQUIVO_METADADOS)
+        if not os.path.exists(caminho):
+            return None
+        conexao = IndiceMetadados._conectar(caminho)
+        try:
+            linha = conexao.execute("SELECT valor FROM info WHERE chave = 'assinatura'").fetchone()
+        except sqlite3.DatabaseError:
+            return None
+        finally:
+            conexao.close()
+        return linha[0] if linha else None
+
+    @classmethod
+    def carregar(cls, pasta: str) -> "IndiceMetadados | None":
+        """Abre o índice salvo em modo somente leitura (None se a ingestão ainda não o criou)."""
+        caminho = os.path.join(pasta, ARQUIVO_METADADOS)
+        if not os.path.exists(caminho):
+            return None
+        return cls(cls._conectar(caminho), caminho)
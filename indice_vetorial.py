@@ -0,0 +1,588 @@
+# --- ÍNDICE VETORIAL COMPACTO (FAISS EM DISCO + DOCSTORE SQLITE) ---
+# Alternativa ao FAISS do LangChain (index.faiss + index.pkl), que é carregado
+# inteiro em memória e exige allow_dangerous_deserialization=True.
+#
+# - O índice pode ser plano, IVF ou HNSW, com quantização escalar (sq8) ou por
+#   produto (pq) opcional para reduzir a memória por vetor.
+# - Os vetores são gravados com faiss.write_index e, em modo somente leitura,
+#   mapeados em memória: vários processos compartilham as mesmas páginas pelo
+#   cache do sistema operacional em vez de cada um manter uma cópia. O IO_FLAG_MMAP
+#   só mapeia as listas invertidas do IVF; índices planos, sq8/pq e HNSW dentro
+#   do IndexIDMap2 são lidos para o heap com ele. Para esses é usado o
+#   IO_FLAG_MMAP_IFC (faiss >= 1.11), que mapeia os códigos dos vetores (e o grafo
+#   do HNSW). Medido com 100 mil vetores de 256 dimensões: plano com IO_FLAG_MMAP,
+#   +99 MB de memória anônima; com IO_FLAG_MMAP_IFC, +7 MB (o mapa de ids do
+#   IndexIDMap2 continua no heap, 8 bytes por vetor).
+# - Os chunks ficam em um SQLite (docstore.sqlite) lido sob demanda: a carga
+#   não precisa mais desserializar o docstore inteiro.
+# - save_local grava vetores e docstore em arquivos novos, com um sufixo de
+#   geração, e só então troca o indice.json (os.replace), que aponta para eles.
+#   Uma queda no meio da gravação deixa o índice anterior inteiro; os arquivos de
+#   gerações antigas são apagados depois da troca. Aberto para escrita, o docstore
+#   é copiado para a memória e só volta ao disco no save_local.
+#
+# Índices que precisam de treino (IVF e as quantizações) recebem os vetores em
+# uma área de espera plana até existirem vetores suficientes para treinar: 1000
+# para o IVF (ele precisa de ~39 vetores por lista), 256 para o pq e 100 para o
+# sq8, que só aprende o intervalo de cada dimensão. Corpora menores que isso
+# ficam na área de espera, que é um índice plano exato.
+import os
+import glob
+import json
+import uuid
+import sqlite3
+import threading
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from recursos import reabrir_apos_fork, manter_herdada
+
+ARQUIVO_CONFIG = "indice.json"
+ARQUIVO_VETORES = "vetores.faiss"
+ARQUIVO_ESPERA = "vetores_espera.faiss"
+ARQUIVO_DOCSTORE = "docstore.sqlite"
+VERSAO_INDICE = 1
+
+TIPOS_INDICE = ("flat", "ivf", "hnsw")
+QUANTIZACOES = (None, "sq8", "pq")
+MIN_TREINO_IVF = 1000
+MIN_TREINO_SQ8 = 100
+BITS_PQ = 8
+
+
+class DocstoreSQLite:
+    """Docstore em SQLite: cada chunk tem um id inteiro (o id no FAISS) e o id textual do LangChain."""
+
+    def __init__(self, caminho: str = ":memory:", somente_leitura: bool = False):
+        self.caminho = caminho
+        self.somente_leitura = somente_leitura
+        self._lock = threading.Lock()
+        self._conexao = self._conectar()
+        if caminho != ":memory:":
+            reabrir_apos_fork(self)
+        if somente_leitura:
+            return
+        if caminho != ":memory:":
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " doc_id TEXT NOT NULL UNIQUE,"
+            " conteudo TEXT NOT NULL,"
+            " metadados TEXT NOT NULL)"
+        )
+        self._conexao.commit()
+
+    @classmethod
+    def copia_em_memoria(cls, caminho: str) -> "DocstoreSQLite":
+        """Copia o docstore salvo para a memória: as edições só chegam ao disco no próximo save_local."""
+        docstore = cls()
+        origem = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+        try:
+            origem.backup(docstore._conexao)
+        finally:
+            origem.close()
+        return docstore
+
+    def _conectar(self) -> sqlite3.Connection:
+        if self.somente_leitura:
+            return sqlite3.connect(f"file:{self.caminho}?mode=ro", uri=True, check_same_thread=False)
+        return sqlite3.connect(self.caminho, check_same_thread=False)
+
+    def _apos_fork(self) -> None:
+        """Cada processo filho abre sua própria conexão com o arquivo do docstore."""
+        self._lock = threading.Lock()
+        manter_herdada(self._conexao)
+        self._conexao = self._conectar()
+
+    def total(self) -> int:
+        with self._lock:
+            return self._conexao.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def inserir(self, doc_ids: list[str], textos: list[str], metadatas: list[dict]) -> np.ndarray:
+        """Insere os chunks e retorna os ids inteiros atribuídos (nunca reaproveitados)."""
+        with self._lock:
+            linha = self._conexao.execute("SELECT seq FROM sqlite_sequence WHERE name = 'chunks'").fetchone()
+            inicio = (linha[0] if linha else 0) + 1
+            ids = np.arange(inicio, inicio + len(textos), dtype="int64")
+            self._conexao.executemany(
+                "INSERT INTO chunks (id, doc_id, conteudo, metadados) VALUES (?, ?, ?, ?)",
+                [(int(i), doc_id, texto, json.dumps(meta, ensure_ascii=False))
+                 for i, doc_id, texto, meta in zip(ids, doc_ids, textos, metadatas)],
+            )
+            self._conexao.commit()
+        return ids
+
+    def buscar(self, ids) -> dict:
+        """Retorna {id_inteiro: Document} apenas para os ids que ainda existem."""
+        ids = [int(i) for i in ids if i >= 0]
+        encontrados = {}
+        with self._lock:
+            for i in range(0, len(ids), 500):
+                parte = ids[i:i + 500]
+                marcadores = ",".join("?" * len(parte))
+                for id_int, doc_id, conteudo, metadados in self._conexao.execute(
+                    f"SELECT id, doc_id, conteudo, metadados FROM chunks WHERE id IN ({marcadores})", parte
+                ):
+                    encontrados[id_int] = Document(page_content=conteudo, metadata=json.loads(metadados), id=doc_id)
+        return encontrados
+
+    def ids_inteiros(self, doc_ids: list[str]) -> list[int]:
+        ids = []
+        with self._lock:
+            for i in range(0, len(doc_ids), 500):
+                parte = list(doc_ids[i:i + 500])
+                marcadores = ",".join("?" * len(parte))
+                ids.extend(linha[0] for linha in self._conexao.execute(
+                    f"SELECT id FROM chunks WHERE doc_id IN ({marcadores})", parte
+                ))
+        return ids
+
+    def mapear(self, doc_ids: list[str]) -> dict:
+        """Retorna {doc_id: id_inteiro} para os doc_ids que existem."""
+        mapa = {}
+        with self._lock:
+            for i in range(0, len(doc_ids), 500):
+                parte = list(doc_ids[i:i + 500])
+                marcadores = ",".join("?" * len(parte))
+                mapa.update(self._conexao.execute(
+                    f"SELECT doc_id, id FROM chunks WHERE doc_id IN ({marcadores})", parte
+                ))
+        return mapa
+
+    def remover(self, ids: list[int]) -> None:
+        with self._lock:
+            self._conexao.executemany("DELETE FROM chunks WHERE id = ?", [(int(i),) for i in ids])
+            self._conexao.commit()
+
+    def iterar(self):
+        """Gera (doc_id, Document) para todos os chunks, sem carregar a tabela inteira."""
+        cursor = self._conexao.cursor()
+        cursor.execute("SELECT doc_id, conteudo, metadados FROM chunks ORDER BY id")
+        for doc_id, conteudo, metadados in cursor:
+            yield doc_id, Document(page_content=conteudo, metadata=json.loads(metadados), id=doc_id)
+
+    def salvar(self, caminho: str) -> None:
+        """Copia o docstore para um arquivo novo em `caminho` (substituído se já existir)."""
+        if os.path.exists(caminho):
+            os.remove(caminho)
+        with self._lock:
+            self._conexao.commit()
+            destino = sqlite3.connect(caminho)
+            try:
+                self._conexao.backup(destino)
+            finally:
+                destino.close()
+
+
+def _flags_de_mmap(ivf: bool) -> int:
+    # IO_FLAG_MMAP só mapeia listas invertidas; o IO_FLAG_MMAP_IFC mapeia os códigos dos
+    # índices planos e do HNSW, mas não aceita o IVF. Sem ele (faiss < 1.11), vão para o heap.
+    if ivf:
+        return faiss.IO_FLAG_MMAP
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+def _apagar_geracoes_antigas(pasta: str, arquivos: dict) -> None:
+    """Remove vetores e docstores que o indice.json não aponta mais (incluindo os de gravações interrompidas)."""
+    em_uso = {nome for nome in arquivos.values() if nome}
+    candidatos = glob.glob(os.path.join(pasta, "vetores*.faiss")) + glob.glob(os.path.join(pasta, "docstore*.sqlite*"))
+    for caminho in candidatos:
+        nome = os.path.basename(caminho)
+        if not any(nome == usado or nome.startswith(usado + "-") for usado in em_uso):
+            os.remove(caminho)
+
+
+def _escolher_m_pq(dimensao: int) -> int:
+    # Número de subquantizadores: precisa dividir a dimensão; 8 bits por subvetor
+    return next(m for m in (96, 64, 48, 32, 24, 16, 12, 8, 4, 2, 1) if dimensao % m == 0)
+
+
+def _tipo_precisa_treino(tipo: str, quantizacao: str | None) -> bool:
+    return tipo == "ivf" or quantizacao is not None
+
+
+class IndiceVetorial(VectorStore):
+    """
+    VectorStore com índice FAISS selecionável (flat, ivf ou hnsw; sem quantização, sq8 ou pq)
+    e docstore em SQLite. Compatível com o uso feito pela ingestão e pelos apps:
+    from_documents, add_documents(ids=...), delete, save_local, load_local e as_retriever.
+    """
+
+    def __init__(self, embeddings, tipo: str = "flat", quantizacao: str | None = None,
+                 dimensao: int | None = None, nlist: int | None = None, m_pq: int | None = None,
+                 m_hnsw: int = 32, nprobe: int = 8, ef_busca: int = 64,
+                 min_treino: int | None = None, docstore: DocstoreSQLite | None = None):
+        if tipo not in TIPOS_INDICE:
+            raise ValueError(f"Tipo de índice desconhecido: {tipo!r}. Use um de {TIPOS_INDICE}.")
+        if quantizacao not in QUANTIZACOES:
+            raise ValueError(f"Quantização desconhecida: {quantizacao!r}. Use uma de {QUANTIZACOES}.")
+        self._embeddings = embeddings
+        self.tipo = tipo
+        self.quantizacao = quantizacao
+        self.dimensao = dimensao
+        self.nlist = nlist
+        self.m_pq = m_pq
+        self.m_hnsw = m_hnsw
+        self.nprobe = nprobe
+        self.ef_busca = ef_busca
+        self.min_treino = min_treino
+        self.docstore = docstore or DocstoreSQLite()
+        # Índice principal (None enquanto não treinado) e área de espera plana
+        self._indice = None
+        self._espera = None
+        # Ids removidos do docstore que o índice não consegue apagar (HNSW);
+        # são filtrados na busca e descartados ao salvar.
+        self._removidos = set()
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    # --- construção do índice ---
+
+    def _criar_base(self, amostra: np.ndarray | None = None):
+        d = self.dimensao
+        if self.tipo == "ivf":
+            if self.nlist is None:
+                n = len(amostra)
+                self.nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+            quantizador = faiss.IndexFlatL2(d)
+            if self.quantizacao == "sq8":
+                base = faiss.IndexIVFScalarQuantizer(quantizador, d, self.nlist, faiss.ScalarQuantizer.QT_8bit)
+            elif self.quantizacao == "pq":
+                self.m_pq = self.m_pq or _escolher_m_pq(d)
+                base = faiss.IndexIVFPQ(quantizador, d, self.nlist, self.m_pq, BITS_PQ)
+            else:
+                base = faiss.IndexIVFFlat(quantizador, d, self.nlist)
+        elif self.tipo == "hnsw":
+            if self.quantizacao == "sq8":
+                base = faiss.IndexHNSWSQ(d, faiss.ScalarQuantizer.QT_8bit, self.m_hnsw)
+            elif self.quantizacao == "pq":
+                self.m_pq = self.m_pq or _escolher_m_pq(d)
+                base = faiss.IndexHNSWPQ(d, self.m_pq, self.m_hnsw)
+            else:
+                base = faiss.IndexHNSWFlat(d, self.m_hnsw)
+        else:
+            if self.quantizacao == "sq8":
+                base = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit)
+            elif self.quantizacao == "pq":
+                self.m_pq = self.m_pq or _escolher_m_pq(d)
+                base = faiss.IndexPQ(d, self.m_pq, BITS_PQ)
+            else:
+                base = faiss.IndexFlatL2(d)
+        if amostra is not None and not base.is_trained:
+            base.train(amostra)
+        return base
+
+    def _minimo_para_treino(self) -> int:
+        minimo = self.min_treino
+        if minimo is None:
+            minimo = MIN_TREINO_IVF if self.tipo == "ivf" else MIN_TREINO_SQ8
+        if self.quantizacao == "pq":
+            minimo = max(minimo, 1 << BITS_PQ)
+        return minimo
+
+    def _com_ids(self, base):
+        # O IVF guarda ids próprios e remove vetores nativamente; os demais precisam do
+        # IndexIDMap2 para usar os ids inteiros do docstore.
+        return base if self.tipo == "ivf" else faiss.IndexIDMap2(base)
+
+    def _aplicar_parametros_de_busca(self) -> None:
+        if self._indice is None:
+            return
+        if self.tipo == "ivf":
+            faiss.extract_index_ivf(self._indice).nprobe = self.nprobe
+        elif self.tipo == "hnsw":
+            faiss.downcast_index(self._indice.index).hnsw.efSearch = self.ef_busca
+
+    def _garantir_indices(self, dimensao: int) -> None:
+        if self.dimensao is None:
+            self.dimensao = dimensao
+        elif self.dimensao != dimensao:
+            raise ValueError(f"Dimensão {dimensao} diferente da dimensão do índice ({self.dimensao}).")
+        if self._indice is None and not _tipo_precisa_treino(self.tipo, self.quantizacao):
+            self._indice = self._com_ids(self._criar_base())
+            self._aplicar_parametros_de_busca()
+        if self._indice is None and self._espera is None:
+            self._espera = faiss.IndexIDMap2(faiss.IndexFlatL2(self.dimensao))
+
+    def _vetores_da_espera(self) -> tuple[np.ndarray, np.ndarray]:
+        ids = faiss.vector_to_array(self._espera.id_map).astype("int64")
+        vetores = self._espera.index.reconstruct_n(0, self._espera.ntotal)
+        return ids, vetores
+
+    def _talvez_treinar(self) -> None:
+        """Treina o índice principal quando a área de espera tem vetores suficientes."""
+        if self._indice is not None or self._espera is None or self._espera.ntotal < self._minimo_para_treino():
+            return
+        ids, vetores = self._vetores_da_espera()
+        manter = ~np.isin(ids, list(self._removidos)) if self._removidos else slice(None)
+        ids, vetores = ids[manter], vetores[manter]
+        print(f"Treinando índice {self.descricao()} com {len(ids)} vetores...")
+        self._indice = self._com_ids(self._criar_base(vetores))
+        self._indice.add_with_ids(vetores, ids)
+        self._aplicar_parametros_de_busca()
+        self._espera = None
+        self._removidos.clear()
+
+    def _compactar(self) -> None:
+        """Reconstrói o HNSW sem os vetores removidos (ele não suporta remove_ids)."""
+        if not self._removidos or self._indice is None:
+            return
+        ids = faiss.vector_to_array(self._indice.id_map).astype("int64")
+        manter = ~np.isin(ids, list(self._removidos))
+        base_antiga = faiss.downcast_index(self._indice.index)
+        vetores = base_antiga.reconstruct_n(0, base_antiga.ntotal)[manter]
+        # clone + reset preserva o quantizador já treinado
+        base = faiss.clone_index(base_antiga)
+        base.reset()
+        self._indice = self._com_ids(base)
+        self._indice.add_with_ids(vetores, ids[manter])
+        self._aplicar_parametros_de_busca()
+        self._removidos.clear()
+
+    def descricao(self) -> str:
+        return self.tipo + (f"+{self.quantizacao}" if self.quantizacao else "")
+
+    # --- escrita ---
+
+    def add_embeddings(self, text_embeddings, metadatas: list[dict] | None = None,
+                       ids: list[str] | None = None, **kwargs) -> list[str]:
+        textos, vetores = zip(*text_embeddings) if text_embeddings else ((), ())
+        return self._adicionar(list(textos), list(vetores), metadatas, ids)
+
+    def add_texts(self, texts, metadatas: list[dict] | None = None,
+                  ids: list[str] | None = None, **kwargs) -> list[str]:
+        textos = list(texts)
+        return self._adicionar(textos, self.embeddings.embed_documents(textos), metadatas, ids)
+
+    def add_documents(self, documents: list[Document], **kwargs) -> list[str]:
+        ids = kwargs.pop("ids", None) or [getattr(doc, "id", None) or uuid.uuid4().hex for doc in documents]
+        return self.add_texts([doc.page_content for doc in documents],
+                              [doc.metadata for doc in documents], ids=ids, **kwargs)
+
+    def _adicionar(self, textos: list[str], vetores, metadatas, ids) -> list[str]:
+        if not textos:
+            return []
+        if self.docstore.somente_leitura:
+            raise ValueError("Índice aberto em modo somente leitura (mmap); carregue com somente_leitura=False.")
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in textos]
+        metadatas = list(metadatas) if metadatas else [{} for _ in textos]
+        matriz = np.asarray(vetores, dtype="float32")
+        self._garantir_indices(matriz.shape[1])
+        ids_inteiros = self.docstore.inserir(ids, textos, metadatas)
+        (self._indice if self._indice is not None else self._espera).add_with_ids(matriz, ids_inteiros)
+        self._talvez_treinar()
+        return ids
+
+    def delete(self, ids: list[str] | None = None, **kwargs) -> bool | None:
+        if not ids:
+            return None
+        if self.docstore.somente_leitura:
+            raise ValueError("Índice aberto em modo somente leitura (mmap); carregue com somente_leitura=False.")
+        ids_inteiros = self.docstore.ids_inteiros(ids)
+        if not ids_inteiros:
+            return False
+        self.docstore.remover(ids_inteiros)
+        seletor = np.asarray(ids_inteiros, dtype="int64")
+        if self._espera is not None:
+            self._espera.remove_ids(seletor)
+        if self._indice is not None:
+            try:
+                self._indice.remove_ids(seletor)
+            except RuntimeError:
+                self._removidos.update(ids_inteiros)
+        return True
+
+    # --- busca ---
+
+    def buscar_por_vetores(self, vetores, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Busca em lote: para cada linha de `vetores` retorna as k menores distâncias L2
+        e os ids inteiros dos chunks (-1 quando não há resultado).
+        """
+        consultas = np.ascontiguousarray(vetores, dtype="float32")
+        if consultas.ndim == 1:
+            consultas = consultas[None, :]
+        extra = len(self._removidos)
+        distancias, ids = [], []
+        for indice in (self._indice, self._espera):
+            if indice is not None and indice.ntotal > 0:
+                d, i = indice.search(consultas, min(k + extra, indice.ntotal))
+                distancias.append(d)
+                ids.append(i)
+        if not ids:
+            return (np.full((len(consultas), 0), np.inf, dtype="float32"),
+                    np.full((len(consultas), 0), -1, dtype="int64"))
+        distancias = np.concatenate(distancias, axis=1)
+        ids = np.concatenate(ids, axis=1)
+        invalidos = ids < 0
+        if extra:
+            invalidos |= np.isin(ids, list(self._removidos))
+        distancias[invalidos] = np.inf
+        ids[invalidos] = -1
+        ordem = np.argsort(distancias, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distancias, ordem, axis=1), np.take_along_axis(ids, ordem, axis=1)
+
+    def vetores(self, ids) -> np.ndarray:
+        """Reconstrói os vetores dos ids inteiros pedidos (aproximados, com quantização)."""
+        ids = np.asarray(ids, dtype="int64")
+        matriz = np.empty((len(ids), self.dimensao or 0), dtype="float32")
+        na_espera = np.zeros(len(ids), dtype=bool)
+        if self._espera is not None and self._espera.ntotal > 0:
+            na_espera = np.isin(ids, faiss.vector_to_array(self._espera.id_map))
+            if na_espera.any():
+                matriz[na_espera] = self._espera.reconstruct_batch(ids[na_espera])
+        if not na_espera.all():
+            if self._indice is None:
+                # Ainda não treinado: só existem os vetores da área de espera
+                raise KeyError(f"Ids fora do índice: {ids[~na_espera].tolist()}")
+            if self.tipo == "ivf":
+                # O IVF só reconstrói por id com um mapa direto; ids do docstore não são contíguos
+                ivf = faiss.extract_index_ivf(self._indice)
+                if ivf.direct_map.type != faiss.DirectMap.Hashtable:
+                    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+            matriz[~na_espera] = self._indice.reconstruct_batch(ids[~na_espera])
+        return matriz
+
+    def documentos(self, ids) -> dict:
+        """Lê do docstore apenas os chunks pedidos: {id_inteiro: Document}."""
+        return self.docstore.buscar(ids)
+
+    def ids_por_doc_id(self, doc_ids: list[str]) -> dict:
+        return self.docstore.mapear(doc_ids)
+
+    def iterar_documentos(self):
+        return self.docstore.iterar()
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, filter: dict | None = None,
+                                               fetch_k: int = 20, **kwargs) -> list[tuple[Document, float]]:
+        distancias, ids = self.buscar_por_vetores(embedding, fetch_k if filter else k)
+        docs = self.docstore.buscar(ids[0])
+        resultados = []
+        for distancia, i in zip(distancias[0], ids[0]):
+            doc = docs.get(int(i))
+            if doc is None:
+                continue
+            if filter and any(doc.metadata.get(chave) != valor for chave, valor in filter.items()):
+                continue
+            resultados.append((doc, float(distancia)))
+        return resultados[:k]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embeddings.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    # --- persistência ---
+
+    @staticmethod
+    def existe(pasta: str) -> bool:
+        return os.path.exists(os.path.join(pasta, ARQUIVO_CONFIG))
+
+    def save_local(self, pasta: str) -> None:
+        os.makedirs(pasta, exist_ok=True)
+        self._talvez_treinar()
+        self._compactar()
+        # Arquivos novos a cada gravação: processos com os antigos mapeados continuam
+        # lendo a versão anterior até recarregarem, e nada é sobrescrito no lugar.
+        geracao = uuid.uuid4().hex[:12]
+        arquivos = {"vetores": None, "espera": None,
+                    "docstore": ARQUIVO_DOCSTORE.replace(".sqlite", f".{geracao}.sqlite")}
+        for indice, chave, nome in ((self._indice, "vetores", ARQUIVO_VETORES),
+                                    (self._espera, "espera", ARQUIVO_ESPERA)):
+            if indice is not None:
+                arquivos[chave] = nome.replace(".faiss", f".{geracao}.faiss")
+                faiss.write_index(indice, os.path.join(pasta, arquivos[chave]))
+        self.docstore.salvar(os.path.join(pasta, arquivos["docstore"]))
+        config = {
+            "versao": VERSAO_INDICE, "tipo": self.tipo, "quantizacao": self.quantizacao,
+            "dimensao": self.dimensao, "nlist": self.nlist, "m_pq": self.m_pq, "m_hnsw": self.m_hnsw,
+            "nprobe": self.nprobe, "ef_busca": self.ef_busca, "min_treino": self.min_treino,
+            "arquivos": arquivos,
+        }
+        # A troca do indice.json é o ponto em que a gravação passa a valer
+        caminho = os.path.join(pasta, ARQUIVO_CONFIG)
+        with open(caminho + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=2)
+        os.replace(caminho + ".tmp", caminho)
+        _apagar_geracoes_antigas(pasta, arquivos)
+
+    @staticmethod
+    def _ler_config(pasta: str) -> dict:
+        with open(os.path.join(pasta, ARQUIVO_CONFIG), "r", encoding="utf-8") as f:
+            config = json.load(f)
+        if config.get("versao") != VERSAO_INDICE:
+            raise ValueError(f"Versão de índice incompatível em {pasta}: {config.get('versao')}")
+        config.pop("versao")
+        # Índices gravados antes das gerações usam os nomes fixos
+        config.setdefault("arquivos", {"vetores": ARQUIVO_VETORES, "espera": ARQUIVO_ESPERA,
+                                       "docstore": ARQUIVO_DOCSTORE})
+        return config
+
+    @classmethod
+    def load_local(cls, pasta: str, embeddings, somente_leitura: bool = False, **ajustes) -> "IndiceVetorial":
+        """
+        Abre um índice salvo. Com `somente_leitura=True` os vetores são mapeados em memória
+        (IO_FLAG_MMAP para o IVF, IO_FLAG_MMAP_IFC para os demais) e o docstore é aberto em
+        modo leitura; para escrita, os vetores vão para o heap e o docstore é copiado para a
+        memória. `ajustes` sobrescreve parâmetros de busca como nprobe e ef_busca.
+        """
+        config = cls._ler_config(pasta)
+        if not os.path.exists(os.path.join(pasta, config["arquivos"]["docstore"])):
+            # Outro processo acabou de salvar e apagar a geração anterior: relê o indice.json
+            config = cls._ler_config(pasta)
+        arquivos = config.pop("arquivos")
+        config.update(ajustes)
+        caminho_docstore = os.path.join(pasta, arquivos["docstore"])
+        if somente_leitura:
+            docstore = DocstoreSQLite(caminho_docstore, somente_leitura=True)
+        else:
+            docstore = DocstoreSQLite.copia_em_memoria(caminho_docstore)
+        indice = cls(embeddings, docstore=docstore, **config)
+        for atributo, chave in (("_indice", "vetores"), ("_espera", "espera")):
+            caminho = os.path.join(pasta, arquivos[chave]) if arquivos.get(chave) else None
+            if caminho is not None and os.path.exists(caminho):
+                flags = _flags_de_mmap(indice.tipo == "ivf" and chave == "vetores") if somente_leitura else 0
+                setattr(indice, atributo, faiss.read_index(caminho, flags))
+        indice._aplicar_parametros_de_busca()
+        return indice
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas: list[dict] | None = None,
+                   ids: list[str] | None = None, **kwargs) -> "IndiceVetorial":
+        indice = cls(embedding, **kwargs)
+        indice.add_texts(texts, metadatas, ids=ids)
+        return indice
+
+    @classmethod
+    def de_faiss_langchain(cls, store, tamanho_lote: int = 1024, **kwargs) -> "IndiceVetorial":
+        """Converte um FAISS do LangChain (index.faiss + index.pkl) reaproveitando os vetores."""
+        indice = cls(store.embeddings, **kwargs)
+        total = store.index.ntotal
+        for inicio in range(0, total, tamanho_lote):
+            fim = min(inicio + tamanho_lote, total)
+            vetores = store.index.reconstruct_n(inicio, fim - inicio)
+            doc_ids = [store.index_to_docstore_id[i] for i in range(inicio, fim)]
+            docs = [store.docstore.search(doc_id) for doc_id in doc_ids]
+            indice._adicionar([doc.page_content for doc in docs], vetores,
+                              [doc.metadata for doc in docs], doc_ids)
+        return indice
+
+
+def carregar_indice(pasta: str, embeddings, somente_leitura: bool = True, **ajustes):
+    """Abre o índice compacto da pasta, se existir; senão, o FAISS salvo pelo LangChain."""
+    if IndiceVetorial.existe(pasta):
+        return IndiceVetorial.load_local(pasta, embeddings, somente_leitura=somente_leitura, **ajustes)
+    # O FAISS do LangChain (e o langchain_community) só é importado quando ainda é usado
+    from langchain_community.vectorstores import FAISS
+    return FAISS.load_local(pasta, embeddings, allow_dangerous_deserialization=True)
@@ -0,0 +1,426 @@
+# --- INGESTÃO INCREMENTAL DOS DOCUMENTOS ---
+# Mantém um manifesto (hash por arquivo e por chunk) ao lado do índice FAISS.
+# Na inicialização, apenas PDFs novos ou alterados são lidos e divididos, e só os
+# chunks novos são enviados para o modelo de embeddings.
+#
+# A leitura dos PDFs é feita em paralelo (um pool de processos lê faixas de páginas)
+# e os chunks fluem como um gerador direto para os lotes de embeddings: o pico de
+# memória depende do tamanho do lote, não do tamanho do corpus. Cada página recebe
+# os mesmos metadados que o PyPDFLoader anexava (metadados do PDF, source,
+# total_pages, page e page_label), então chunks novos e antigos têm o mesmo formato.
+#
+# O manifesto também guarda o `identificador` dos embeddings que geraram os vetores
+# (modelo e endpoint). Se os embeddings atuais forem outros, ou se a origem dos
+# vetores for desconhecida (índice sem manifesto), todos os chunks são recalculados:
+# vetores de espaços diferentes não podem ser misturados nem comparados.
+#
+# O índice léxico (BM25) de indice_lexico.py e o índice de metadados de
+# indice_metadados.py (documento, ano, seção e página de cada chunk) são remontados
+# ao lado do vetorial sempre que o conjunto de chunks muda.
+import os
+import json
+import time
+import hashlib
+import multiprocessing
+from datetime import datetime
+from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from pypdf import PdfReader
+from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
+from indice_vetorial import IndiceVetorial
+from indice_lexico import IndiceLexico, assinatura_dos_ids
+from indice_metadados import IndiceMetadados
+
+MANIFESTO_NOME = "manifesto.json"
+VERSAO_MANIFESTO = 1
+PAGINAS_POR_TAREFA = 8
+TAMANHO_LOTE_EMBEDDINGS = 64
+
+
+class TemposPorEtapa:
+    """Acumula o tempo gasto em cada etapa da ingestão e imprime um resumo."""
+
+    def __init__(self):
+        self.tempos = defaultdict(float)
+
+    @contextmanager
+    def etapa(self, nome: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.tempos[nome] += time.perf_counter() - inicio
+
+    def adicionar(self, nome: str, segundos: float) -> None:
+        self.tempos[nome] += segundos
+
+    def imprimir(self) -> None:
+        print("--- Tempo por etapa da ingestão ---")
+        for nome, segundos in self.tempos.items():
+            print(f"{nome:<28} {segundos:8.2f}s")
+
+
+def hash_arquivo(caminho: str, tamanho_bloco: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def hash_chunk(doc) -> str:
+    # O hash inclui a origem e a página para que textos iguais em arquivos diferentes
+    # continuem sendo chunks distintos no índice.
+    h = hashlib.sha256()
+    h.update(str(doc.metadata.get("source", "")).encode("utf-8"))
+    h.update(b"\x00")
+    h.update(str(doc.metadata.get("page", "")).encode("utf-8"))
+    h.update(b"\x00")
+    h.update(doc.page_content.encode("utf-8"))
+    return h.hexdigest()
+
+
+def listar_pdfs(pasta_docs: str) -> dict:
+    """Retorna {caminho_do_pdf: hash_do_arquivo} para todos os PDFs da pasta."""
+    pdfs = {}
+    for file in sorted(os.listdir(pasta_docs)):
+        if file.endswith(".pdf"):
+            pdf_path = os.path.join(pasta_docs, file)
+            pdfs[pdf_path] = hash_arquivo(pdf_path)
+    return pdfs
+
+
+def carregar_manifesto(pasta_indice: str) -> dict | None:
+    caminho = os.path.join(pasta_indice, MANIFESTO_NOME)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, "r", encoding="utf-8") as f:
+        manifesto = json.load(f)
+    if manifesto.get("versao") != VERSAO_MANIFESTO:
+        return None
+    return manifesto
+
+
+def ids_dos_chunks(pasta_indice: str) -> set | None:
+    """
+    Hashes (hash_chunk) de todos os chunks presentes no índice, segundo o manifesto.
+    None sem manifesto: os chunks do índice são desconhecidos, não inexistentes.
+    """
+    manifesto = carregar_manifesto(pasta_indice)
+    if manifesto is None:
+        return None
+    return {h for entrada in manifesto["arquivos"].values() for h in entrada["chunks"]}
+
+
+def salvar_manifesto(pasta_indice: str, manifesto: dict) -> None:
+    os.makedirs(pasta_indice, exist_ok=True)
+    caminho = os.path.join(pasta_indice, MANIFESTO_NOME)
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+
+def documentos_do_indice(vectorstore):
+    """Gera (doc_id, Document) de todos os chunks, no índice compacto ou no FAISS do LangChain."""
+    if hasattr(vectorstore, "iterar_documentos"):
+        return vectorstore.iterar_documentos()
+    return iter(vectorstore.docstore._dict.items())
+
+
+def _assinatura_do_manifesto(manifesto: dict) -> str:
+    return assinatura_dos_ids(doc_id for entrada in manifesto["arquivos"].values()
+                              for doc_id in entrada["chunks"].values())
+
+
+def atualizar_indice_lexico(pasta_indice: str, vectorstore, manifesto: dict, tempos: TemposPorEtapa) -> None:
+    """Remonta o índice BM25 se o conjunto de chunks do manifesto mudou desde a última montagem."""
+    if IndiceLexico.assinatura_salva(pasta_indice) == _assinatura_do_manifesto(manifesto):
+        return
+    print("Montando o índice léxico (BM25)...")
+    with tempos.etapa("índice léxico"):
+        IndiceLexico.construir(documentos_do_indice(vectorstore)).salvar(pasta_indice)
+
+
+def atualizar_indice_metadados(pasta_indice: str, vectorstore, manifesto: dict, tempos: TemposPorEtapa) -> None:
+    """Remonta o índice de metadados (documento, ano, seção, página) quando o conjunto de chunks muda."""
+    if IndiceMetadados.assinatura_salva(pasta_indice) == _assinatura_do_manifesto(manifesto):
+        return
+    print("Montando o índice de metadados dos chunks...")
+    with tempos.etapa("índice de metadados"):
+        IndiceMetadados.construir(documentos_do_indice(vectorstore)).salvar(pasta_indice)
+
+
+def adotar_indice_existente(vectorstore, pdfs: dict) -> dict:
+    """
+    Cria um manifesto para um índice salvo antes da existência do manifesto.
+    Os chunks já presentes no docstore são reaproveitados (sem novos embeddings);
+    assume-se que os PDFs atualmente em disco são os que geraram o índice.
+    """
+    manifesto = {"versao": VERSAO_MANIFESTO, "arquivos": {}}
+    for doc_id, doc in documentos_do_indice(vectorstore):
+        source = doc.metadata.get("source", "")
+        entrada = manifesto["arquivos"].setdefault(
+            source, {"hash": pdfs.get(source), "chunks": {}}
+        )
+        entrada["chunks"][hash_chunk(doc)] = doc_id
+    return manifesto
+
+
+def metadados_do_pdf(reader: PdfReader, pdf_path: str) -> dict:
+    """
+    Metadados do documento no formato do PyPDFLoader: chaves do PDF sem a barra e em
+    minúsculas, datas em ISO 8601, mais source e total_pages.
+    """
+    metadados = {"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+    for chave, valor in dict(reader.metadata or {}).items():
+        chave = chave.lstrip("/").lower()
+        valor = valor if type(valor) in (str, int) else str(valor)
+        if chave in ("creationdate", "moddate"):
+            try:
+                valor = datetime.strptime(valor.replace("'", ""), "D:%Y%m%d%H%M%S%z").isoformat("T")
+            except ValueError:
+                pass
+        elif isinstance(valor, str):
+            valor = valor.strip()
+        metadados[chave] = valor
+    metadados.update(source=pdf_path, total_pages=len(reader.pages))
+    return metadados
+
+
+def _ler_e_dividir_paginas(pdf_path: str, inicio: int, fim: int, text_splitter):
+    """Executado nos processos do pool: lê as páginas [inicio, fim) e as divide."""
+    t0 = time.perf_counter()
+    reader = PdfReader(pdf_path)
+    metadados = metadados_do_pdf(reader, pdf_path)
+    paginas = [
+        Document(page_content=reader.pages[i].extract_text().strip(),
+                 metadata={**metadados, "page": i, "page_label": reader.page_labels[i]})
+        for i in range(inicio, fim)
+    ]
+    t1 = time.perf_counter()
+    chunks = text_splitter.split_documents(paginas)
+    t2 = time.perf_counter()
+    return [(hash_chunk(chunk), chunk) for chunk in chunks], t1 - t0, t2 - t1
+
+
+def _tarefas_de_leitura(pdf_paths, paginas_por_tarefa: int):
+    for pdf_path in pdf_paths:
+        total_paginas = len(PdfReader(pdf_path).pages)
+        for inicio in range(0, total_paginas, paginas_por_tarefa):
+            yield pdf_path, inicio, min(inicio + paginas_por_tarefa, total_paginas)
+
+
+def gerar_chunks(pdf_paths, text_splitter, tempos: TemposPorEtapa, max_workers: int | None = None,
+                 paginas_por_tarefa: int = PAGINAS_POR_TAREFA):
+    """
+    Gera (pdf_path, hash_do_chunk, chunk) na ordem dos arquivos e páginas.
+    As faixas de páginas são processadas em paralelo, mas apenas uma janela limitada
+    de tarefas fica em andamento, para não acumular o corpus inteiro em memória.
+    """
+    tarefas = _tarefas_de_leitura(pdf_paths, paginas_por_tarefa)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    def consumir(pdf_path, resultado):
+        chunks, t_leitura, t_divisao = resultado
+        tempos.adicionar("leitura dos PDFs (cpu)", t_leitura)
+        tempos.adicionar("divisão em chunks (cpu)", t_divisao)
+        for h, chunk in chunks:
+            yield pdf_path, h, chunk
+
+    # Sem 'fork' (ex.: Windows) o pool precisaria reimportar o script principal;
+    # nesse caso a leitura é feita no próprio processo.
+    if max_workers == 1 or "fork" not in multiprocessing.get_all_start_methods():
+        for pdf_path, inicio, fim in tarefas:
+            yield from consumir(pdf_path, _ler_e_dividir_paginas(pdf_path, inicio, fim, text_splitter))
+        return
+
+    contexto = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=contexto) as pool:
+        em_andamento = []
+        for tarefa in tarefas:
+            em_andamento.append((tarefa[0], pool.submit(_ler_e_dividir_paginas, *tarefa, text_splitter)))
+            if len(em_andamento) >= 2 * max_workers:
+                pdf_path, futuro = em_andamento.pop(0)
+                yield from consumir(pdf_path, futuro.result())
+        for pdf_path, futuro in em_andamento:
+            yield from consumir(pdf_path, futuro.result())
+
+
+def _abrir_indice(pasta_indice: str, embeddings, opcoes_indice: dict | None, somente_leitura: bool):
+    if opcoes_indice is None:
+        return FAISS.load_local(pasta_indice, embeddings, allow_dangerous_deserialization=True)
+    # Tipo e quantização vêm do indice.json salvo; apenas os parâmetros de busca são sobrescritos
+    ajustes = {k: v for k, v in opcoes_indice.items() if k in ("nprobe", "ef_busca")}
+    return IndiceVetorial.load_local(pasta_indice, embeddings, somente_leitura=somente_leitura, **ajustes)
+
+
+def _esta_sincronizado(manifesto: dict, pdfs: dict) -> bool:
+    arquivos = manifesto["arquivos"]
+    return set(arquivos) == set(pdfs) and all(arquivos[p]["hash"] == h for p, h in pdfs.items())
+
+
+def sincronizar_indice(pasta_docs: str, pasta_indice: str, embeddings, text_splitter,
+                       tamanho_lote: int = TAMANHO_LOTE_EMBEDDINGS, max_workers: int | None = None,
+                       opcoes_indice: dict | None = None):
+    """
+    Carrega o índice FAISS salvo e o sincroniza com os PDFs de `pasta_docs`:
+    arquivos inalterados são ignorados, chunks novos são adicionados em lotes de
+    `tamanho_lote` e chunks de arquivos alterados ou removidos são apagados do índice.
+
+    Com `opcoes_indice` (ex.: {"tipo": "hnsw", "quantizacao": "sq8"}) o índice é salvo no
+    formato compacto de indice_vetorial.py; um FAISS do LangChain já existente na pasta é
+    convertido sem recalcular embeddings. Sem alterações, o índice compacto é aberto em
+    modo somente leitura (mmap).
+
+    Se `embeddings.identificador` difere do gravado no manifesto (ou o índice não tem
+    manifesto), o índice é refeito do zero com os embeddings atuais.
+    """
+    tempos = TemposPorEtapa()
+    inicio_total = time.perf_counter()
+
+    with tempos.etapa("hash dos arquivos"):
+        pdfs = listar_pdfs(pasta_docs)
+
+    existe_faiss = os.path.exists(os.path.join(pasta_indice, "index.faiss"))
+    existe = IndiceVetorial.existe(pasta_indice) if opcoes_indice is not None else existe_faiss
+    manifesto = carregar_manifesto(pasta_indice) if existe else None
+
+    origem = getattr(embeddings, "identificador", None)
+    if origem is not None and (existe or existe_faiss):
+        origem_salva = (carregar_manifesto(pasta_indice) or {}).get("embeddings")
+        if origem_salva != origem:
+            print(f"Os vetores salvos vêm de {origem_salva or 'embeddings desconhecidos'}, não de {origem}; "
+                  "todos os chunks serão recalculados.")
+            existe = existe_faiss = False
+            manifesto = None
+
+    if manifesto is not None and _esta_sincronizado(manifesto, pdfs):
+        print("Vector Store já está sincronizado com os documentos.")
+        with tempos.etapa("carga do índice"):
+            vectorstore = _abrir_indice(pasta_indice, embeddings, opcoes_indice, somente_leitura=True)
+        atualizar_indice_lexico(pasta_indice, vectorstore, manifesto, tempos)
+        atualizar_indice_metadados(pasta_indice, vectorstore, manifesto, tempos)
+        tempos.imprimir()
+        return vectorstore
+
+    vectorstore = None
+    if existe:
+        print("Carregando Vector Store existente...")
+        with tempos.etapa("carga do índice"):
+            vectorstore = _abrir_indice(pasta_indice, embeddings, opcoes_indice, somente_leitura=False)
+    elif opcoes_indice is not None and existe_faiss:
+        print("Convertendo o Vector Store do LangChain para o formato compacto...")
+        with tempos.etapa("conversão do índice"):
+            antigo = FAISS.load_local(pasta_indice, embeddings, allow_dangerous_deserialization=True)
+            vectorstore = IndiceVetorial.de_faiss_langchain(antigo, **opcoes_indice)
+            del antigo
+        # Os ids dos chunks são preservados, então o manifesto anterior continua válido
+        manifesto = carregar_manifesto(pasta_indice)
+    if vectorstore is not None and manifesto is None:
+        print("Manifesto de ingestão não encontrado. Adotando os chunks do índice existente...")
+        manifesto = adotar_indice_existente(vectorstore, pdfs)
+    if manifesto is None:
+        manifesto = {"versao": VERSAO_MANIFESTO, "arquivos": {}}
+    if origem is not None:
+        manifesto["embeddings"] = origem
+
+    ids_para_remover = []
+
+    # Arquivos que saíram da pasta de documentos
+    for source in list(manifesto["arquivos"]):
+        if source not in pdfs:
+            print(f"Arquivo removido: {source}")
+            ids_para_remover.extend(manifesto["arquivos"][source]["chunks"].values())
+            del manifesto["arquivos"][source]
+
+    # Arquivos novos ou alterados
+    alterados = []
+    for pdf_path, hash_pdf in pdfs.items():
+        anterior = manifesto["arquivos"].get(pdf_path)
+        if anterior is not None and anterior["hash"] == hash_pdf:
+            continue
+        print(f"{'Arquivo alterado' if anterior else 'Arquivo novo'}: {pdf_path}")
+        alterados.append(pdf_path)
+
+    if not ids_para_remover and not alterados:
+        if vectorstore is None:
+            raise FileNotFoundError(f"Nenhum PDF encontrado em {pasta_docs} para criar o Vector Store.")
+        # Manifesto adotado ou índice convertido: grava para não repetir na próxima carga
+        with tempos.etapa("gravação do índice"):
+            vectorstore.save_local(pasta_indice)
+            salvar_manifesto(pasta_indice, manifesto)
+        atualizar_indice_lexico(pasta_indice, vectorstore, manifesto, tempos)
+        atualizar_indice_metadados(pasta_indice, vectorstore, manifesto, tempos)
+        print("Vector Store já está sincronizado com os documentos.")
+        tempos.imprimir()
+        return vectorstore
+
+    if vectorstore is not None and ids_para_remover:
+        print(f"Removendo {len(ids_para_remover)} chunks de arquivos removidos...")
+        with tempos.etapa("remoção de vetores"):
+            vectorstore.delete(ids_para_remover)
+        ids_para_remover = []
+
+    novos_arquivos = {p: {"hash": pdfs[p], "chunks": {}} for p in alterados}
+    lote_ids, lote_docs = [], []
+    total_adicionados = 0
+
+    def enviar_lote():
+        nonlocal vectorstore, lote_ids, lote_docs, total_adicionados
+        if not lote_docs:
+            return
+        with tempos.etapa("embeddings + inserção"):
+            if vectorstore is None and opcoes_indice is not None:
+                vectorstore = IndiceVetorial.from_documents(lote_docs, embeddings, ids=lote_ids, **opcoes_indice)
+            elif vectorstore is None:
+                vectorstore = FAISS.from_documents(lote_docs, embeddings, ids=lote_ids)
+            else:
+                vectorstore.add_documents(lote_docs, ids=lote_ids)
+        total_adicionados += len(lote_docs)
+        print(f"  {total_adicionados} chunks novos indexados...")
+        lote_ids, lote_docs = [], []
+
+    for pdf_path, h, chunk in gerar_chunks(alterados, text_splitter, tempos, max_workers=max_workers):
+        anterior = manifesto["arquivos"].get(pdf_path)
+        chunks_atuais = novos_arquivos[pdf_path]["chunks"]
+        if h in chunks_atuais:
+            continue
+        if anterior is not None and h in anterior["chunks"]:
+            chunks_atuais[h] = anterior["chunks"][h]
+            continue
+        chunks_atuais[h] = h
+        lote_ids.append(h)
+        lote_docs.append(chunk)
+        if len(lote_docs) >= tamanho_lote:
+            enviar_lote()
+    enviar_lote()
+
+    # Chunks de arquivos alterados que deixaram de existir
+    for pdf_path in alterados:
+        anterior = manifesto["arquivos"].get(pdf_path)
+        if anterior is None:
+            continue
+        chunks_atuais = novos_arquivos[pdf_path]["chunks"]
+        ids_para_remover.extend(doc_id for h, doc_id in anterior["chunks"].items() if h not in chunks_atuais)
+
+    if vectorstore is not None and ids_para_remover:
+        print(f"Removendo {len(ids_para_remover)} chunks desatualizados do índice...")
+        with tempos.etapa("remoção de vetores"):
+            vectorstore.delete(ids_para_remover)
+
+    if vectorstore is None:
+        raise FileNotFoundError(f"Nenhum PDF encontrado em {pasta_docs} para criar o Vector Store.")
+
+    manifesto["arquivos"].update(novos_arquivos)
+    with tempos.etapa("gravação do índice"):
+        vectorstore.save_local(pasta_indice)
+        salvar_manifesto(pasta_indice, manifesto)
+    atualizar_indice_lexico(pasta_indice, vectorstore, manifesto, tempos)
+    atualizar_indice_metadados(pasta_indice, vectorstore, manifesto, tempos)
+    print(f"Vector Store sincronizado e salvo com sucesso ({total_adicionados} chunks novos).")
+    tempos.adicionar("total (relógio)", time.perf_counter() - inicio_total)
+    tempos.imprimir()
+    return vectorstore
@@ -0,0 +1,92 @@
+# --- MICRO-LOTES ENTRE REQUISIÇÕES CONCORRENTES ---
+# Chamadas feitas ao mesmo tempo por várias threads (uma por requisição) são
+# reunidas por alguns milissegundos e executadas em uma única chamada em lote:
+# um embed_documents com os textos de todos, um predict do cross-encoder com os
+# pares de todos. Cada chamador recebe de volta apenas a sua fatia do resultado.
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+
+
+class AgrupadorDeLotes:
+    """
+    Executa `funcao_lote(itens) -> resultados` (um resultado por item) sobre os itens
+    enviados por várias threads em uma janela de `janela_ms` ou até `max_itens`.
+    """
+
+    def __init__(self, funcao_lote, max_itens: int = 128, janela_ms: float = 5.0, nome: str = "lote"):
+        self.funcao_lote = funcao_lote
+        self.max_itens = max_itens
+        self.janela = janela_ms / 1000
+        self.lotes_executados = 0
+        self.itens_processados = 0
+        self._fila = queue.Queue()
+        threading.Thread(target=self._executar, name=f"agrupador-{nome}", daemon=True).start()
+
+    def submeter(self, itens: list) -> list:
+        """Bloqueia a thread chamadora até o lote que contém seus itens terminar."""
+        if not itens:
+            return []
+        futuro = Future()
+        self._fila.put((list(itens), futuro))
+        return futuro.result()
+
+    def _executar(self) -> None:
+        while True:
+            pedidos = [self._fila.get()]
+            total = len(pedidos[0][0])
+            limite = time.monotonic() + self.janela
+            while total < self.max_itens:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    pedido = self._fila.get(timeout=restante)
+                except queue.Empty:
+                    break
+                pedidos.append(pedido)
+                total += len(pedido[0])
+
+            itens = [item for pedido_itens, _ in pedidos for item in pedido_itens]
+            try:
+                resultados = list(self.funcao_lote(itens))
+            except Exception as erro:
+                for _, futuro in pedidos:
+                    futuro.set_exception(erro)
+                continue
+            self.lotes_executados += 1
+            self.itens_processados += len(itens)
+            inicio = 0
+            for pedido_itens, futuro in pedidos:
+                futuro.set_result(resultados[inicio:inicio + len(pedido_itens)])
+                inicio += len(pedido_itens)
+
+
+class EmbeddingsEmLote(Embeddings):
+    """Embeddings cujas chamadas concorrentes são unidas em um único embed_documents."""
+
+    def __init__(self, embeddings, max_itens: int = 256, janela_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.agrupador = AgrupadorDeLotes(embeddings.embed_documents, max_itens, janela_ms, nome="embeddings")
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.agrupador.submeter(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.agrupador.submeter([text])[0]
+
+
+class CrossEncoderEmLote:
+    """Envolve um CrossEncoder: os pares de requisições concorrentes vão em um único predict."""
+
+    def __init__(self, cross_encoder, tamanho_lote: int = 32, max_itens: int = 512, janela_ms: float = 5.0):
+        self.cross_encoder = cross_encoder
+        self.agrupador = AgrupadorDeLotes(
+            lambda pares: cross_encoder.predict(pares, batch_size=tamanho_lote), max_itens, janela_ms,
+            nome="reranker",
+        )
+
+    def predict(self, pares, batch_size: int | None = None):
+        return self.agrupador.submeter(pares)
@@ -0,0 +1,183 @@
+# --- PIPELINE RAG ASSÍNCRONO COM RESPOSTA EM FLUXO ---
+# Expansão, recuperação, re-ranking e geração viram etapas assíncronas; as etapas
+# de CPU (busca no índice, cross-encoder) rodam em threads para não travar o loop.
+# A resposta sai token a token (astream), então o usuário vê o início do texto logo
+# após o re-ranking em vez de esperar a geração inteira.
+#
+# `python pipeline_async.py` abre uma sessão no terminal e, ao mesmo tempo, aceita
+# outras sessões por TCP (uma pergunta por linha, ex.: `nc 127.0.0.1 8765`). Filtros
+# de metadados podem preceder a pergunta, como no rag_app: `ano:2024 secao:Conselho ...`.
+import time
+import asyncio
+from recuperacao import recuperar_multiplas
+from indice_metadados import separar_filtro
+from contexto import chunks_de_origem
+from telemetria import obter_rastreador
+
+HOST_PADRAO = "127.0.0.1"
+PORTA_PADRAO = 8765
+
+
+class BackendSaturado(RuntimeError):
+    """O LLM não liberou uma vaga de geração dentro do tempo máximo de espera."""
+
+
+class PipelineRAGAsync:
+    """
+    Pipeline pergunta -> resposta em fluxo. `chain_geracao` recebe {"input", "context"}
+    (como o combine_docs_chain de rag_app.py) e precisa suportar astream.
+    """
+
+    def __init__(self, vectorstore, embeddings, reranker, expansor, chain_geracao, cache_respostas=None,
+                 k: int = 20, k_final: int = 4, fator_corte: float | None = 0.3,
+                 max_geracoes_simultaneas: int = 2, espera_max_geracao: float | None = None,
+                 indice_lexico=None, max_candidatos: int | None = None, montador_contexto=None,
+                 indice_metadados=None):
+        self.vectorstore = vectorstore
+        self.embeddings = embeddings
+        self.reranker = reranker
+        self.expansor = expansor
+        self.chain_geracao = chain_geracao
+        self.cache_respostas = cache_respostas
+        self.k = k
+        self.k_final = k_final
+        self.fator_corte = fator_corte
+        self.indice_lexico = indice_lexico
+        self.max_candidatos = max_candidatos
+        self.indice_metadados = indice_metadados
+        # MontadorDeContexto opcional: sem ele, os k_final documentos vão inteiros ao LLM
+        self.montador_contexto = montador_contexto
+        # Limita as gerações simultâneas enviadas ao Ollama; com `espera_max_geracao`,
+        # quem esperar mais que isso por uma vaga recebe BackendSaturado
+        self._semaforo_geracao = asyncio.Semaphore(max_geracoes_simultaneas)
+        self.espera_max_geracao = espera_max_geracao
+
+    async def recuperar(self, perguntas: list[str], filtro: dict | None = None):
+        return await asyncio.to_thread(recuperar_multiplas, self.vectorstore, self.embeddings, perguntas, self.k,
+                                       indice_lexico=self.indice_lexico, max_candidatos=self.max_candidatos,
+                                       indice_metadados=self.indice_metadados, filtro=filtro)
+
+    async def reranquear(self, pergunta: str, candidatos):
+        return await asyncio.to_thread(self.reranker.reranquear, pergunta, candidatos,
+                                       self.k_final, self.fator_corte)
+
+    async def documentos_para(self, pergunta: str, filtro: dict | None = None) -> list:
+        """Expansão (adaptativa), recuperação e re-ranking: os documentos que irão ao LLM."""
+        _, docs_com_scores = await self.expansor.arecuperar(
+            pergunta, lambda perguntas: self.recuperar(perguntas, filtro),
+            lambda candidatos: self.reranquear(pergunta, candidatos)
+        )
+        if self.montador_contexto is not None:
+            return self.montador_contexto.montar(docs_com_scores)
+        return [doc for doc, _ in docs_com_scores]
+
+    async def gerar(self, pergunta: str, documentos: list):
+        try:
+            await asyncio.wait_for(self._semaforo_geracao.acquire(), self.espera_max_geracao)
+        except asyncio.TimeoutError:
+            raise BackendSaturado(f"Nenhuma vaga de geração em {self.espera_max_geracao}s") from None
+        # Medida à mão: um gerador assíncrono não deve manter uma etapa aberta entre os yields
+        inicio, tokens, status = time.perf_counter(), 0, "erro"
+        try:
+            async for parte in self.chain_geracao.astream({"input": pergunta, "context": documentos}):
+                tokens += 1
+                # Chains de chat devolvem mensagens; as de texto, strings
+                yield getattr(parte, "content", parte)
+            status = "ok"
+        finally:
+            self._semaforo_geracao.release()
+            obter_rastreador().registrar("geração", time.perf_counter() - inicio, status,
+                                         tokens=tokens, trechos=len(documentos))
+
+    async def responder(self, pergunta: str, filtro: dict | None = None):
+        """
+        Gera a resposta em partes, consultando e alimentando o cache semântico.
+        Com `filtro` (metadados dos chunks) a busca é restrita e o cache não é usado.
+        """
+        usar_cache = self.cache_respostas is not None and not filtro
+        if usar_cache:
+            em_cache = await asyncio.to_thread(self.cache_respostas.buscar, pergunta)
+            if em_cache is not None:
+                yield em_cache[0]
+                return
+        documentos = await self.documentos_para(pergunta, filtro)
+        partes = []
+        async for parte in self.gerar(pergunta, documentos):
+            partes.append(parte)
+            yield parte
+        if usar_cache:
+            await asyncio.to_thread(self.cache_respostas.guardar, pergunta, "".join(partes),
+                                    chunks_de_origem(documentos))
+
+
+async def responder_com_tempos(pipeline: PipelineRAGAsync, pergunta: str, ao_receber, filtro: dict | None = None):
+    """Repassa cada parte para `ao_receber` e retorna (tempo até o primeiro token, tempo total)."""
+    inicio = time.perf_counter()
+    primeiro_token = None
+    # Cada pergunta é um rastro; as etapas em asyncio.to_thread herdam o id pelo contexto
+    with obter_rastreador().rastro("pipeline_async") as rastro:
+        async for parte in pipeline.responder(pergunta, filtro):
+            if primeiro_token is None:
+                primeiro_token = time.perf_counter() - inicio
+            await ao_receber(parte)
+        rastro["primeiro_token_ms"] = round((primeiro_token or 0.0) * 1000, 3)
+    return primeiro_token or 0.0, time.perf_counter() - inicio
+
+
+async def atender_conexao(pipeline: PipelineRAGAsync, leitor, escritor) -> None:
+    """Uma conexão TCP é uma sessão: cada linha recebida é uma pergunta."""
+    endereco = escritor.get_extra_info("peername")
+
+    async def enviar(parte: str):
+        escritor.write(parte.encode("utf-8"))
+        await escritor.drain()
+
+    try:
+        while linha := await leitor.readline():
+            pergunta = linha.decode("utf-8").strip()
+            if not pergunta:
+                continue
+            if pergunta.lower() == "sair":
+                break
+            filtro, pergunta = separar_filtro(pergunta)
+            primeiro_token, total = await responder_com_tempos(pipeline, pergunta, enviar, filtro)
+            await enviar("\n\n")
+            print(f"[sessão {endereco}] primeiro token em {primeiro_token:.2f}s, resposta completa em {total:.2f}s")
+    finally:
+        escritor.close()
+        await escritor.wait_closed()
+
+
+async def sessao_terminal(pipeline: PipelineRAGAsync) -> None:
+    async def imprimir(parte: str):
+        print(parte, end="", flush=True)
+
+    while True:
+        pergunta = await asyncio.to_thread(input, "\nSua pergunta: ")
+        if pergunta.lower() == "sair":
+            break
+        filtro, pergunta = separar_filtro(pergunta)
+        print("\nResposta do Assistente:")
+        primeiro_token, total = await responder_com_tempos(pipeline, pergunta, imprimir, filtro)
+        print(f"\n\n(primeiro token em {primeiro_token:.2f}s, resposta completa em {total:.2f}s)")
+
+
+async def main(host: str = HOST_PADRAO, porta: int = PORTA_PADRAO) -> None:
+    # Importar rag_app carrega o índice, o re-ranker e o LLM uma única vez
+    import rag_app
+
+    pipeline = PipelineRAGAsync(
+        rag_app.vectorstore, rag_app.embeddings, rag_app.reranker, rag_app.expansor,
+        rag_app.combine_docs_chain, rag_app.cache_respostas,
+        k=rag_app.K_RECUPERACAO_INICIAL, k_final=rag_app.K_FINAL, fator_corte=rag_app.FATOR_CORTE_RERANKING,
+        indice_lexico=rag_app.indice_lexico, max_candidatos=rag_app.MAX_CANDIDATOS_RERANKING,
+        montador_contexto=rag_app.montador_contexto, indice_metadados=rag_app.indice_metadados,
+    )
+    servidor = await asyncio.start_server(lambda l, e: atender_conexao(pipeline, l, e), host, porta)
+    print(f"Sessões TCP em {host}:{porta} (uma pergunta por linha). Digite 'sair' para encerrar.")
+    async with servidor:
+        await sessao_terminal(pipeline)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
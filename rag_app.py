@@ -1,55 +1,69 @@
 #importação de bibliotecas
-import os
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_ollama import OllamaLLM
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import OllamaEmbeddings # <-- CORRIGIDO: Importação correta que faltava
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
-from sentence_transformers.cross_encoder import CrossEncoder
-# Carregar e preparar os dados 
+from ingestao import sincronizar_indice
+from recuperacao import recuperar_multiplas
+from expansao import ExpansorAdaptativo
+from cache_semantico import CacheSemantico
+from indice_metadados import separar_filtro
+from contexto import MontadorDeContexto, chunks_de_origem
+from telemetria import obter_rastreador
+from recursos import recursos
+
+# --- 1. CARREGAMENTO INCREMENTAL DOS DOCUMENTOS ---
+# Apenas PDFs novos ou alterados são lidos e divididos; o manifesto salvo junto ao
+# índice guarda o hash de cada arquivo e de cada chunk.
 DATA_PATH = "docs/"
-print("Carregando documentos PDF...")
-documentos = []
-for file in os.listdir(DATA_PATH):
-    if file.endswith(".pdf"):
-        pdf_path = os.path.join(DATA_PATH, file)
-        loader = PyPDFLoader(pdf_path)
-        documentos.extend(loader.load())
-print(f"Total de páginas carregados: {len(documentos)}")
-
-# Dividir os documentos em pedaços menores CHUNKS
-print("Dividindo documentos em pedaços menores...")
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=70)
-chunks = text_splitter.split_documents(documentos)
-print(f"Total de pedaços criados: {len(chunks)}")
+# start_index permite ao montador de contexto (contexto.py) unir chunks vizinhos da mesma página
+text_splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=70, add_start_index=True)
 
 
 # --- 2. EMBEDDINGS E VECTOR STORE ---
 FAISS_INDEX_PATH = "faiss_index"
-embeddings = OllamaEmbeddings(model="nomic-embed-text")
-
-if os.path.exists(FAISS_INDEX_PATH):
-    print("Carregando Vector Store existente...")
-    vectorstore = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
-    print("Vector Store carregado com sucesso.")
-else:
-    print("Criando embeddings e armazenando no FAISS...")
-    vectorstore = FAISS.from_documents(chunks, embeddings)
-    vectorstore.save_local(FAISS_INDEX_PATH)
-    print("Vector Store criado e salvo com sucesso.")
+# Embeddings em lotes, com concorrência limitada e cache em disco (embeddings_cache.db).
+# Embeddings, índices, re-ranker e LLM vêm do registro compartilhado (recursos.py)
+embeddings = recursos.obter("embeddings")
+
+# Índice compacto (indice_vetorial.py): HNSW com quantização escalar de 8 bits e docstore
+# em SQLite, aberto via mmap quando não há documentos novos. Use None para o FAISS do LangChain.
+OPCOES_INDICE = {"tipo": "hnsw", "quantizacao": "sq8", "ef_busca": 64}
+
+print("Sincronizando Vector Store com os documentos...")
+vectorstore = sincronizar_indice(DATA_PATH, FAISS_INDEX_PATH, embeddings, text_splitter,
+                                 opcoes_indice=OPCOES_INDICE)
+# O índice recém-sincronizado passa a ser o do processo (agent_app, servidor)
+recursos.definir("vectorstore", vectorstore)
+# Índice BM25 montado pela ingestão em faiss_index/lexico.npz, para a busca híbrida
+indice_lexico = recursos.obter("indice_lexico")
+# Documento, ano, seção e página de cada chunk (faiss_index/metadados.sqlite): perguntas
+# precedidas de filtros, como `ano:2024 secao:Conselho Quem preside o órgão?`, buscam
+# só nos chunks que atendem a eles
+indice_metadados = recursos.obter("indice_metadados")
+
+# Cache semântico de respostas: perguntas quase idênticas reaproveitam a resposta.
+# Respostas que usaram chunks que não existem mais no índice são descartadas aqui e,
+# se o manifesto da ingestão mudar depois, na próxima busca no cache.
+cache_respostas = CacheSemantico(embeddings, escopo="rag_app", limiar_similaridade=0.93,
+                                 pasta_indice=FAISS_INDEX_PATH)
+invalidadas = cache_respostas.verificar_indice()
+if invalidadas:
+    print(f"{invalidadas} respostas do cache semântico invalidadas por mudanças nos documentos.")
 
 
 # --- 3: CONFIGURAÇÃO DAS CHAINS E COMPONENTES ---
-llm = OllamaLLM(model="llama3:8b")
+# llama3:8b com o cache do LLM em disco: prompts repetidos (expansão da mesma
+# pergunta, por exemplo) não voltam ao Ollama
+llm = recursos.obter("llm")
 
-# NOVO: Carrega o modelo de Cross-Encoder para Re-ranking
-print("Carregando modelo de Re-ranker (Cross-Encoder)...")
-cross_encoder = CrossEncoder('BAAI/bge-reranker-base')
-print("Re-ranker carregado.")
+# Re-ranker compartilhado: lotes de 32 pares, sequência limitada a 512 tokens e cache
+# de scores. Em CPU, backend="onnx" com arquivo_onnx="onnx/model_qint8_avx512_vnni.onnx"
+# usa a versão quantizada em int8. O Cross-Encoder (e o sentence-transformers) só é
+# carregado na primeira pergunta que chega ao re-ranking, via recursos.obter("reranker").
+# Candidatos que não ficaram entre os K_FINAL / FATOR_CORTE_RERANKING primeiros de nenhum
+# ranking da primeira etapa (vetorial ou BM25) não são re-rankeados
+FATOR_CORTE_RERANKING = 0.3
 
 
 # Função de expansão de pergunta (sem alterações)
@@ -68,6 +82,13 @@ def expandir_pergunta(pergunta, llm):
     perguntas_expandidas = [pergunta] + res['text'].strip().split('\n')
     return perguntas_expandidas
 
+# Expansão adaptativa: primeiro uma busca só com a pergunta original; se o melhor
+# chunk já passa do limiar do re-ranker, a expansão é dispensada e o LLM não é
+# chamado. Só abaixo do limiar o LLM expande a pergunta e a busca é refeita.
+# Modos: "llm", "adaptativo", "local" (palavras-chave e sinônimos, sem LLM) ou "nenhuma".
+expansor = ExpansorAdaptativo(lambda pergunta: expandir_pergunta(pergunta, llm),
+                              modo="adaptativo", limiar_confianca=0.8)
+
 # Prompt para a geração da resposta final (sem alterações)
 prompt_template_texto = """
 Você é um assistente de pesquisa especializado. Sua tarefa é responder à pergunta do usuário de forma clara e direta, baseando-se exclusivamente no contexto fornecido.
@@ -94,59 +115,98 @@ combine_docs_chain = create_stuff_documents_chain(llm, prompt)
 
 # MUDANÇA: Aumentamos o 'k' para a recuperação inicial (Recall)
 K_RECUPERACAO_INICIAL = 20
-retriever = vectorstore.as_retriever(search_kwargs={"k": K_RECUPERACAO_INICIAL})
-print(f"Retriever criado para a fase de RECUPERAÇÃO com k={K_RECUPERACAO_INICIAL}.")
-
-print("\n--- Inicie a conversa com o assistente de pesquisa (digite 'sair' para terminar) ---")
-while True:
-    pergunta_usuario = input("\nSua pergunta: ")
-    if pergunta_usuario.lower() == 'sair':
-        break
-
-    # 1. FASE DE EXPANSÃO DE PERGUNTA
-    print("\n--- Fase 1: Expandindo a pergunta... ---")
-    perguntas_para_busca = expandir_pergunta(pergunta_usuario, llm)
-    print("Perguntas usadas na busca:", perguntas_para_busca)
-
-    # 2. FASE DE RECUPERAÇÃO (RECALL)
-    print(f"\n--- Fase 2: Recuperando até {K_RECUPERACAO_INICIAL} chunks candidatos... ---")
-    retrieved_docs_list = retriever.batch(perguntas_para_busca)
-    
-    documentos_unicos = {}
-    for result_list in retrieved_docs_list:
-        for doc in result_list:
-            if doc.page_content not in documentos_unicos:
-                documentos_unicos[doc.page_content] = doc
-    
-    candidatos = list(documentos_unicos.values())
-    print(f"Total de {len(candidatos)} chunks candidatos únicos recuperados.")
-
-    # 3. FASE DE RE-RANKING (PRECISION)
-    print(f"\n--- Fase 3: Re-rankeando os {len(candidatos)} candidatos... ---")
-    # Prepara os pares (pergunta, chunk) para o cross-encoder
-    pares_para_reranking = [[pergunta_usuario, doc.page_content] for doc in candidatos]
-    
-    # Obtém as pontuações de relevância
-    scores = cross_encoder.predict(pares_para_reranking)
-    
-    # Combina os documentos com suas novas pontuações e ordena
-    docs_com_scores = list(zip(candidatos, scores))
-    docs_re_rankeados = sorted(docs_com_scores, key=lambda x: x[1], reverse=True)
-    
-    # Seleciona o Top N final para enviar ao LLM
-    K_FINAL = 4
-    documentos_finais = [doc for doc, score in docs_re_rankeados[:K_FINAL]]
-
-    print(f"\n--- {len(documentos_finais)} Documentos Finais após Re-ranking (Diagnóstico) ---")
-    for i, doc in enumerate(documentos_finais):
-        # Mostra o score do re-ranker para diagnóstico
-        print(f"--- Documento {i+1} (Score: {docs_re_rankeados[i][1]:.4f}) ---\n{doc.page_content}\n--------------------------\n")
-
-    # 4. FASE DE GERAÇÃO
-    response = combine_docs_chain.invoke({
-        "input": pergunta_usuario, 
-        "context": documentos_finais # Enviamos apenas os documentos re-rankeados
-    })
-
-    print("\nResposta do Assistente:")
-    print(response)
\ No newline at end of file
+# Documentos re-rankeados entregues ao montador de contexto, que une chunks vizinhos,
+# descarta frases repetidas e mantém só o que cabe no orçamento de tokens
+K_FINAL = 8
+ORCAMENTO_TOKENS_CONTEXTO = 1500
+montador_contexto = MontadorDeContexto(orcamento_tokens=ORCAMENTO_TOKENS_CONTEXTO)
+# Com a busca híbrida (BM25 + vetores) a primeira etapa é mais precisa, então só os
+# melhores candidatos da fusão seguem para o Cross-Encoder
+MAX_CANDIDATOS_RERANKING = 30
+print(f"Recuperação {'híbrida' if indice_lexico else 'vetorial'} multi-consulta, com k={K_RECUPERACAO_INICIAL} por pergunta.")
+if indice_metadados is not None:
+    print(f"Filtros disponíveis: ano:{'/'.join(map(str, indice_metadados.valores('ano')))}, "
+          f"secao:{' | '.join(indice_metadados.valores('secao'))}")
+# Rastros por pergunta e métricas por etapa (configurados pelas variáveis RAG_*, ver telemetria.py)
+rastreador = obter_rastreador()
+
+
+def __getattr__(nome):
+    # rag_app.reranker (pipeline_async.py, servidor.py) carrega o modelo só quando é pedido
+    if nome == "reranker":
+        return recursos.obter("reranker")
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+
+
+# Com `python rag_app.py` o assistente roda no terminal; pipeline_async.py importa os
+# componentes acima para atender várias sessões em paralelo.
+if __name__ == "__main__":
+    print("\n--- Inicie a conversa com o assistente de pesquisa (digite 'sair' para terminar) ---")
+    while True:
+        pergunta_usuario = input("\nSua pergunta: ")
+        if pergunta_usuario.lower() == 'sair':
+            break
+        filtro, pergunta_usuario = separar_filtro(pergunta_usuario)
+
+        # Cada pergunta é um rastro: as etapas abaixo são registradas com o mesmo id
+        with rastreador.rastro("rag_app"):
+            # 0. CACHE SEMÂNTICO: uma pergunta equivalente já respondida dispensa todo o pipeline.
+            # Perguntas com filtro não usam o cache: a mesma pergunta tem outra resposta em outro recorte
+            em_cache = None if filtro else cache_respostas.buscar(pergunta_usuario)
+            if em_cache is not None:
+                resposta_em_cache, ids_de_origem = em_cache
+                print(f"\n--- Resposta do cache semântico ({len(ids_de_origem)} chunks de origem) ---")
+                print("\nResposta do Assistente:")
+                print(resposta_em_cache)
+                continue
+
+            # 1. FASE DE EXPANSÃO DE PERGUNTA (adaptativa: só se a primeira busca não bastar)
+            print("\n--- Fase 1: Expandindo a pergunta (adaptativa)... ---")
+
+            # 2. FASE DE RECUPERAÇÃO (RECALL)
+            # Todas as perguntas em uma única busca matricial; duplicatas são unidas pelo id
+            # do chunk e as listas (vetoriais e BM25) são combinadas por Reciprocal Rank Fusion.
+            def recuperar(perguntas):
+                print(f"\n--- Fase 2: Recuperando até {K_RECUPERACAO_INICIAL} chunks candidatos para {len(perguntas)} pergunta(s)"
+                      f"{f' com o filtro {filtro}' if filtro else ''}... ---")
+                recuperados = recuperar_multiplas(vectorstore, embeddings, perguntas, k=K_RECUPERACAO_INICIAL,
+                                                  indice_lexico=indice_lexico, max_candidatos=MAX_CANDIDATOS_RERANKING,
+                                                  indice_metadados=indice_metadados, filtro=filtro)
+                print(f"Total de {len(recuperados)} chunks candidatos únicos recuperados.")
+                return recuperados
+
+            # 3. FASE DE RE-RANKING (PRECISION)
+            # Seleciona o Top N final para enviar ao LLM; os scores já calculados para a mesma
+            # pergunta e o mesmo chunk vêm do cache do re-ranker
+            def reranquear(recuperados):
+                print(f"\n--- Fase 3: Re-rankeando os {len(recuperados)} candidatos... ---")
+                return recursos.obter("reranker").reranquear(pergunta_usuario, recuperados, top_n=K_FINAL,
+                                                             fator_corte=FATOR_CORTE_RERANKING)
+
+            perguntas_para_busca, docs_re_rankeados = expansor.recuperar(pergunta_usuario, recuperar, reranquear)
+            print("Perguntas usadas na busca:", perguntas_para_busca)
+            documentos_finais = montador_contexto.montar(docs_re_rankeados)
+            resumo = montador_contexto.ultimo_resumo
+
+            print(f"\n--- {len(documentos_finais)} Trechos Finais após Re-ranking e Montagem (Diagnóstico) ---")
+            print(f"{resumo['chunks']} chunks -> {resumo['trechos']} trechos, "
+                  f"~{resumo['tokens_originais']} -> ~{resumo['tokens']} tokens de contexto")
+            for i, doc in enumerate(documentos_finais):
+                # Mostra o score do re-ranker para diagnóstico
+                print(f"--- Trecho {i+1} (Score: {doc.metadata['score_reranking']:.4f}) ---\n{doc.page_content}\n--------------------------\n")
+
+            # 4. FASE DE GERAÇÃO (tokens exibidos à medida que o LLM os gera)
+            print("\nResposta do Assistente:")
+            partes = []
+            with rastreador.etapa("geração", trechos=len(documentos_finais)) as etapa:
+                for parte in combine_docs_chain.stream({
+                    "input": pergunta_usuario, 
+                    "context": documentos_finais # Enviamos apenas os trechos montados dentro do orçamento
+                }):
+                    partes.append(parte)
+                    print(parte, end="", flush=True)
+                etapa["tokens"] = len(partes)
+            print()
+            response = "".join(partes)
+            if not filtro:
+                cache_respostas.guardar(pergunta_usuario, response, chunks_de_origem(documentos_finais))
\ No newline at end of file
@@ -0,0 +1,217 @@
+# --- RECUPERAÇÃO MULTI-CONSULTA EM UMA ÚNICA PASSADA ---
+# Substitui retriever.batch(perguntas): todas as perguntas expandidas são
+# transformadas em vetores em um único lote e buscadas com uma só chamada
+# matricial ao índice. Os resultados são deduplicados pelo id inteiro do chunk
+# (não pelo texto) e combinados com Reciprocal Rank Fusion, tudo em NumPy.
+#
+# Com um índice léxico (indice_lexico.py) a busca é híbrida: o ranking BM25 de cada
+# pergunta entra na mesma fusão RRF que os rankings vetoriais, com peso próprio.
+#
+# Com um índice de metadados (indice_metadados.py) e um `filtro` ({"ano": 2024,
+# "secao": "Conselho"}), a busca é restrita aos chunks que atendem ao filtro antes
+# de comparar vetores: para subconjuntos pequenos, os vetores deles formam um
+# sub-índice exato em memória (guardado por filtro); para os grandes, o índice
+# principal é consultado com k ampliado e os demais ids são descartados.
+import math
+import threading
+from collections import OrderedDict
+import numpy as np
+from indice_metadados import chave_do_filtro
+from telemetria import obter_rastreador
+
+K_RRF = 60
+PESO_LEXICO_PADRAO = 1.0
+MAX_VETORES_SUBINDICE = 50_000
+MAX_SUBINDICES = 8
+
+_lock_subindices = threading.Lock()
+
+
+def buscar_em_lote(vectorstore, vetores, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Retorna (distâncias, ids inteiros) com uma linha por consulta; -1 marca posições vazias."""
+    if hasattr(vectorstore, "buscar_por_vetores"):
+        return vectorstore.buscar_por_vetores(vetores, k)
+    # FAISS do LangChain: o id inteiro é a posição do vetor no índice
+    consultas = np.ascontiguousarray(vetores, dtype="float32")
+    return vectorstore.index.search(consultas, min(k, vectorstore.index.ntotal))
+
+
+def carregar_documentos(vectorstore, ids) -> dict:
+    """Retorna {id_inteiro: Document} para os ids pedidos."""
+    if hasattr(vectorstore, "documentos"):
+        return vectorstore.documentos(ids)
+    return {int(i): vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(i)]) for i in ids}
+
+
+def mapear_ids(vectorstore, doc_ids: list[str]) -> dict:
+    """Retorna {doc_id: id_inteiro} no espaço de ids usado por buscar_em_lote."""
+    if hasattr(vectorstore, "ids_por_doc_id"):
+        return vectorstore.ids_por_doc_id(doc_ids)
+    # FAISS do LangChain: inverte posição -> doc_id uma vez por tamanho de índice
+    mapa = getattr(vectorstore, "_mapa_doc_ids", None)
+    if mapa is None or len(mapa) != len(vectorstore.index_to_docstore_id):
+        mapa = {doc_id: i for i, doc_id in vectorstore.index_to_docstore_id.items()}
+        vectorstore._mapa_doc_ids = mapa
+    return {doc_id: mapa[doc_id] for doc_id in doc_ids if doc_id in mapa}
+
+
+def buscar_lexico_em_lote(vectorstore, indice_lexico, perguntas: list[str], k: int,
+                          mascara: np.ndarray | None = None) -> np.ndarray:
+    """Rankings BM25 como matriz de ids inteiros (uma linha por pergunta, -1 nas posições vazias)."""
+    resultados = indice_lexico.buscar_em_lote(perguntas, k, mascara)
+    mapa = mapear_ids(vectorstore, list({d for doc_ids, _ in resultados for d in doc_ids}))
+    ids = np.full((len(perguntas), k), -1, dtype="int64")
+    for linha, (doc_ids, _) in enumerate(resultados):
+        inteiros = [mapa[d] for d in doc_ids if d in mapa]
+        ids[linha, :len(inteiros)] = inteiros
+    return ids
+
+
+def reconstruir_vetores(vectorstore, ids) -> np.ndarray:
+    """Vetores guardados no índice para os ids inteiros pedidos."""
+    if hasattr(vectorstore, "vetores"):
+        return vectorstore.vetores(ids)
+    return vectorstore.index.reconstruct_batch(np.asarray(ids, dtype="int64"))
+
+
+class Subconjunto:
+    """Chunks que atendem a um filtro: ids inteiros, doc_ids e, se couber, a matriz dos seus vetores."""
+
+    def __init__(self, ids: np.ndarray, doc_ids: list[str], vetores: np.ndarray | None):
+        self.ids = ids
+        self.doc_ids = doc_ids
+        self.vetores = vetores
+        self.normas = None if vetores is None else np.einsum("ij,ij->i", vetores, vetores)
+        self.mascaras_lexicas = {}
+
+    def buscar(self, consultas: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Busca exata (L2 ao quadrado, como o IndexFlatL2) só entre os vetores do subconjunto."""
+        k = min(k, len(self.ids))
+        if k == 0:
+            return (np.full((len(consultas), 0), np.inf, dtype="float32"),
+                    np.full((len(consultas), 0), -1, dtype="int64"))
+        distancias = self.normas[None, :] - 2 * consultas @ self.vetores.T
+        distancias += np.einsum("ij,ij->i", consultas, consultas)[:, None]
+        melhores = np.argpartition(distancias, k - 1, axis=1)[:, :k]
+        ordem = np.argsort(np.take_along_axis(distancias, melhores, axis=1), axis=1, kind="stable")
+        melhores = np.take_along_axis(melhores, ordem, axis=1)
+        return np.take_along_axis(distancias, melhores, axis=1), self.ids[melhores]
+
+    def mascara_lexica(self, indice_lexico) -> np.ndarray:
+        mascara = self.mascaras_lexicas.get(id(indice_lexico))
+        if mascara is None:
+            mascara = self.mascaras_lexicas[id(indice_lexico)] = indice_lexico.mascara(self.doc_ids)
+        return mascara
+
+
+def subconjunto(vectorstore, indice_metadados, filtro: dict) -> Subconjunto:
+    """Resolve o filtro em chunks do vector store; os últimos MAX_SUBINDICES ficam guardados nele."""
+    chave = (indice_metadados.assinatura, chave_do_filtro(filtro))
+    with _lock_subindices:
+        guardados = getattr(vectorstore, "_subconjuntos", None)
+        if guardados is None:
+            guardados = vectorstore._subconjuntos = OrderedDict()
+        encontrado = guardados.get(chave)
+        if encontrado is not None:
+            guardados.move_to_end(chave)
+            return encontrado
+    mapa = mapear_ids(vectorstore, indice_metadados.ids(filtro))
+    doc_ids = list(mapa)
+    ids = np.fromiter(mapa.values(), dtype="int64", count=len(mapa))
+    vetores = None
+    if len(ids) <= MAX_VETORES_SUBINDICE:
+        vetores = np.ascontiguousarray(reconstruir_vetores(vectorstore, ids), dtype="float32")
+    novo = Subconjunto(ids, doc_ids, vetores)
+    with _lock_subindices:
+        guardados[chave] = novo
+        while len(guardados) > MAX_SUBINDICES:
+            guardados.popitem(last=False)
+    return novo
+
+
+def buscar_no_subconjunto(vectorstore, vetores, k: int, sub: Subconjunto,
+                          total: int) -> tuple[np.ndarray, np.ndarray]:
+    """Como buscar_em_lote, mas só com os chunks de `sub` (de um índice com `total` chunks)."""
+    consultas = np.ascontiguousarray(vetores, dtype="float32")
+    if sub.vetores is not None:
+        return sub.buscar(consultas, k)
+    # Subconjunto grande: k ampliado na proporção do filtro, descartando os ids de fora
+    k_amplo = min(total, math.ceil(2 * k * total / max(len(sub.ids), 1)))
+    distancias, ids = buscar_em_lote(vectorstore, consultas, k_amplo)
+    fora = ~np.isin(ids, sub.ids)
+    distancias, ids = distancias.copy(), ids.copy()
+    distancias[fora] = np.inf
+    ids[fora] = -1
+    ordem = np.argsort(distancias, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(distancias, ordem, axis=1), np.take_along_axis(ids, ordem, axis=1)
+
+
+def fundir_rrf(ids: np.ndarray, k_rrf: int = K_RRF,
+               pesos_consultas=None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Reciprocal Rank Fusion: cada chunk recebe a soma de 1 / (k_rrf + posição) em todas as
+    consultas em que aparece, multiplicada pelo peso da consulta (1 por padrão).
+    Retorna (ids únicos, scores, melhor posição de cada um em qualquer consulta),
+    em ordem decrescente de score.
+    """
+    posicoes = np.broadcast_to(np.arange(1, ids.shape[1] + 1), ids.shape)
+    pesos = 1.0 / (k_rrf + posicoes)
+    if pesos_consultas is not None:
+        pesos = pesos * np.asarray(pesos_consultas, dtype="float64")[:, None]
+    validos = ids >= 0
+    unicos, inverso = np.unique(ids[validos], return_inverse=True)
+    scores = np.bincount(inverso, weights=pesos[validos], minlength=len(unicos))
+    melhores = np.full(len(unicos), ids.shape[1] + 1, dtype="int64")
+    np.minimum.at(melhores, inverso, posicoes[validos])
+    ordem = np.argsort(-scores, kind="stable")
+    return unicos[ordem], scores[ordem], melhores[ordem]
+
+
+def recuperar_multiplas(vectorstore, embeddings, perguntas: list[str], k: int = 20,
+                        k_rrf: int = K_RRF, indice_lexico=None, peso_lexico: float = PESO_LEXICO_PADRAO,
+                        max_candidatos: int | None = None, indice_metadados=None,
+                        filtro: dict | None = None) -> list[tuple[int, object, float, int]]:
+    """
+    Busca todas as `perguntas` de uma vez e devolve os candidatos únicos como
+    (id_do_chunk, Document, score_rrf, melhor_posição), do mais para o menos relevante.
+    `melhor_posição` é a melhor colocação do chunk (1 = primeiro) em qualquer um dos
+    rankings fundidos, vetoriais ou BM25.
+
+    Com `indice_lexico`, os rankings BM25 são fundidos aos vetoriais (busca híbrida);
+    `max_candidatos` limita quantos candidatos seguem para o re-ranking. Com `filtro`,
+    só os chunks que o `indice_metadados` aponta para ele são buscados.
+    """
+    if filtro and indice_metadados is None:
+        raise ValueError("A busca com filtro precisa do índice de metadados (faiss_index/metadados.sqlite).")
+    # A expansão pelo LLM às vezes devolve linhas em branco
+    perguntas = [p for p in perguntas if p.strip()]
+    with obter_rastreador().etapa("recuperação", perguntas=len(perguntas), hibrida=indice_lexico is not None,
+                                  filtrada=bool(filtro)) as etapa:
+        # Pergunta vazia (Enter no prompt): o FAISS não aceita uma matriz de consultas sem linhas
+        if not perguntas:
+            etapa["candidatos"] = 0
+            return []
+        sub = subconjunto(vectorstore, indice_metadados, filtro) if filtro else None
+        if sub is not None:
+            etapa["chunks_no_filtro"] = len(sub.ids)
+            if not len(sub.ids):
+                etapa["candidatos"] = 0
+                return []
+        vetores = np.asarray(embeddings.embed_documents(perguntas), dtype="float32")
+        if sub is None:
+            _, ids = buscar_em_lote(vectorstore, vetores, k)
+        else:
+            _, ids = buscar_no_subconjunto(vectorstore, vetores, k, sub, len(indice_metadados))
+        pesos_consultas = None
+        if indice_lexico is not None and len(indice_lexico):
+            mascara = None if sub is None else sub.mascara_lexica(indice_lexico)
+            ids_lexicos = buscar_lexico_em_lote(vectorstore, indice_lexico, perguntas, ids.shape[1], mascara)
+            ids = np.vstack([ids, ids_lexicos])
+            pesos_consultas = np.repeat([1.0, peso_lexico], len(perguntas))
+        ids_unicos, scores, melhores = fundir_rrf(ids, k_rrf, pesos_consultas)
+        if max_candidatos is not None:
+            ids_unicos, scores, melhores = ids_unicos[:max_candidatos], scores[:max_candidatos], melhores[:max_candidatos]
+        docs = carregar_documentos(vectorstore, ids_unicos)
+        etapa["candidatos"] = len(docs)
+    return [(int(i), docs[int(i)], float(s), int(m))
+            for i, s, m in zip(ids_unicos, scores, melhores) if int(i) in docs]
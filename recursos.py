@@ -0,0 +1,199 @@
+# --- REGISTRO DE RECURSOS COMPARTILHADOS ---
+# rag_app.py e agent_app.py montavam cada um seus embeddings, índice, cross-encoder
+# e LLM na importação, e importavam LangChain e sentence-transformers mesmo quando
+# o caminho da pergunta não precisava deles. Aqui cada recurso tem uma fábrica:
+# - `recursos.obter(nome)` carrega o recurso na primeira vez (uma vez por processo,
+#   mesmo com várias threads pedindo ao mesmo tempo) e o devolve pronto depois;
+# - as fábricas importam os módulos pesados só quando são chamadas;
+# - `iniciar_workers` carrega tudo no processo pai e bifurca os workers: os pesos do
+#   modelo e as páginas do índice são compartilhados por cópia-na-escrita. Objetos
+#   com conexões SQLite ou pools de threads se registram em `reabrir_apos_fork` e
+#   refazem esses recursos no processo filho.
+#
+# Uma conexão SQLite aberta antes do fork não pode ser usada no filho, e também não
+# pode ser fechada nele: o close roda o checkpoint do WAL, apaga -wal e -shm e solta
+# travas que o processo pai ainda usa. Quem abre uma conexão nova no filho passa a
+# herdada para `manter_herdada`, que a guarda referenciada até o processo terminar
+# (os workers saem com os._exit, sem finalizar nada).
+import os
+import gc
+import json
+import weakref
+import threading
+import traceback
+from telemetria import obter_rastreador
+
+PASTA_INDICE = "faiss_index"
+MODELO_EMBEDDINGS = "nomic-embed-text"
+MODELO_RERANKER = "BAAI/bge-reranker-base"
+MODELO_LLM = "llama3:8b"
+MODELO_LLM_CHAT = "llama3:instruct"
+
+_reabrir_no_filho = weakref.WeakSet()
+_conexoes_herdadas = []
+
+
+def reabrir_apos_fork(objeto):
+    """Registra `objeto._apos_fork()` para rodar em cada processo filho criado por fork."""
+    _reabrir_no_filho.add(objeto)
+    return objeto
+
+
+def manter_herdada(conexao) -> None:
+    """No processo filho, mantém viva (e nunca fechada) a conexão SQLite herdada do pai."""
+    if conexao is not None:
+        _conexoes_herdadas.append(conexao)
+
+
+class RegistroDeRecursos:
+    """Recursos nomeados, criados sob demanda pela fábrica registrada e reaproveitados no processo."""
+
+    def __init__(self):
+        self._fabricas = {}
+        self._instancias = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, nome: str, fabrica) -> None:
+        with self._lock:
+            self._fabricas[nome] = fabrica
+            self._locks.setdefault(nome, threading.Lock())
+
+    def definir(self, nome: str, valor) -> None:
+        """Usa um objeto já pronto (ex.: o índice recém-sincronizado pelo rag_app)."""
+        with self._lock:
+            self._instancias[nome] = valor
+            self._locks.setdefault(nome, threading.Lock())
+
+    def carregado(self, nome: str) -> bool:
+        return nome in self._instancias
+
+    def obter(self, nome: str):
+        if nome in self._instancias:
+            return self._instancias[nome]
+        with self._lock:
+            if nome not in self._locks:
+                raise KeyError(f"Recurso não registrado: {nome}")
+            trava = self._locks[nome]
+        # Um lock por recurso: carregar o re-ranker não bloqueia quem só quer o LLM
+        with trava:
+            if nome not in self._instancias:
+                with obter_rastreador().etapa("carga de recurso", recurso=nome):
+                    self._instancias[nome] = self._fabricas[nome]()
+        return self._instancias[nome]
+
+    def pre_carregar(self, *nomes) -> None:
+        """Carrega os recursos (todos, se nenhum for informado), por exemplo antes do fork."""
+        for nome in nomes or list(self._fabricas):
+            self.obter(nome)
+
+    def _apos_fork(self) -> None:
+        # Locks podem ter sido copiados adquiridos por outra thread do processo pai
+        self._lock = threading.Lock()
+        self._locks = {nome: threading.Lock() for nome in self._locks}
+
+
+recursos = RegistroDeRecursos()
+
+
+def _no_processo_filho() -> None:
+    recursos._apos_fork()
+    for objeto in list(_reabrir_no_filho):
+        objeto._apos_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_no_processo_filho)
+
+
+def iniciar_workers(num_workers: int, alvo, *nomes) -> None:
+    """
+    Pré-carrega `nomes` (ou todos os recursos) e roda `alvo()` em `num_workers`
+    processos filhos, esperando todos terminarem. Só em sistemas com fork.
+    """
+    recursos.pre_carregar(*nomes)
+    # Objetos que já existem não são mais visitados pelo coletor: as páginas herdadas
+    # não são tocadas pela contagem de gerações e continuam compartilhadas
+    gc.collect()
+    gc.freeze()
+    filhos = []
+    for _ in range(num_workers):
+        pid = os.fork()
+        if pid == 0:
+            codigo = 0
+            try:
+                alvo()
+            except BaseException:
+                traceback.print_exc()
+                codigo = 1
+            finally:
+                os._exit(codigo)
+        filhos.append(pid)
+    for pid in filhos:
+        os.waitpid(pid, 0)
+
+
+# --- Fábricas padrão (imports pesados só aqui dentro) ---
+
+def _embeddings():
+    from embeddings_cache import OllamaEmbeddingsEmCache
+    return OllamaEmbeddingsEmCache(model=MODELO_EMBEDDINGS, tamanho_lote=32, max_concorrencia=4)
+
+
+def _vectorstore():
+    from indice_vetorial import carregar_indice
+    embeddings = recursos.obter("embeddings")
+    origem = getattr(embeddings, "identificador", None)
+    # Lido direto do manifesto: importar ingestao traria pypdf e o FAISS do LangChain
+    caminho_manifesto = os.path.join(PASTA_INDICE, "manifesto.json")
+    origem_salva = None
+    if os.path.exists(caminho_manifesto):
+        with open(caminho_manifesto, encoding="utf-8") as f:
+            origem_salva = json.load(f).get("embeddings")
+    if origem is not None and origem_salva != origem:
+        # Só a ingestão (rag_app.py) recalcula os vetores; aqui o índice é apenas aberto
+        print(f"Aviso: o índice em {PASTA_INDICE} foi gerado por {origem_salva or 'embeddings desconhecidos'}, "
+              f"não por {origem}. Rode rag_app.py para reindexar.")
+    return carregar_indice(PASTA_INDICE, embeddings)
+
+
+def _indice_lexico():
+    from indice_lexico import IndiceLexico
+    return IndiceLexico.carregar(PASTA_INDICE)
+
+
+def _indice_metadados():
+    from indice_metadados import IndiceMetadados
+    return IndiceMetadados.carregar(PASTA_INDICE)
+
+
+def _reranker():
+    from reranker import obter_reranker
+    return obter_reranker(MODELO_RERANKER, tamanho_lote=32, max_comprimento=512)
+
+
+def _cache_llm():
+    from cache_llm import ativar_cache_llm
+    return ativar_cache_llm()
+
+
+def _llm():
+    recursos.obter("cache_llm")
+    from langchain_ollama import OllamaLLM
+    return OllamaLLM(model=MODELO_LLM)
+
+
+def _llm_chat():
+    recursos.obter("cache_llm")
+    from langchain_ollama.chat_models import ChatOllama
+    return ChatOllama(model=MODELO_LLM_CHAT)
+
+
+recursos.registrar("embeddings", _embeddings)
+recursos.registrar("vectorstore", _vectorstore)
+recursos.registrar("indice_lexico", _indice_lexico)
+recursos.registrar("indice_metadados", _indice_metadados)
+recursos.registrar("reranker", _reranker)
+recursos.registrar("cache_llm", _cache_llm)
+recursos.registrar("llm", _llm)
+recursos.registrar("llm_chat", _llm_chat)
@@ -0,0 +1,116 @@
+# --- SERVIÇO DE RE-RANKING COM CROSS-ENCODER ---
+# Um único CrossEncoder por processo (obter_reranker), com:
+# - lotes de tamanho configurável e limite de comprimento da sequência;
+# - cache LRU de (hash da pergunta, id do chunk) -> score;
+# - backend ONNX opcional (inclusive um arquivo quantizado em int8) ou um modelo
+#   destilado menor, para CPUs sem GPU;
+# - corte antecipado: candidatos que não ficaram bem colocados em nenhum dos
+#   rankings da primeira etapa não chegam a ser avaliados pelo cross-encoder.
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from telemetria import obter_rastreador
+
+MODELO_RERANKER_PADRAO = "BAAI/bge-reranker-base"
+
+
+class CacheLRU:
+    """Dicionário limitado por número de entradas, com descarte do item menos usado."""
+
+    def __init__(self, tamanho_maximo: int):
+        self.tamanho_maximo = tamanho_maximo
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def buscar(self, chave):
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave]
+            self.falhas += 1
+            return None
+
+    def guardar(self, chave, valor) -> None:
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_maximo:
+                self._itens.popitem(last=False)
+
+
+class ReRanker:
+    """
+    Re-ranker de pares (pergunta, chunk). `backend="onnx"` usa o ONNX Runtime;
+    `arquivo_onnx` escolhe um arquivo do repositório do modelo, por exemplo
+    "onnx/model_qint8_avx512_vnni.onnx" para a versão quantizada em int8.
+    `cross_encoder` aceita um objeto já pronto com `predict(pares, batch_size)`
+    (ex.: o stub determinístico do benchmark.py), dispensando o sentence-transformers.
+    """
+
+    def __init__(self, modelo: str = MODELO_RERANKER_PADRAO, tamanho_lote: int = 32,
+                 max_comprimento: int = 512, tamanho_cache: int = 20000,
+                 backend: str = "torch", arquivo_onnx: str | None = None, cross_encoder=None):
+        self.modelo = modelo
+        self.tamanho_lote = tamanho_lote
+        self.cache = CacheLRU(tamanho_cache)
+        if cross_encoder is not None:
+            self.cross_encoder = cross_encoder
+            return
+        from sentence_transformers.cross_encoder import CrossEncoder
+
+        opcoes = {}
+        if backend != "torch":
+            opcoes["backend"] = backend
+            if arquivo_onnx:
+                opcoes["model_kwargs"] = {"file_name": arquivo_onnx}
+        self.cross_encoder = CrossEncoder(modelo, max_length=max_comprimento, **opcoes)
+
+    @staticmethod
+    def hash_pergunta(pergunta: str) -> str:
+        return hashlib.sha256(pergunta.strip().encode("utf-8")).hexdigest()
+
+    def pontuar(self, pergunta: str, candidatos: list[tuple[int, object]]) -> list[float]:
+        """Scores do cross-encoder para [(id_do_chunk, Document)], consultando o cache antes."""
+        h = self.hash_pergunta(pergunta)
+        scores = [self.cache.buscar((h, id_chunk)) for id_chunk, _ in candidatos]
+        pendentes = [i for i, score in enumerate(scores) if score is None]
+        if pendentes:
+            pares = [[pergunta, candidatos[i][1].page_content] for i in pendentes]
+            with obter_rastreador().etapa("cross-encoder", avaliados=len(pares),
+                                          acertos_cache=len(candidatos) - len(pendentes)):
+                novos = self.cross_encoder.predict(pares, batch_size=self.tamanho_lote)
+            for i, score in zip(pendentes, novos):
+                scores[i] = float(score)
+                self.cache.guardar((h, candidatos[i][0]), scores[i])
+        return scores
+
+    def reranquear(self, pergunta: str, candidatos: list[tuple], top_n: int,
+                   fator_corte: float | None = None) -> list[tuple[object, float]]:
+        """
+        Recebe (id_do_chunk, Document, score_rrf, melhor_posição), como os de
+        recuperar_multiplas, e devolve os `top_n` melhores (Document, score).
+        Com `fator_corte`, o corte usa a posição, não o score RRF (que soma as listas e
+        derruba quem aparece em uma só): fica quem teve rank recíproco de ao menos
+        fator_corte vezes o do top_n-ésimo, ou seja, melhor_posição <= top_n / fator_corte
+        em algum ranking. Candidatos sem posição (só três campos) nunca são cortados.
+        """
+        with obter_rastreador().etapa("re-ranking", candidatos=len(candidatos)) as etapa:
+            if fator_corte is not None and len(candidatos) > top_n:
+                pior_posicao = top_n / fator_corte
+                candidatos = [c for c in candidatos if len(c) < 4 or c[3] <= pior_posicao]
+            etapa["pontuados"] = len(candidatos)
+            scores = self.pontuar(pergunta, [(id_chunk, doc) for id_chunk, doc, *_ in candidatos])
+            ordenados = sorted(zip((doc for _, doc, *_ in candidatos), scores), key=lambda x: x[1], reverse=True)
+            if ordenados:
+                etapa["melhor_score"] = float(ordenados[0][1])
+        return ordenados[:top_n]
+
+
+@lru_cache(maxsize=None)
+def obter_reranker(modelo: str = MODELO_RERANKER_PADRAO, **opcoes) -> ReRanker:
+    """Retorna o re-ranker compartilhado do processo para essa configuração."""
+    return ReRanker(modelo, **opcoes)
@@ -0,0 +1,141 @@
+# --- ROTEADOR RÁPIDO (SEM LLM NA MAIORIA DAS PERGUNTAS) ---
+# O roteador do agent_app.py fazia uma geração completa do llama3 só para escolher
+# 'pesquisa_documentos', 'calculadora' ou 'geral'. Aqui:
+# 1. contas explícitas vão direto para a calculadora: a pergunta inteira precisa
+#    virar uma expressão em calculadora.traduzir_para_expressao e, além disso, ter
+#    um verbo aritmético ("mais", "vezes", "raiz", "15% de", "calcule") ou ser só a
+#    expressão ("18 * 3 + 2"). "Lei 13.303/2016", "item 1.1 - 2" ou "adota 90% das
+#    práticas" seguem para os passos 2 e 3;
+# 2. as demais perguntas são comparadas, por similaridade de cosseno, com exemplos
+#    rotulados de cada categoria;
+# 3. só quando a similaridade é baixa ou ambígua o roteador LLM é chamado.
+import re
+import threading
+import numpy as np
+from calculadora import traduzir_para_expressao
+from telemetria import obter_rastreador
+
+CATEGORIAS = ("pesquisa_documentos", "calculadora", "geral")
+
+EXEMPLOS_ROTEADOR = {
+    "pesquisa_documentos": [
+        "A Petrobras possui um código de conduta?",
+        "Como funciona o conselho de administração da companhia?",
+        "Quais são as práticas de governança corporativa adotadas?",
+        "A empresa divulga a remuneração dos administradores?",
+        "Existe um comitê de auditoria estatutário?",
+        "Qual a política de transações com partes relacionadas?",
+        "O relatório menciona a política de gerenciamento de riscos?",
+        "Quantos membros independentes tem o conselho?",
+        "Como é feita a avaliação da diretoria executiva?",
+        "O que o informe diz sobre a política de dividendos?",
+        "A companhia tem canal de denúncias?",
+        "Quais são as regras para indicação de conselheiros?",
+    ],
+    "calculadora": [
+        "quanto é 5 mais 3?",
+        "15% de 5000",
+        "qual a raiz quadrada de 81?",
+        "calcule 12 vezes 7",
+        "quanto dá 100 dividido por 4?",
+        "2 elevado a 10",
+        "qual o resultado de 345 menos 123?",
+        "faça a conta 18 * 3 + 2",
+    ],
+    "geral": [
+        "olá, tudo bem?",
+        "bom dia!",
+        "quem é você?",
+        "qual a capital do Brasil?",
+        "me conte uma piada",
+        "obrigado pela ajuda",
+        "o que é inteligência artificial?",
+        "como está o tempo hoje?",
+        "explique o que é uma rede neural",
+    ],
+}
+
+_VERBO_CONTA = re.compile(
+    r"\b(calcul[ae]r?|quanto (?:é|e|dá|da)|resultado d[eao]|fa[çc]a a conta|mais|menos|vezes|dividido|"
+    r"multiplicado|elevado|raiz|ao quadrado|ao cubo|por cento|porcentagem|plus|minus|times|divided|"
+    r"multiplied|square root|squared|cubed|how much is)\b|\d\s*%\s*(?:de|do|da|of)\b|√"
+)
+# Só números, operadores e pontuação: a pergunta é a própria expressão
+_SO_EXPRESSAO = re.compile(r"[\d\s.,+\-*/x×÷^%()=?!]+")
+_PADRAO_PERIODO = re.compile(r"\b(19|20)\d{2}\s*[-/]\s*((19|20)?\d{2})\b")
+
+
+def parece_conta(pergunta: str) -> bool:
+    """Aritmética explícita: a pergunta inteira vira uma expressão e há um verbo de conta (ou nada além dela)."""
+    texto = pergunta.lower().strip()
+    # Períodos como "2023-2024" ou "2023/24" não são subtrações nem divisões
+    if _PADRAO_PERIODO.search(texto) or traduzir_para_expressao(texto) is None:
+        return False
+    return bool(_VERBO_CONTA.search(texto) or _SO_EXPRESSAO.fullmatch(texto))
+
+
+class RoteadorRapido:
+    """
+    Classifica perguntas sem LLM quando possível. `roteador_llm(pergunta)` é o
+    fallback e deve devolver o texto da categoria (como o router_chain).
+    """
+
+    def __init__(self, embeddings, roteador_llm, exemplos: dict | None = None,
+                 limiar_confianca: float = 0.6, margem_minima: float = 0.05):
+        self.embeddings = embeddings
+        self.roteador_llm = roteador_llm
+        self.limiar_confianca = limiar_confianca
+        self.margem_minima = margem_minima
+        self.contagem = {"aritmetica": 0, "embeddings": 0, "llm": 0}
+        self._lock = threading.Lock()
+
+        exemplos = exemplos or EXEMPLOS_ROTEADOR
+        self._rotulos = np.array([categoria for categoria, textos in exemplos.items() for _ in textos])
+        textos = [texto for textos in exemplos.values() for texto in textos]
+        self._matriz = self._normalizar(np.asarray(embeddings.embed_documents(textos), dtype="float32"))
+        self._categorias = list(exemplos)
+
+    @staticmethod
+    def _normalizar(vetores: np.ndarray) -> np.ndarray:
+        normas = np.linalg.norm(vetores, axis=-1, keepdims=True)
+        return vetores / np.where(normas == 0, 1.0, normas)
+
+    def _contar(self, origem: str) -> None:
+        with self._lock:
+            self.contagem[origem] += 1
+
+    def pontuar(self, pergunta: str) -> dict:
+        """Maior similaridade de cosseno da pergunta com os exemplos de cada categoria."""
+        vetor = self._normalizar(np.asarray(self.embeddings.embed_query(pergunta), dtype="float32"))
+        similaridades = self._matriz @ vetor
+        return {c: float(similaridades[self._rotulos == c].max()) for c in self._categorias}
+
+    def classificar(self, pergunta: str) -> str:
+        with obter_rastreador().etapa("roteamento") as etapa:
+            categoria, origem = self._classificar(pergunta)
+            self._contar(origem)
+            etapa.update(categoria=categoria, origem=origem)
+        return categoria
+
+    def _classificar(self, pergunta: str) -> tuple[str, str]:
+        """Retorna (categoria, origem da decisão)."""
+        if parece_conta(pergunta):
+            return "calculadora", "aritmetica"
+
+        pontuacoes = sorted(self.pontuar(pergunta).items(), key=lambda x: x[1], reverse=True)
+        (melhor, score), segundo = pontuacoes[0], pontuacoes[1][1] if len(pontuacoes) > 1 else -1.0
+        if score >= self.limiar_confianca and score - segundo >= self.margem_minima:
+            return melhor, "embeddings"
+
+        resposta = self.roteador_llm(pergunta).strip().lower()
+        # O LLM às vezes responde com pontuação ou frases; fica a primeira categoria citada
+        return next((c for c in CATEGORIAS if c in resposta), "geral"), "llm"
+
+    def taxa_fallback(self) -> float:
+        total = sum(self.contagem.values())
+        return self.contagem["llm"] / total if total else 0.0
+
+    def resumo(self) -> str:
+        c = self.contagem
+        return (f"Roteador: {c['aritmetica']} por aritmética, {c['embeddings']} por embeddings, "
+                f"{c['llm']} pelo LLM (fallback em {self.taxa_fallback():.0%} das perguntas)")
@@ -0,0 +1,249 @@
+# --- SERVIDOR HTTP DO PIPELINE RAG ---
+# Processo de longa duração: índice, embeddings, cross-encoder e LLM são carregados
+# uma única vez (importando rag_app) e atendem muitas requisições concorrentes.
+#
+# - POST /consulta  {"pergunta": "...", "stream": false}
+#     -> {"resposta": "...", "segundos": 1.23}; com "stream": true a resposta vem
+#        em partes (Transfer-Encoding: chunked) à medida que o LLM gera os tokens.
+#        "filtro": {"ano": 2024, "secao": "Conselho"} restringe a busca pelos
+#        metadados dos chunks (indice_metadados.py).
+# - GET /saude      -> carga atual e estatísticas dos micro-lotes.
+# - GET /metricas   -> métricas por etapa no formato texto do Prometheus (telemetria.py).
+#
+# Embeddings e re-ranking de requisições simultâneas são reunidos em micro-lotes
+# (lotes.py). Quando há requisições demais em andamento, ou o Ollama não libera
+# uma vaga de geração a tempo, o servidor responde 503 com Retry-After.
+#
+# `python servidor.py --workers 4` carrega tudo uma vez e bifurca 4 processos que
+# aceitam conexões no mesmo socket, compartilhando pesos e índice por cópia-na-escrita
+# (recursos.iniciar_workers). Cada worker tem suas próprias métricas em /metricas.
+import json
+import time
+import socket
+import asyncio
+import argparse
+from http import HTTPStatus
+from lotes import EmbeddingsEmLote, CrossEncoderEmLote
+from pipeline_async import PipelineRAGAsync, BackendSaturado
+from indice_metadados import CAMPOS, validar_filtro
+from telemetria import obter_rastreador
+from recursos import iniciar_workers
+
+HOST_PADRAO = "127.0.0.1"
+PORTA_PADRAO = 8000
+MAX_CORPO = 64 * 1024
+# Recursos carregados no processo pai antes do fork (servir_com_workers)
+RECURSOS_DOS_WORKERS = ("embeddings", "vectorstore", "indice_lexico", "indice_metadados",
+                        "reranker", "cache_llm", "llm")
+
+
+class ServidorRAG:
+    """Servidor HTTP/1.1 mínimo (asyncio) sobre um PipelineRAGAsync."""
+
+    def __init__(self, pipeline: PipelineRAGAsync, max_em_andamento: int = 64, agrupadores: dict | None = None):
+        self.pipeline = pipeline
+        self.max_em_andamento = max_em_andamento
+        self.agrupadores = agrupadores or {}
+        self.em_andamento = 0
+        self.rejeitadas = 0
+        self.rastreador = obter_rastreador()
+
+    async def _ler_requisicao(self, leitor):
+        linha = await leitor.readline()
+        if not linha:
+            return None
+        metodo, caminho, _ = linha.decode("latin-1").split(" ", 2)
+        cabecalhos = {}
+        while (linha := await leitor.readline()) not in (b"\r\n", b"\n", b""):
+            nome, _, valor = linha.decode("latin-1").partition(":")
+            cabecalhos[nome.strip().lower()] = valor.strip()
+        tamanho = int(cabecalhos.get("content-length", 0))
+        if tamanho > MAX_CORPO:
+            raise ValueError("Corpo da requisição grande demais")
+        corpo = await leitor.readexactly(tamanho) if tamanho else b""
+        return metodo, caminho, corpo
+
+    @staticmethod
+    async def _responder(escritor, status: HTTPStatus, dados: dict, extras: dict | None = None) -> None:
+        corpo = json.dumps(dados, ensure_ascii=False).encode("utf-8")
+        await ServidorRAG._enviar(escritor, status, corpo, "application/json; charset=utf-8", extras)
+
+    @staticmethod
+    async def _enviar(escritor, status: HTTPStatus, corpo: bytes, tipo: str, extras: dict | None = None) -> None:
+        cabecalhos = {"Content-Type": tipo, "Content-Length": str(len(corpo)),
+                      "Connection": "close", **(extras or {})}
+        escritor.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n".encode("latin-1"))
+        escritor.write("".join(f"{k}: {v}\r\n" for k, v in cabecalhos.items()).encode("latin-1"))
+        escritor.write(b"\r\n" + corpo)
+        await escritor.drain()
+
+    async def _saturado(self, escritor, motivo: str) -> None:
+        self.rejeitadas += 1
+        self.rastreador.registro.incrementar("rag_requisicoes_rejeitadas_total", 1,
+                                             "Requisições respondidas com 503", motivo=motivo.split(" ")[0])
+        await self._responder(escritor, HTTPStatus.SERVICE_UNAVAILABLE, {"erro": motivo}, {"Retry-After": "1"})
+
+    async def _consultar(self, escritor, pergunta: str, em_fluxo: bool, filtro: dict | None = None) -> None:
+        inicio = time.perf_counter()
+        partes = self.pipeline.responder(pergunta, filtro)
+        # A primeira parte só chega depois da recuperação e do re-ranking; até lá ainda
+        # é possível responder 503 se o LLM estiver saturado.
+        try:
+            primeira = await anext(partes, "")
+        except BackendSaturado as erro:
+            await self._saturado(escritor, str(erro))
+            return
+        except Exception as erro:
+            await self._responder(escritor, HTTPStatus.INTERNAL_SERVER_ERROR, {"erro": repr(erro)})
+            return
+
+        if not em_fluxo:
+            # Nada foi enviado ainda: um erro no meio da geração também vira 503/500 em JSON
+            try:
+                resposta = [primeira] + [parte async for parte in partes]
+            except BackendSaturado as erro:
+                await self._saturado(escritor, str(erro))
+                return
+            except Exception as erro:
+                await self._responder(escritor, HTTPStatus.INTERNAL_SERVER_ERROR, {"erro": repr(erro)})
+                return
+            await self._responder(escritor, HTTPStatus.OK, {
+                "resposta": "".join(resposta), "segundos": round(time.perf_counter() - inicio, 3),
+            })
+            return
+
+        escritor.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; charset=utf-8\r\n"
+                       b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        parte = primeira
+        while True:
+            dados = parte.encode("utf-8")
+            if dados:
+                escritor.write(f"{len(dados):X}\r\n".encode("latin-1") + dados + b"\r\n")
+                await escritor.drain()
+            parte = await anext(partes, None)
+            if parte is None:
+                break
+        escritor.write(b"0\r\n\r\n")
+        await escritor.drain()
+
+    async def tratar(self, leitor, escritor) -> None:
+        try:
+            try:
+                requisicao = await self._ler_requisicao(leitor)
+            except (ValueError, asyncio.IncompleteReadError) as erro:
+                await self._responder(escritor, HTTPStatus.BAD_REQUEST, {"erro": str(erro)})
+                return
+            if requisicao is None:
+                return
+            metodo, caminho, corpo = requisicao
+
+            if metodo == "GET" and caminho == "/saude":
+                await self._responder(escritor, HTTPStatus.OK, {
+                    "em_andamento": self.em_andamento,
+                    "rejeitadas": self.rejeitadas,
+                    "lotes": {nome: {"lotes": a.lotes_executados, "itens": a.itens_processados}
+                              for nome, a in self.agrupadores.items()},
+                })
+                return
+            if metodo == "GET" and caminho == "/metricas":
+                await self._enviar(escritor, HTTPStatus.OK, self.rastreador.registro.expor().encode("utf-8"),
+                                   "text/plain; version=0.0.4; charset=utf-8")
+                return
+            if metodo != "POST" or caminho != "/consulta":
+                await self._responder(escritor, HTTPStatus.NOT_FOUND, {"erro": f"{metodo} {caminho}"})
+                return
+
+            try:
+                dados = json.loads(corpo or b"{}")
+                pergunta = dados["pergunta"]
+                filtro = dados.get("filtro") or None
+            except (ValueError, KeyError, TypeError, AttributeError):
+                await self._responder(escritor, HTTPStatus.BAD_REQUEST, {
+                    "erro": f"Envie {{\"pergunta\": \"...\"}} e, opcionalmente, \"filtro\" com os campos {list(CAMPOS)}"})
+                return
+            # Pergunta vazia ou que não é texto não chega à recuperação (o FAISS não aceita
+            # consulta sem linhas) nem ocupa uma vaga do LLM
+            if not isinstance(pergunta, str) or not pergunta.strip():
+                await self._responder(escritor, HTTPStatus.BAD_REQUEST, {
+                    "erro": "\"pergunta\" deve ser um texto não vazio"})
+                return
+            pergunta = pergunta.strip()
+            if filtro is not None:
+                try:
+                    validar_filtro(filtro)
+                    if self.pipeline.indice_metadados is None:
+                        raise ValueError("Filtros indisponíveis: o índice de metadados (metadados.sqlite) "
+                                         "ainda não foi criado pela ingestão.")
+                except ValueError as erro:
+                    await self._responder(escritor, HTTPStatus.BAD_REQUEST, {"erro": str(erro)})
+                    return
+
+            if self.em_andamento >= self.max_em_andamento:
+                await self._saturado(escritor, "Servidor com requisições demais em andamento")
+                return
+            self.em_andamento += 1
+            self.rastreador.registro.ajustar("rag_requisicoes_em_andamento", 1, "Consultas HTTP em andamento")
+            try:
+                # Um rastro por consulta: as etapas do pipeline ficam com o mesmo id
+                with self.rastreador.rastro("consulta http", fluxo=bool(dados.get("stream"))):
+                    await self._consultar(escritor, pergunta, bool(dados.get("stream")), filtro)
+            finally:
+                self.em_andamento -= 1
+                self.rastreador.registro.ajustar("rag_requisicoes_em_andamento", -1)
+        except ConnectionError:
+            pass
+        finally:
+            escritor.close()
+
+
+async def main(host: str = HOST_PADRAO, porta: int = PORTA_PADRAO, sock: socket.socket | None = None) -> None:
+    # Importar rag_app carrega o índice, o re-ranker e o LLM uma única vez
+    import rag_app
+
+    embeddings = EmbeddingsEmLote(rag_app.embeddings, janela_ms=5.0)
+    reranker = rag_app.reranker
+    reranker.cross_encoder = CrossEncoderEmLote(reranker.cross_encoder, tamanho_lote=reranker.tamanho_lote,
+                                                janela_ms=5.0)
+    rag_app.cache_respostas.embeddings = embeddings
+
+    pipeline = PipelineRAGAsync(
+        rag_app.vectorstore, embeddings, reranker, rag_app.expansor,
+        rag_app.combine_docs_chain, rag_app.cache_respostas,
+        k=rag_app.K_RECUPERACAO_INICIAL, k_final=rag_app.K_FINAL, fator_corte=rag_app.FATOR_CORTE_RERANKING,
+        max_geracoes_simultaneas=2, espera_max_geracao=30.0,
+        indice_lexico=rag_app.indice_lexico, max_candidatos=rag_app.MAX_CANDIDATOS_RERANKING,
+        montador_contexto=rag_app.montador_contexto, indice_metadados=rag_app.indice_metadados,
+    )
+    servidor = ServidorRAG(pipeline, max_em_andamento=64, agrupadores={
+        "embeddings": embeddings.agrupador, "reranker": reranker.cross_encoder.agrupador,
+    })
+    if sock is not None:
+        tcp = await asyncio.start_server(servidor.tratar, sock=sock)
+    else:
+        tcp = await asyncio.start_server(servidor.tratar, host, porta)
+    print(f"Servidor RAG ouvindo em http://{host}:{porta} (POST /consulta, GET /saude, GET /metricas)")
+    async with tcp:
+        await tcp.serve_forever()
+
+
+def servir_com_workers(host: str, porta: int, num_workers: int) -> None:
+    """Pré-fork: índice, re-ranker e LLM são carregados no processo pai antes de bifurcar."""
+    import rag_app  # noqa: F401 (carrega e registra os recursos no processo pai)
+
+    sock = socket.create_server((host, porta), backlog=1024)
+    sock.setblocking(False)
+    # Só o que o pipeline do rag_app usa; o llm_chat é do agent_app e não é carregado
+    iniciar_workers(num_workers, lambda: asyncio.run(main(host, porta, sock=sock)),
+                    *RECURSOS_DOS_WORKERS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor HTTP do pipeline RAG")
+    parser.add_argument("--host", default=HOST_PADRAO)
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    parser.add_argument("--workers", type=int, default=1, help="processos que atendem o mesmo socket (pré-fork)")
+    args = parser.parse_args()
+    if args.workers > 1:
+        servir_com_workers(args.host, args.porta, args.workers)
+    else:
+        asyncio.run(main(args.host, args.porta))
@@ -0,0 +1,309 @@
+# --- TELEMETRIA: RASTROS POR ETAPA, MÉTRICAS E PERFIL ---
+# Cada etapa do pipeline (expansão, recuperação, re-ranking, geração, roteamento,
+# ferramentas, tarefas da crew) roda dentro de `rastreador.etapa(nome, ...)`, que
+# registra o tempo de relógio e os atributos da etapa (tokens, candidatos, acertos
+# de cache...). Cada etapa concluída:
+# - vira uma linha JSON no arquivo de rastros (RAG_TRACE_ARQUIVO), com o id do
+#   rastro da pergunta para juntar as etapas de uma mesma requisição;
+# - alimenta um registro de métricas no formato do Prometheus (histograma de
+#   duração, contadores e etapas em andamento), exposto em /metricas pelo servidor.
+#
+# Análise de pontos quentes (opcional):
+# - RAG_PERFIL_ETAPAS="re-ranking,geração" (ou "*") roda essas etapas sob cProfile
+#   e grava perfil/<etapa>.prof ao final do processo;
+# - RAG_AMOSTRAGEM_MS=10 liga um amostrador de pilhas que conta, por etapa, as
+#   funções em execução e imprime as mais frequentes ao final.
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import cProfile
+import threading
+import contextvars
+import functools
+import asyncio
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import lru_cache
+
+LIMITES_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Atributos numéricos das etapas que também viram contadores rag_<atributo>_total
+ATRIBUTOS_CONTADOS = ("tokens", "candidatos", "avaliados", "acertos_cache", "falhas_cache", "perguntas")
+
+_rastro_atual = contextvars.ContextVar("rastro_atual", default=None)
+# Etapa em execução no contexto atual: cada tarefa asyncio tem a sua, mesmo dividindo a thread
+_etapa_atual = contextvars.ContextVar("etapa_atual", default=None)
+
+
+def _rotulos(rotulos: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+
+def _formatar_rotulos(rotulos: tuple, extras: tuple = ()) -> str:
+    pares = rotulos + extras
+    if not pares:
+        return ""
+    escapados = (f'{k}="{v.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in pares)
+    return "{" + ",".join(escapados) + "}"
+
+
+class RegistroMetricas:
+    """Contadores, medidores e histogramas com rótulos, exportados no formato texto do Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tipos = {}
+        self._ajuda = {}
+        self._valores = defaultdict(float)
+        self._histogramas = {}
+
+    def _registrar(self, nome: str, tipo: str, ajuda: str) -> None:
+        self._tipos.setdefault(nome, tipo)
+        if ajuda:
+            self._ajuda.setdefault(nome, ajuda)
+
+    def incrementar(self, nome: str, valor: float = 1.0, ajuda: str = "", **rotulos) -> None:
+        with self._lock:
+            self._registrar(nome, "counter", ajuda)
+            self._valores[(nome, _rotulos(rotulos))] += valor
+
+    def ajustar(self, nome: str, delta: float, ajuda: str = "", **rotulos) -> None:
+        """Medidor (gauge): soma `delta` ao valor atual."""
+        with self._lock:
+            self._registrar(nome, "gauge", ajuda)
+            self._valores[(nome, _rotulos(rotulos))] += delta
+
+    def observar(self, nome: str, valor: float, ajuda: str = "", limites=LIMITES_PADRAO, **rotulos) -> None:
+        with self._lock:
+            self._registrar(nome, "histogram", ajuda)
+            chave = (nome, _rotulos(rotulos))
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = {"limites": tuple(limites), "contagens": [0] * len(limites),
+                                                         "soma": 0.0, "total": 0}
+            for i, limite in enumerate(histograma["limites"]):
+                if valor <= limite:
+                    histograma["contagens"][i] += 1
+            histograma["soma"] += valor
+            histograma["total"] += 1
+
+    def valor(self, nome: str, **rotulos) -> float:
+        with self._lock:
+            return self._valores.get((nome, _rotulos(rotulos)), 0.0)
+
+    def expor(self) -> str:
+        linhas = []
+        with self._lock:
+            for nome in sorted(self._tipos):
+                if nome in self._ajuda:
+                    linhas.append(f"# HELP {nome} {self._ajuda[nome]}")
+                linhas.append(f"# TYPE {nome} {self._tipos[nome]}")
+                for (n, rotulos), valor in sorted(self._valores.items()):
+                    if n == nome:
+                        linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {valor:g}")
+                for (n, rotulos), h in sorted(self._histogramas.items()):
+                    if n != nome:
+                        continue
+                    for limite, contagem in zip(h["limites"], h["contagens"]):
+                        linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos, (('le', f'{limite:g}'),))} {contagem}")
+                    linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos, (('le', '+Inf'),))} {h['total']}")
+                    linhas.append(f"{nome}_sum{_formatar_rotulos(rotulos)} {h['soma']:g}")
+                    linhas.append(f"{nome}_count{_formatar_rotulos(rotulos)} {h['total']}")
+        return "\n".join(linhas) + "\n"
+
+
+class AmostradorDePilhas:
+    """Perfil por amostragem: a cada `intervalo_ms` anota a função em execução em cada thread."""
+
+    def __init__(self, rastreador: "Rastreador", intervalo_ms: float = 10.0):
+        self.rastreador = rastreador
+        self.intervalo = intervalo_ms / 1000
+        self.amostras = defaultdict(Counter)
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name="amostrador-de-pilhas", daemon=True)
+
+    def iniciar(self) -> None:
+        self._thread.start()
+
+    def parar(self) -> None:
+        self._parar.set()
+
+    def _executar(self) -> None:
+        proprio = threading.get_ident()
+        while not self._parar.wait(self.intervalo):
+            etapas = dict(self.rastreador._etapa_por_thread)
+            for ident, quadro in sys._current_frames().items():
+                if ident == proprio:
+                    continue
+                codigo = quadro.f_code
+                local = f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}:{quadro.f_lineno}"
+                self.amostras[etapas.get(ident, "(fora de etapa)")][local] += 1
+
+    def relatorio(self, top: int = 10) -> str:
+        linhas = [f"--- Amostragem de pilhas (a cada {self.intervalo * 1000:g} ms) ---"]
+        for etapa, contagem in sorted(self.amostras.items(), key=lambda x: -sum(x[1].values())):
+            total = sum(contagem.values())
+            linhas.append(f"{etapa}: {total} amostras")
+            for local, n in contagem.most_common(top):
+                linhas.append(f"  {n / total:6.1%}  {local}")
+        return "\n".join(linhas)
+
+
+class Rastreador:
+    """
+    Registra etapas em JSON lines (`arquivo`, opcional) e no `registro` de métricas.
+    `perfil_etapas` lista as etapas executadas sob cProfile ("*" para todas).
+    """
+
+    def __init__(self, arquivo: str | None = None, registro: RegistroMetricas | None = None,
+                 perfil_etapas=(), pasta_perfil: str = "perfil", habilitado: bool = True):
+        self.registro = registro or RegistroMetricas()
+        self.habilitado = habilitado
+        self.perfil_etapas = set(perfil_etapas)
+        self.pasta_perfil = pasta_perfil
+        self.amostrador = None
+        self._arquivo = open(arquivo, "a", encoding="utf-8", buffering=1) if arquivo else None
+        self._lock_arquivo = threading.Lock()
+        # cProfile não aceita dois perfis ativos ao mesmo tempo; quem não conseguir o lock roda sem perfil
+        self._lock_perfil = threading.Lock()
+        self._perfis = {}
+        # Só para o amostrador, que não enxerga os contextos das outras threads: a última
+        # etapa iniciada ou retomada em cada uma (aproximado quando há várias tarefas asyncio)
+        self._etapa_por_thread = {}
+
+    @classmethod
+    def do_ambiente(cls) -> "Rastreador":
+        etapas = [e.strip() for e in os.environ.get("RAG_PERFIL_ETAPAS", "").split(",") if e.strip()]
+        rastreador = cls(arquivo=os.environ.get("RAG_TRACE_ARQUIVO") or None, perfil_etapas=etapas,
+                         habilitado=os.environ.get("RAG_TELEMETRIA", "1") != "0")
+        if etapas:
+            atexit.register(rastreador.salvar_perfis)
+        if os.environ.get("RAG_AMOSTRAGEM_MS"):
+            rastreador.amostrador = AmostradorDePilhas(rastreador, float(os.environ["RAG_AMOSTRAGEM_MS"]))
+            rastreador.amostrador.iniciar()
+            atexit.register(lambda: print(rastreador.amostrador.relatorio()))
+        return rastreador
+
+    def _emitir(self, registro: dict) -> None:
+        if self._arquivo is None:
+            return
+        linha = json.dumps(registro, ensure_ascii=False, default=str)
+        with self._lock_arquivo:
+            self._arquivo.write(linha + "\n")
+
+    def registrar(self, nome: str, duracao_s: float, status: str = "ok", **atributos) -> None:
+        """Registra uma etapa já concluída (ex.: medida por um callback)."""
+        if not self.habilitado:
+            return
+        self.registro.observar("rag_etapa_duracao_segundos", duracao_s, "Duração das etapas do pipeline", etapa=nome)
+        self.registro.incrementar("rag_etapa_execucoes_total", 1, "Etapas executadas", etapa=nome, status=status)
+        for atributo in ATRIBUTOS_CONTADOS:
+            valor = atributos.get(atributo)
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                self.registro.incrementar(f"rag_{atributo}_total", valor, etapa=nome)
+        self._emitir({"ts": time.time() - duracao_s, "rastro": _rastro_atual.get(), "etapa": nome,
+                      "duracao_ms": round(duracao_s * 1000, 3), "status": status, **atributos})
+
+    @contextmanager
+    def etapa(self, nome: str, **atributos):
+        """Mede a etapa; o dicionário produzido aceita atributos definidos durante a execução."""
+        if not self.habilitado:
+            yield atributos
+            return
+        ident = threading.get_ident()
+        anterior = _etapa_atual.get()
+        token = _etapa_atual.set(nome)
+        self._etapa_por_thread[ident] = nome
+        self.registro.ajustar("rag_etapas_em_andamento", 1, "Etapas em execução neste momento", etapa=nome)
+        perfil = None
+        if (nome in self.perfil_etapas or "*" in self.perfil_etapas) and self._lock_perfil.acquire(blocking=False):
+            perfil = self._perfis.setdefault(nome, cProfile.Profile())
+            perfil.enable()
+        status = "ok"
+        inicio = time.perf_counter()
+        try:
+            yield atributos
+        except BaseException as erro:
+            status = "erro"
+            atributos.setdefault("erro", repr(erro))
+            raise
+        finally:
+            duracao = time.perf_counter() - inicio
+            if perfil is not None:
+                perfil.disable()
+                self._lock_perfil.release()
+            self.registro.ajustar("rag_etapas_em_andamento", -1, etapa=nome)
+            try:
+                _etapa_atual.reset(token)
+            except ValueError:
+                # Gerador assíncrono encerrado em outro contexto: volta a etapa de quem o abriu
+                _etapa_atual.set(anterior)
+            if anterior is None:
+                self._etapa_por_thread.pop(ident, None)
+            else:
+                self._etapa_por_thread[ident] = anterior
+            self.registrar(nome, duracao, status, **atributos)
+
+    @contextmanager
+    def rastro(self, nome: str, **atributos):
+        """Abre um rastro (uma pergunta, uma execução da crew): as etapas internas compartilham o id."""
+        token = _rastro_atual.set(uuid.uuid4().hex[:16])
+        try:
+            with self.etapa(nome, **atributos) as dados:
+                yield dados
+        finally:
+            _rastro_atual.reset(token)
+
+    def instrumentar(self, nome: str):
+        """Decorador que executa a função (síncrona ou corrotina) dentro de uma etapa."""
+        def decorador(funcao):
+            if asyncio.iscoroutinefunction(funcao):
+                @functools.wraps(funcao)
+                async def envolvida_async(*args, **kwargs):
+                    with self.etapa(nome):
+                        return await funcao(*args, **kwargs)
+                return envolvida_async
+
+            @functools.wraps(funcao)
+            def envolvida(*args, **kwargs):
+                with self.etapa(nome):
+                    return funcao(*args, **kwargs)
+            return envolvida
+        return decorador
+
+    def salvar_perfis(self) -> None:
+        os.makedirs(self.pasta_perfil, exist_ok=True)
+        for nome, perfil in self._perfis.items():
+            arquivo = "".join(c if c.isalnum() else "_" for c in nome)
+            perfil.dump_stats(os.path.join(self.pasta_perfil, f"{arquivo}.prof"))
+
+
+class CronometroDeTarefas:
+    """
+    task_callback para Crews sequenciais: cada tarefa dura do fim da anterior (ou de
+    `iniciar()`) até o seu próprio fim.
+    """
+
+    def __init__(self, rastreador: Rastreador, etapa: str = "tarefa da crew"):
+        self.rastreador = rastreador
+        self.etapa = etapa
+        self._ultimo = time.perf_counter()
+
+    def iniciar(self) -> None:
+        self._ultimo = time.perf_counter()
+
+    def __call__(self, saida) -> None:
+        agora = time.perf_counter()
+        self.rastreador.registrar(self.etapa, agora - self._ultimo,
+                                  tarefa=str(getattr(saida, "description", ""))[:80],
+                                  agente=str(getattr(saida, "agent", "")),
+                                  tokens=len(str(getattr(saida, "raw", "")).split()))
+        self._ultimo = agora
+
+
+@lru_cache(maxsize=None)
+def obter_rastreador() -> Rastreador:
+    """Rastreador compartilhado do processo, configurado pelas variáveis de ambiente RAG_*."""
+    return Rastreador.do_ambiente()
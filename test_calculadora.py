@@ -0,0 +1,53 @@
+# Testes da avaliação em lote da calculadora contra a avaliação de uma expressão por vez.
+import math
+import pytest
+from calculadora import avaliar_em_lote, avaliar_expressao, calcular, calcular_em_lote, calcular_varias
+
+EXPRESSOES = [
+    "2 + 3", "7 + 11", "0.5 + 1e3",                  # mesma estrutura: um grupo só
+    "3 * 4 / 5", "10 * 2.5 / 4", "1 * 1 / 3",
+    "(15/100)*5000", "(7.5/100)*80",
+    "sqrt(81)", "math.sqrt(2)", "np.cbrt(27)", "log(10)", "log2(1024)", "abs(-4.5)",
+    "-3 ** 2", "+7 % 3", "17 // 5", "2 ** 0.5", "-(2 + 3) * 4",
+    "1 / 0", "log(0)", "sqrt(-1)", "10 % 0",           # indefinidas
+    "__import__('os')", "2 +", "'a' * 3", "True + 1",  # inválidas
+]
+
+
+def _um_por_vez(expressao: str) -> float:
+    try:
+        return avaliar_expressao(expressao)
+    except ValueError:
+        return math.nan
+
+
+def test_lote_igual_a_uma_por_vez():
+    esperado = [_um_por_vez(e) for e in EXPRESSOES]
+    obtido = avaliar_em_lote(EXPRESSOES)
+    assert len(obtido) == len(EXPRESSOES)
+    for expressao, valor, referencia in zip(EXPRESSOES, obtido, esperado):
+        if math.isnan(referencia):
+            assert math.isnan(valor), expressao
+        else:
+            assert valor == referencia, expressao
+
+
+def test_lote_vazio_e_unitario():
+    assert avaliar_em_lote([]).shape == (0,)
+    assert avaliar_em_lote(["6 * 7"]).tolist() == [42.0]
+
+
+def test_calcular_em_lote_igual_a_calcular():
+    perguntas = ["quanto é 5 mais 3?", "15% de 5000", "raiz quadrada de 81", "qual a capital da França?",
+                 "aumento de 10% sobre 200", "10 dividido por 0", "12 vezes 12"]
+    assert calcular_em_lote(perguntas) == [calcular(p) for p in perguntas]
+
+
+@pytest.mark.parametrize("pergunta, esperado", [
+    ("2 mais 3; 15% de 80", [("2 + 3", 5.0), ("(15/100)*80", 12.0)]),
+    ("raiz de 81\n4 vezes 5\n\n10 - 7", [("sqrt(81)", 9.0), ("4 * 5", 20.0), ("10 - 7", 3.0)]),
+    ("2 mais 3", None),                    # uma conta só: segue o caminho de calcular()
+    ("2 mais 3; qual a capital?", None),   # uma das partes não é conta
+])
+def test_calcular_varias(pergunta, esperado):
+    assert calcular_varias(pergunta) == esperado
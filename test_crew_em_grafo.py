@@ -0,0 +1,64 @@
+# Testes do ExecutorEmGrafo com tarefas falsas no lugar das Tasks do CrewAI (sem LLM).
+import time
+import asyncio
+from types import SimpleNamespace
+import pytest
+from crew_em_grafo import ExecutorEmGrafo, SEPARADOR_CONTEXTO, ordenar_tarefas
+
+
+class TarefaFalsa:
+    """Imita Task.execute_sync: guarda o contexto recebido e devolve uma saída com `raw`."""
+
+    def __init__(self, nome: str, context=None, espera: float = 0.0):
+        self.name = nome
+        self.description = nome
+        self.agent = SimpleNamespace(role=f"agente de {nome}")
+        self.context = context
+        self.espera = espera
+        self.contextos = []
+        self.inicio = self.fim = None
+
+    def execute_sync(self, agent, context=None):
+        self.inicio = time.perf_counter()
+        self.contextos.append(context)
+        time.sleep(self.espera)
+        self.fim = time.perf_counter()
+        return SimpleNamespace(raw=f"saída de {self.name}")
+
+
+def _tarefas_da_viagem(espera: float = 0.0):
+    cidade = TarefaFalsa("atrações", espera=espera)
+    comida = TarefaFalsa("restaurantes", espera=espera)
+    roteiro = TarefaFalsa("roteiro", context=[cidade, comida])
+    return cidade, comida, roteiro
+
+
+def test_roteiro_recebe_as_duas_saidas_no_contexto():
+    cidade, comida, roteiro = _tarefas_da_viagem()
+    saidas = asyncio.run(ExecutorEmGrafo([cidade, comida, roteiro]).executar())
+
+    assert cidade.contextos == [None] and comida.contextos == [None]
+    # As duas dependências, na ordem do `context`, com o separador da Crew
+    assert roteiro.contextos == [saidas[0].raw + SEPARADOR_CONTEXTO + saidas[1].raw]
+    assert [s.raw for s in saidas] == ["saída de atrações", "saída de restaurantes", "saída de roteiro"]
+
+
+def test_pesquisas_independentes_rodam_juntas():
+    cidade, comida, roteiro = _tarefas_da_viagem(espera=0.2)
+    # Declaradas fora da ordem: o roteiro ainda espera as duas pesquisas
+    executor = ExecutorEmGrafo([roteiro, comida, cidade], max_simultaneas=2)
+    asyncio.run(executor.executar())
+
+    assert max(cidade.inicio, comida.inicio) < min(cidade.fim, comida.fim)
+    assert roteiro.inicio >= max(cidade.fim, comida.fim)
+    assert executor.ultimo_resumo["caminho_critico"] < executor.ultimo_resumo["soma_das_tarefas"]
+
+
+def test_ciclo_e_dependencia_fora_da_lista():
+    a = TarefaFalsa("a")
+    b = TarefaFalsa("b", context=[a])
+    a.context = [b]
+    with pytest.raises(ValueError, match="circulares"):
+        ordenar_tarefas([a, b])
+    with pytest.raises(ValueError, match="não está na lista"):
+        ordenar_tarefas([TarefaFalsa("c", context=[TarefaFalsa("d")])])
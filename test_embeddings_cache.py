@@ -0,0 +1,75 @@
+# Testes do cliente de embeddings contra um servidor /api/embed falso, local.
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from embeddings_cache import OllamaEmbeddingsEmCache
+
+
+def _vetor(modelo: str, texto: str) -> list[float]:
+    return [float(len(texto)), float(sum(map(ord, texto)) % 997), float(len(modelo))]
+
+
+@pytest.fixture
+def servidor():
+    """Servidor falso do Ollama; guarda o corpo de cada requisição recebida."""
+    recebidas = []
+
+    class Tratador(BaseHTTPRequestHandler):
+        def do_POST(self):
+            corpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            recebidas.append((self.path, corpo))
+            dados = json.dumps({"embeddings": [_vetor(corpo["model"], t) for t in corpo["input"]]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def log_message(self, *args):
+            pass
+
+    http = ThreadingHTTPServer(("127.0.0.1", 0), Tratador)
+    threading.Thread(target=http.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{http.server_address[1]}", recebidas
+    http.shutdown()
+    http.server_close()
+
+
+def test_lotes_e_deduplicacao(servidor, tmp_path):
+    url, recebidas = servidor
+    cliente = OllamaEmbeddingsEmCache("modelo-a", base_url=url, tamanho_lote=2, max_concorrencia=2,
+                                      caminho_cache=str(tmp_path / "cache.db"))
+    textos = ["um", "dois", "tres", "um", "quatro", "cinco"]
+    vetores = cliente.embed_documents(textos)
+
+    assert vetores == [pytest.approx(_vetor("modelo-a", t)) for t in textos]
+    assert all(caminho == "/api/embed" for caminho, _ in recebidas)
+    # 5 textos distintos em lotes de 2: 3 requisições, nenhum texto enviado duas vezes
+    enviados = [t for _, corpo in recebidas for t in corpo["input"]]
+    assert len(recebidas) == 3 and sorted(enviados) == sorted(set(textos))
+    assert max(len(corpo["input"]) for _, corpo in recebidas) == 2
+
+
+def test_cache_persistente_por_modelo(servidor, tmp_path):
+    url, recebidas = servidor
+    caminho = str(tmp_path / "cache.db")
+    OllamaEmbeddingsEmCache("modelo-a", base_url=url, caminho_cache=caminho).embed_documents(["a", "b"])
+    assert len(recebidas) == 1
+
+    # Outra instância com o mesmo arquivo: tudo vem do cache, sem requisições
+    outro = OllamaEmbeddingsEmCache("modelo-a", base_url=url, caminho_cache=caminho)
+    assert outro.embed_query("a") == pytest.approx(_vetor("modelo-a", "a"))
+    assert outro.embed_documents(["b", "a"]) == [pytest.approx(_vetor("modelo-a", t)) for t in ("b", "a")]
+    assert len(recebidas) == 1
+
+    # O modelo faz parte da chave: outro modelo calcula de novo
+    OllamaEmbeddingsEmCache("modelo-b", base_url=url, caminho_cache=caminho).embed_query("a")
+    assert len(recebidas) == 2 and recebidas[-1][1]["model"] == "modelo-b"
+
+
+def test_identificador_nomeia_o_espaco_vetorial(tmp_path):
+    a = OllamaEmbeddingsEmCache("modelo-a", caminho_cache=None)
+    b = OllamaEmbeddingsEmCache("modelo-b", caminho_cache=None)
+    assert a.identificador != b.identificador
+    assert "/api/embed" in a.identificador
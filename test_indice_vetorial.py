@@ -0,0 +1,43 @@
+# Testes de IndiceVetorial.vetores antes e depois do treino do índice.
+import numpy as np
+import pytest
+from indice_vetorial import IndiceVetorial
+
+
+class EmbeddingsFalsos:
+    """Vetores determinísticos pelo texto; nenhum servidor envolvido."""
+
+    def embed_documents(self, textos):
+        return [np.random.default_rng(sum(map(ord, t))).random(16).tolist() for t in textos]
+
+    def embed_query(self, texto):
+        return self.embed_documents([texto])[0]
+
+
+def _indice_ivf(quantidade: int) -> IndiceVetorial:
+    textos = [f"trecho número {i} do informe" for i in range(quantidade)]
+    return IndiceVetorial.from_texts(textos, EmbeddingsFalsos(), ids=[f"c{i}" for i in range(quantidade)],
+                                     tipo="ivf", nlist=4, min_treino=50)
+
+
+def test_vetores_da_area_de_espera():
+    indice = _indice_ivf(10)
+    assert indice._indice is None
+    ids = list(indice.ids_por_doc_id(["c3", "c7"]).values())
+    np.testing.assert_allclose(indice.vetores(ids), indice.embeddings.embed_documents(
+        ["trecho número 3 do informe", "trecho número 7 do informe"]), rtol=1e-6)
+
+
+def test_id_inexistente_antes_do_treino_levanta_keyerror():
+    indice = _indice_ivf(10)
+    with pytest.raises(KeyError, match="987654"):
+        indice.vetores([987654])
+    with pytest.raises(KeyError):
+        IndiceVetorial(EmbeddingsFalsos(), tipo="ivf").vetores([1])
+
+
+def test_vetores_depois_do_treino():
+    indice = _indice_ivf(80)
+    assert indice._indice is not None
+    ids = list(indice.ids_por_doc_id(["c0", "c79"]).values())
+    assert indice.vetores(ids).shape == (2, 16)
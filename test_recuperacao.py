@@ -0,0 +1,33 @@
+# Testes da recuperação multi-consulta sobre um IndiceVetorial pequeno, em memória.
+import numpy as np
+import pytest
+from indice_vetorial import IndiceVetorial
+from recuperacao import recuperar_multiplas
+
+
+class EmbeddingsFalsos:
+    """Vetores determinísticos pelo texto; nenhum servidor envolvido."""
+
+    def embed_documents(self, textos):
+        return [np.random.default_rng(sum(map(ord, t))).random(16).tolist() for t in textos]
+
+    def embed_query(self, texto):
+        return self.embed_documents([texto])[0]
+
+
+@pytest.fixture(params=[("flat", None), ("hnsw", "sq8")])
+def vectorstore(request):
+    tipo, quantizacao = request.param
+    textos = [f"trecho número {i} do informe" for i in range(120)]
+    return IndiceVetorial.from_texts(textos, EmbeddingsFalsos(), ids=[f"c{i}" for i in range(120)],
+                                     tipo=tipo, quantizacao=quantizacao)
+
+
+@pytest.mark.parametrize("perguntas", [[""], ["   "], ["", "\n"], []])
+def test_pergunta_em_branco_nao_busca(vectorstore, perguntas):
+    assert recuperar_multiplas(vectorstore, EmbeddingsFalsos(), perguntas, k=5) == []
+
+
+def test_linhas_em_branco_da_expansao_sao_ignoradas(vectorstore):
+    candidatos = recuperar_multiplas(vectorstore, EmbeddingsFalsos(), ["trecho número 7 do informe", " "], k=5)
+    assert candidatos and candidatos[0][1].page_content == "trecho número 7 do informe"
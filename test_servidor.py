@@ -0,0 +1,55 @@
+# Testes do POST /consulta contra um pipeline falso, sem índice nem LLM.
+import json
+import asyncio
+import pytest
+from servidor import ServidorRAG
+
+
+class PipelineFalso:
+    """Guarda as perguntas recebidas e responde com um texto fixo."""
+
+    indice_metadados = None
+
+    def __init__(self):
+        self.perguntas = []
+
+    async def responder(self, pergunta: str, filtro: dict | None = None):
+        self.perguntas.append(pergunta)
+        yield "resposta"
+
+
+async def _postar(servidor: ServidorRAG, corpo: bytes) -> tuple[int, dict]:
+    http = await asyncio.start_server(servidor.tratar, "127.0.0.1", 0)
+    porta = http.sockets[0].getsockname()[1]
+    async with http:
+        leitor, escritor = await asyncio.open_connection("127.0.0.1", porta)
+        escritor.write(b"POST /consulta HTTP/1.1\r\nHost: teste\r\n"
+                       + f"Content-Length: {len(corpo)}\r\n\r\n".encode("latin-1") + corpo)
+        await escritor.drain()
+        dados = await leitor.read()
+        escritor.close()
+    cabecalho, _, resposta = dados.partition(b"\r\n\r\n")
+    return int(cabecalho.split(b" ")[1]), json.loads(resposta)
+
+
+@pytest.mark.parametrize("corpo", [
+    {"pergunta": ""},
+    {"pergunta": "   \n"},
+    {"pergunta": None},
+    {"pergunta": 42},
+    {"pergunta": ["qual a receita?"]},
+    {"filtro": {"ano": 2024}},
+    ["qual a receita?"],
+])
+def test_pergunta_invalida_responde_400(corpo):
+    pipeline = PipelineFalso()
+    status, resposta = asyncio.run(_postar(ServidorRAG(pipeline), json.dumps(corpo).encode()))
+    assert status == 400 and "pergunta" in resposta["erro"]
+    assert pipeline.perguntas == []
+
+
+def test_pergunta_valida_chega_ao_pipeline_sem_espacos():
+    pipeline = PipelineFalso()
+    status, resposta = asyncio.run(_postar(ServidorRAG(pipeline), json.dumps({"pergunta": "  qual a receita? "}).encode()))
+    assert status == 200 and resposta["resposta"] == "resposta"
+    assert pipeline.perguntas == ["qual a receita?"]